@@ -0,0 +1,330 @@
+"""
+Benchmark de um cluster com N nós no mesmo processo
+
+Sobe N nós com src.cluster.create_cluster, ligados em memória (sem
+sockets) por um transporte que simula latência e falhas, e mede:
+  - multicast: vazão, percentis de latência até a entrega em todos os nós e
+    requisições por nó (--dissemination direct|tree)
+  - eleição Bully: tempo de convergência após derrubar o coordenador
+  - exclusão mútua: espera por request_access até entrar na região crítica
+    e chamadas feitas com o cluster ocioso (--mutex-mode demand|ring)
+  - memória por nó (tracemalloc)
+
+Uso:
+    python -m bench.cluster_bench --nodes 3,5,9 --sizes 64,1024 --messages 500
+    python -m bench.cluster_bench --nodes 3 --output results.jsonl
+
+Cada combinação (N, tamanho) gera uma linha JSON em --output (ou stdout).
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from src.cluster import LoopbackTransport, create_cluster
+from src.config import NodeConfig
+from src.dissemination import DEFAULT_FANOUT
+from src.logs import setup_logging
+from src.node import Node
+from src.stream import DeliveryStream
+from src.transport import PeerError
+
+# Janela (segundos) em que se conta o tráfego do mutex após o último pedido
+IDLE_WINDOW = 0.05
+
+
+class LocalNetwork:
+    """Rede simulada entre os nós: latência, nós fora do ar e contagem de chamadas"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.nodes: List[Node] = []
+        self.down: set = set()
+        self.calls: Counter = Counter()
+        self.sent: Counter = Counter()
+
+
+class BenchTransport(LoopbackTransport):
+    """LoopbackTransport de src.cluster passando pela LocalNetwork"""
+
+    def __init__(self, network: LocalNetwork, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.network = network
+
+    async def post(self, peer_id: int, path: str, payload: Optional[Dict[str, Any]] = None,
+                   timeout: Optional[float] = None, content: Optional[bytes] = None,
+                   content_type: Optional[str] = None,
+                   headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        network = self.network
+        network.calls[path] += 1
+        network.sent[self.process_id] += 1
+        if network.latency:
+            await asyncio.sleep(network.latency)
+        if self.process_id in network.down or peer_id in network.down:
+            raise PeerError(f"Processo {peer_id} indisponível")
+        return await super().post(peer_id, path, payload, timeout, content, content_type, headers)
+
+
+@contextlib.asynccontextmanager
+async def running_cluster(n: int, latency: float, wire_format: str,
+                          mutex_mode: str = 'demand', wal_dir: Optional[str] = None,
+                          dissemination: str = 'direct', fanout: int = DEFAULT_FANOUT):
+    """N nós de src.cluster.create_cluster ligados pela mesma LocalNetwork
+
+    Sem detector de falhas, anti-entropia nem monitor do event loop, para
+    medir só o caminho de cada operação. Com `wal_dir`, cada nó grava o WAL
+    em um diretório novo dentro dele."""
+    network = LocalNetwork(latency)
+    if wal_dir:
+        os.makedirs(wal_dir, exist_ok=True)
+    base = NodeConfig(
+        total_processes=n, wire_format=wire_format, mutex_mode=mutex_mode,
+        wal_dir=tempfile.mkdtemp(prefix='bench-', dir=wal_dir) if wal_dir else None,
+        dissemination_mode=dissemination, dissemination_fanout=fanout,
+        failure_detector=False, sync_interval_ms=0, loop_monitor=False
+    )
+    apps = create_cluster(base, transport_factory=functools.partial(BenchTransport, network))
+    network.nodes = [apps[pid].state.node for pid in range(n)]
+    for node in network.nodes:
+        # Região crítica instantânea: mede só a espera pelo token
+        node.mutex.critical_section_duration = 0.0
+        await node.start()
+    try:
+        yield network
+    finally:
+        for node in network.nodes:
+            await node.stop()
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/max em milissegundos"""
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": pick(1.0)}
+
+
+async def bench_multicast(network: LocalNetwork, messages: int, size: int,
+                          concurrency: int) -> Dict[str, Any]:
+    """Envia `messages` mensagens de nós aleatórios e mede até a entrega em todos os nós"""
+    nodes = network.nodes
+    sent_at: Dict[str, float] = {}
+    remaining: Dict[str, int] = {}
+    latencies: List[float] = []
+    done = asyncio.Event()
+
+    async def consume(node):
+        node.multicast.stream = DeliveryStream(queue_size=messages + 1)
+        sub, _ = node.multicast.subscribe(None)
+        while True:
+            item = await sub.queue.get()
+            _, msg = item
+            remaining[msg.id] = remaining.get(msg.id, len(nodes)) - 1
+            if remaining[msg.id] == 0:
+                latencies.append(time.perf_counter() - sent_at[msg.id])
+                if len(latencies) == messages:
+                    done.set()
+
+    consumers = [asyncio.create_task(consume(node)) for node in nodes]
+    await asyncio.sleep(0)
+
+    payload = 'x' * size
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_one():
+        async with semaphore:
+            node = random.choice(nodes)
+            start = time.perf_counter()
+            msg = await node.multicast.send_message(payload)
+            sent_at[msg.id] = start
+
+    calls_before = sum(network.calls.values())
+    sent_before = Counter(network.sent)
+    start = time.perf_counter()
+    await asyncio.gather(*(send_one() for _ in range(messages)))
+    await asyncio.wait_for(done.wait(), timeout=60)
+    elapsed = time.perf_counter() - start
+
+    for task in consumers:
+        task.cancel()
+    return {
+        "messages": messages,
+        "throughput_msgs_per_s": round(messages / elapsed, 1),
+        "delivery_latency_ms": percentiles(latencies),
+        "requests_per_message": round((sum(network.calls.values()) - calls_before) / messages, 3),
+        # Maior número de requisições feitas por um único nó (custo de envio por nó)
+        "max_node_requests_per_message": round(
+            max((network.sent - sent_before).values(), default=0) / messages, 3),
+    }
+
+
+async def _wait_until(predicate, timeout: float = 30.0, interval: float = 0.0005) -> float:
+    start = time.perf_counter()
+    while not predicate():
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError("condição não atingida")
+        await asyncio.sleep(interval)
+    return time.perf_counter() - start
+
+
+async def bench_election(network: LocalNetwork) -> Dict[str, Any]:
+    """Elege o maior ID, derruba-o e mede a convergência a partir do processo 0"""
+    nodes = network.nodes
+    if len(nodes) < 2:
+        return {"convergence_ms": None}
+    top = len(nodes) - 1
+    await nodes[0].election.start_election()
+    await _wait_until(lambda: all(n.election.coordinator_id == top for n in nodes))
+
+    network.down.add(top)
+    alive = [n for n in nodes if n.config.process_id != top]
+    expected = top - 1
+    calls_before = sum(network.calls.values())
+    start = time.perf_counter()
+    await nodes[0].election.start_election()
+    await _wait_until(lambda: all(
+        n.election.coordinator_id == expected and not n.election.is_in_election for n in alive
+    ))
+    elapsed = time.perf_counter() - start
+    # Deixa terminar eleições atrasadas antes de contar as mensagens
+    await asyncio.sleep(1.0)
+    network.down.discard(top)
+    return {
+        "convergence_ms": round(elapsed * 1000, 3),
+        "messages": sum(network.calls.values()) - calls_before,
+    }
+
+
+async def bench_mutex(network: LocalNetwork, requests: int) -> Dict[str, Any]:
+    """Mede a espera de request_access até entrar na região crítica"""
+    nodes = network.nodes
+    if nodes[0].mutex.mode == 'ring':
+        # O token começa parado no processo 0; libera para ele circular
+        await nodes[0].mutex.release_access()
+    waits: List[float] = []
+    calls_before = sum(network.calls.values())
+    for _ in range(requests):
+        node = random.choice(nodes)
+        entered = node.mutex.critical_section_counter
+        start = time.perf_counter()
+        await node.mutex.request_access()
+        await _wait_until(lambda: node.mutex.critical_section_counter > entered)
+        waits.append(time.perf_counter() - start)
+    token_calls = sum(network.calls.values()) - calls_before
+    # Tráfego com o cluster ocioso (no modo 'demand' deve ser zero)
+    await asyncio.sleep(IDLE_WINDOW)
+    idle_calls = sum(network.calls.values()) - calls_before - token_calls
+    # Interrompe a circulação do token antes da próxima medição
+    network.down.update(n.config.process_id for n in nodes)
+    await asyncio.sleep(0.01)
+    return {
+        "requests": requests,
+        "wait_ms": percentiles(waits),
+        "token_passes": token_calls,
+        "idle_calls": idle_calls,
+    }
+
+
+async def measure_memory(n: int, messages: int, size: int, wire_format: str) -> Dict[str, Any]:
+    """Memória alocada por nó após um envio de `messages` mensagens"""
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        async with running_cluster(n, 0.0, wire_format) as network:
+            idle, _ = tracemalloc.get_traced_memory()
+            await bench_multicast(network, messages, size, concurrency=32)
+            loaded, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "idle_bytes_per_node": (idle - baseline) // n,
+        "loaded_bytes_per_node": (loaded - baseline) // n,
+        "peak_bytes_per_node": (peak - baseline) // n,
+    }
+
+
+async def run_case(args, n: int, size: int) -> Dict[str, Any]:
+    latency = args.latency_ms / 1000
+    result: Dict[str, Any] = {
+        "nodes": n,
+        "message_size": size,
+        "latency_ms": args.latency_ms,
+        "wire_format": args.wire_format,
+        "mutex_mode": args.mutex_mode,
+        "wal": bool(args.wal_dir),
+        "dissemination": args.dissemination,
+    }
+    spread = {'dissemination': args.dissemination, 'fanout': args.fanout}
+    async with running_cluster(n, latency, args.wire_format, wal_dir=args.wal_dir, **spread) as network:
+        result["multicast"] = await bench_multicast(network, args.messages, size, args.concurrency)
+    if not args.skip_election:
+        async with running_cluster(n, latency, args.wire_format, **spread) as network:
+            result["election"] = await bench_election(network)
+    if not args.skip_mutex:
+        async with running_cluster(n, latency, args.wire_format, args.mutex_mode) as network:
+            result["mutex"] = await bench_mutex(network, args.mutex_requests)
+    if not args.skip_memory:
+        result["memory"] = await measure_memory(n, args.messages, size, args.wire_format)
+    return result
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--nodes', type=_int_list, default=[3], help="lista de N (ex.: 3,5,9)")
+    parser.add_argument('--sizes', type=_int_list, default=[64], help="tamanhos de mensagem em bytes")
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--mutex-requests', type=int, default=50)
+    parser.add_argument('--mutex-mode', choices=['demand', 'ring'], default='demand')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="latência simulada por chamada")
+    parser.add_argument('--wire-format', choices=['json', 'binary'], default='json')
+    parser.add_argument('--dissemination', choices=['direct', 'tree'], default='direct')
+    parser.add_argument('--fanout', type=int, default=DEFAULT_FANOUT, help="filhos por nó no modo tree")
+    parser.add_argument('--wal-dir', help="grava o WAL do multicast neste diretório (mede o custo do fsync)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="arquivo JSON lines (padrão: stdout)")
+    parser.add_argument('--skip-election', action='store_true')
+    parser.add_argument('--skip-mutex', action='store_true')
+    parser.add_argument('--skip-memory', action='store_true')
+    return parser.parse_args(argv)
+
+
+async def main(argv=None) -> None:
+    args = parse_args(argv)
+    random.seed(args.seed)
+    # Só avisos e erros dos serviços, no stderr: o stdout fica com os resultados
+    setup_logging(level='WARNING', stream=sys.stderr)
+    out = open(args.output, 'a') if args.output else sys.stdout
+    try:
+        for n in args.nodes:
+            for size in args.sizes:
+                result = await run_case(args, n, size)
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+                mc = result["multicast"]
+                print(f"N={n} size={size}: {mc['throughput_msgs_per_s']} msg/s, "
+                      f"p99={mc['delivery_latency_ms']['p99']} ms", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,609 @@
+"""
+API FastAPI de um nó: modelos, endpoints e a fábrica create_app
+Cada chamada de create_app monta um nó isolado (serviços, núcleo e rotas), então
+vários nós podem rodar no mesmo processo (src/cluster.py).
+"""
+import asyncio
+import json
+import math
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Literal, Optional
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+
+# Importa o serviço de multicast
+from .models import DeliveryOrder
+from .multicast import MulticastService, SendSeqUnknown
+from .config import NodeConfig
+from .core import CoreClient, CoreUnavailable
+from .locks import LockUnavailable
+from .metrics import HttpMetricsMiddleware, Metrics
+from .node import Node
+from .outbox import LINK_HEADER, Backpressure, parse_link
+from .profiling import (DEFAULT_PROFILE_INTERVAL, MAX_PROFILE_SECONDS, ProfilerBusy,
+                        acquire_loop_monitor, release_loop_monitor)
+from .stream import Subscription, TooManySubscribers, event_id, parse_position
+from .sync import MAX_PULL
+from .transport import PeerTransport
+from .wal import WALError
+from . import wire
+
+# Intervalo (segundos) dos comentários keep-alive em /multicast/stream
+STREAM_KEEPALIVE = 15.0
+# Máximo de mensagens por chamada de /multicast/send-batch
+MAX_SEND_BATCH = 1000
+
+# Rotas da API; create_app as registra em cada app (um app por nó)
+router = APIRouter()
+
+
+def _core(request: Request):
+    """Núcleo do nó que atende o pedido (CoordinationCore ou CoreClient)"""
+    return request.app.state.core
+
+
+def _config(request: Request) -> NodeConfig:
+    return request.app.state.config
+
+
+def create_app(config: NodeConfig, transport: Optional[PeerTransport] = None,
+               metrics: Optional[Metrics] = None) -> FastAPI:
+    """Monta um nó isolado: serviços, núcleo e a API FastAPI
+
+    Nos papéis 'single' e 'core' o app é dono dos serviços (`app.state.node`);
+    no papel 'worker' encaminha as operações ao núcleo pelo socket Unix.
+    `transport` substitui o PeerTransport HTTP (ex.: loopback em src/cluster.py)
+    e deve usar o mesmo `metrics`."""
+    metrics = metrics or Metrics()
+    node = core = None
+    if config.role in ('single', 'core'):
+        node = Node(config, metrics, transport)
+        core = node.core
+    elif config.role == 'worker':
+        # Worker HTTP: valida os pedidos e encaminha as operações ao núcleo
+        core = CoreClient(config.core_socket)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        """Inicia o detector de falhas e a anti-entropia (ou conecta ao núcleo) e fecha tudo ao encerrar"""
+        if config.role == 'worker':
+            await core.connect()
+            if config.loop_monitor:
+                # Travamentos deste worker vão para o log; /debug/loop mostra os do núcleo
+                acquire_loop_monitor(config.process_id, metrics,
+                                     threshold=config.loop_stall_threshold_ms / 1000)
+            yield
+            await release_loop_monitor(metrics)
+            await core.close()
+            return
+        if node is not None:
+            await node.start()
+        yield
+        if node is not None:
+            await node.stop()
+
+    app = FastAPI(
+        title="Multicast API - Distributed Coordination",
+        description="API REST para Multicast, Exclusão Mútua e Eleição de Líder",
+        lifespan=lifespan,
+    )
+    app.state.config = config
+    app.state.metrics = metrics
+    app.state.node = node
+    app.state.core = core
+
+    # CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Latência por endpoint
+    app.add_middleware(HttpMetricsMiddleware, metrics=metrics)
+    # Worker sem o núcleo (socket caiu): qualquer rota responde 503, não 500
+    app.add_exception_handler(CoreUnavailable, _core_unavailable)
+    app.include_router(router)
+    return app
+
+
+async def _core_unavailable(request: Request, error: CoreUnavailable) -> JSONResponse:
+    return JSONResponse(status_code=503, content={"detail": str(error)})
+
+
+# ==================== MODELOS PYDANTIC ====================
+
+class SendMessageRequest(BaseModel):
+    content: str
+    # Ordem de entrega; sem ela vale MULTICAST_DEFAULT_ORDER
+    order: Optional[DeliveryOrder] = None
+
+class SendBatchRequest(BaseModel):
+    contents: List[str] = Field(min_length=1, max_length=MAX_SEND_BATCH)
+    order: Optional[DeliveryOrder] = None
+
+class MessageRequest(BaseModel):
+    id_processo: int
+    timestamp: int
+    conteudo: str
+    message_id: str
+    seq: int = 0
+    order: DeliveryOrder = 'total'
+    # Relógio vetorial do remetente ('causal'/'fifo')
+    vclock: Optional[List[int]] = None
+    # [sequenciador, mandato, gseq, base] ('sequencer'; ausente = ainda sem número)
+    sequence: Optional[List[int]] = None
+
+class AckRequest(BaseModel):
+    message_id: str
+    process_id: int
+    timestamp: int
+    # Bitmask de ACKs agrupados (difusão em árvore)
+    acks: Optional[int] = None
+
+class MessageBatchRequest(BaseModel):
+    messages: List[MessageRequest]
+
+class AckBatchRequest(BaseModel):
+    acks: List[AckRequest]
+
+class ElectionRequest(BaseModel):
+    sender_id: int
+    epoch: int = 0
+
+class HeartbeatRequest(BaseModel):
+    sender_id: int
+    epoch: int = 0
+
+class CoordinatorRequest(BaseModel):
+    coordinator_id: int
+    epoch: int = 0
+    relay: bool = True
+
+class TokenRequest(BaseModel):
+    from_process: int
+    # Modo 'demand': último pedido atendido de cada processo e fila de espera
+    last_served: Optional[List[int]] = None
+    queue: Optional[List[int]] = None
+
+class MutexRequestRequest(BaseModel):
+    process_id: int
+    seq: int
+
+class DelayAckRequest(BaseModel):
+    message_id: str
+
+class SyncSummaryRequest(BaseModel):
+    process_id: int
+    senders: Dict[str, Dict[str, Any]]
+
+class SyncPullRequest(BaseModel):
+    ranges: Dict[str, List[List[int]]]
+    limit: int = MAX_PULL
+
+class SequencerSyncRequest(BaseModel):
+    term: int
+    sequencer: int
+    since: int = 0
+
+class LockAcquireRequest(BaseModel):
+    owner: str
+    lease_ms: Optional[int] = None
+    # Espera máxima pela concessão (0 = só tenta)
+    timeout_ms: int = 10000
+    forwarded: bool = False
+
+class LockReleaseRequest(BaseModel):
+    fencing_token: int
+    forwarded: bool = False
+
+LogLevel = Literal['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+
+class LoggingRequest(BaseModel):
+    level: Optional[LogLevel] = None
+    # Nível por componente (election, mutex, multicast, locks, sync, outbox, core)
+    levels: Optional[Dict[str, LogLevel]] = None
+    # Por evento: fração registrada (0..1) e máximo por segundo; substituem os atuais
+    sample: Optional[Dict[str, float]] = None
+    rate_limit: Optional[Dict[str, float]] = None
+
+
+# ==================== ENDPOINTS ====================
+
+@router.get("/")
+def read_root(config: NodeConfig = Depends(_config)):
+    """Informações básicas do processo"""
+    return {
+        "processId": config.process_id,
+        "totalProcesses": config.total_processes,
+        "port": config.port,
+        "environment": "kubernetes" if config.kubernetes else "local",
+        "message": f"Process {config.process_id} is running"
+    }
+
+@router.get("/health")
+def health_check(config: NodeConfig = Depends(_config)):
+    """Health check para Kubernetes"""
+    return {"status": "healthy", "processId": config.process_id}
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request, core=Depends(_core)):
+    """Métricas no formato texto do Prometheus"""
+    metrics = request.app.state.metrics
+    if request.app.state.config.role == 'worker':
+        # Estado no núcleo; latência HTTP medida por este worker
+        text = await core.call('metrics.render', skip=[metrics.http_request_duration.name])
+        text = '\n'.join(metrics.http_request_duration.render()) + '\n' + text
+    else:
+        text = metrics.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+
+# ==================== MULTICAST ENDPOINTS ====================
+
+@router.post("/multicast/send")
+async def send_message(request: SendMessageRequest, response: Response, core=Depends(_core)):
+    """Envia mensagem via multicast
+
+    `order` escolhe a entrega: 'total' (mesma ordem em todos, espera os ACKs),
+    'causal' ou 'fifo' (sem ACKs, entregues assim que as dependências chegam)
+    ou 'sequencer' (mesma ordem em todos, numerada pelo coordenador, sem ACKs).
+    X-Queue-Depth informa a maior fila de saída entre os peers; com alguma
+    fila cheia, responde 429 com Retry-After. Se o WAL não conseguir gravar,
+    responde 503: a mensagem não está confirmada. Também 503 no primeiro
+    envio após um reinício sem estado se nenhum peer informar a sequência
+    de envio. Conteúdo que não é UTF-8 válido é recusado com 422."""
+    try:
+        result = await core.call('multicast.send', content=request.content, order=request.order)
+    except Backpressure as e:
+        return _backpressure_response(e)
+    except (WALError, SendSeqUnknown) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    response.headers["X-Queue-Depth"] = str(result["queueDepth"])
+    return result["message"]
+
+@router.post("/multicast/send-batch")
+async def send_message_batch(request: SendBatchRequest, response: Response, core=Depends(_core)):
+    """Envia várias mensagens de uma vez (até MAX_SEND_BATCH)
+
+    Recebem timestamps contíguos (firstTimestamp..lastTimestamp, na ordem
+    de `contents`) e seguem para cada peer em um único lote. Responde com
+    os ids atribuídos; 429 e 503 como em /multicast/send."""
+    try:
+        result = await core.call('multicast.send_batch', contents=request.contents,
+                                 order=request.order)
+    except Backpressure as e:
+        return _backpressure_response(e)
+    except (WALError, SendSeqUnknown) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    response.headers["X-Queue-Depth"] = str(result.pop("queueDepth"))
+    return result
+
+def _backpressure_response(e: Backpressure) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(e), "peer": e.peer_id, "queueDepth": e.depth},
+        headers={"Retry-After": str(math.ceil(e.retry_after)), "X-Queue-Depth": str(e.depth)}
+    )
+
+@router.post("/msg")
+async def receive_message(request: MessageRequest, core=Depends(_core)):
+    """Q1 - Endpoint /msg para receber mensagem de outro processo"""
+    try:
+        await core.call('multicast.receive', data=request.dict())
+    except WALError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"status": "received"}
+
+@router.post("/ack")
+async def receive_ack(request: AckRequest, core=Depends(_core)):
+    """Q1 - Endpoint /ack para receber ACK de outro processo"""
+    try:
+        await core.call('multicast.ack', data=request.dict())
+    except WALError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"status": "ack_received"}
+
+async def _read_batch(request: Request, model, key: str, decode) -> List[dict]:
+    """Lê o corpo de um lote em JSON (padrão) ou no formato binário de src/wire.py"""
+    body = await request.body()
+    if request.headers.get('content-type', '').startswith(wire.CONTENT_TYPE):
+        try:
+            return decode(body)
+        except wire.WireError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        parsed = model.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    return [item.dict() for item in getattr(parsed, key)]
+
+def _read_link(request: Request) -> Optional[list]:
+    """Sequência do lote no link do remetente (ausente em remetentes antigos)"""
+    value = request.headers.get(LINK_HEADER)
+    if value is None:
+        return None
+    try:
+        return list(parse_link(value))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/msg/batch")
+async def receive_message_batch(request: Request, core=Depends(_core)):
+    """Recebe um lote de mensagens de outro processo (JSON ou binário)
+
+    Com o buffer do WAL cheio responde 503 sem aplicar nada; o remetente reenvia."""
+    messages = await _read_batch(request, MessageBatchRequest, 'messages', wire.decode_messages)
+    try:
+        await core.call('multicast.receive_batch', messages=messages, link=_read_link(request))
+    except WALError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"status": "received", "count": len(messages)}
+
+@router.post("/ack/batch")
+async def receive_ack_batch(request: Request, core=Depends(_core)):
+    """Recebe um lote de ACKs de outro processo (JSON ou binário)"""
+    acks = await _read_batch(request, AckBatchRequest, 'acks', wire.decode_acks)
+    try:
+        await core.call('multicast.ack_batch', acks=acks, link=_read_link(request))
+    except WALError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"status": "ack_received", "count": len(acks)}
+
+@router.post("/multicast/delay-ack")
+async def set_delay_ack(request: DelayAckRequest, core=Depends(_core)):
+    """Define uma mensagem para atrasar o ACK (teste)"""
+    await core.call('multicast.delay_ack', message_id=request.message_id)
+    return {"status": "delay_set", "message_id": request.message_id}
+
+@router.post("/sync/summary")
+async def receive_sync_summary(request: SyncSummaryRequest, core=Depends(_core)):
+    """Anti-entropia: troca de resumos (o que cada processo já viu de cada remetente)"""
+    return await core.call('sync.summary', process_id=request.process_id, senders=request.senders)
+
+@router.post("/sync/pull")
+async def serve_sync_pull(request: SyncPullRequest, core=Depends(_core)):
+    """Anti-entropia: mensagens retidas nos intervalos pedidos, com os ACKs"""
+    return await core.call('sync.pull', ranges=request.ranges, limit=request.limit)
+
+@router.post("/sequencer/sync")
+async def sequencer_sync(request: SequencerSyncRequest, core=Depends(_core)):
+    """Ordem 'sequencer': novo coordenador abre um mandato e recolhe o estado de cada processo"""
+    return await core.call('sequencer.sync', term=request.term, sequencer=request.sequencer,
+                           since=request.since)
+
+@router.get("/multicast/status")
+async def get_multicast_status(core=Depends(_core)):
+    """Retorna o status do serviço de multicast"""
+    return await core.call('multicast.status')
+
+@router.get("/multicast/queue")
+async def get_multicast_queue(
+    cursor: Optional[int] = Query(None, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    core=Depends(_core)
+):
+    """Retorna a fila de espera e uma página das mensagens entregues, em ordem total
+
+    Use `nextCursor` da resposta como `cursor` para ler a próxima página."""
+    return await core.call('multicast.queue', cursor=cursor, limit=limit)
+
+def _sse_message(process_id: int, seq: int, msg) -> str:
+    data = MulticastService.to_dict(msg)
+    data['seq'] = seq
+    return f"id: {event_id(process_id, seq)}\nevent: message\ndata: {json.dumps(data)}\n\n"
+
+async def _sse_events(core, process_id: int, sub: Subscription, backlog: list,
+                      reset: Optional[dict] = None):
+    """Gera os eventos SSE: primeiro o histórico pedido, depois as entregas ao vivo"""
+    last_id = None
+    try:
+        if reset is not None:
+            yield f"event: reset\ndata: {json.dumps(reset)}\n\n"
+        for seq, msg in backlog:
+            last_id = event_id(process_id, seq)
+            yield _sse_message(process_id, seq, msg)
+        while True:
+            try:
+                item = await asyncio.wait_for(sub.queue.get(), STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if item is None:
+                # Assinante lento: encerra e informa de onde retomar
+                yield f"event: lagged\ndata: {json.dumps({'resumeFrom': last_id})}\n\n"
+                return
+            seq, msg = item
+            if seq is None:
+                # Mensagens que a anti-entropia não achou em nenhum peer: nunca serão entregues
+                yield f"event: skipped\ndata: {json.dumps(msg)}\n\n"
+                continue
+            last_id = event_id(process_id, seq)
+            yield _sse_message(process_id, seq, msg)
+    finally:
+        core.unsubscribe(sub)
+
+@router.get("/multicast/stream")
+async def stream_deliveries(request: Request, since: Optional[str] = None, core=Depends(_core),
+                            config: NodeConfig = Depends(_config)):
+    """Envia cada mensagem entregue via Server-Sent Events
+
+    O id de cada evento é "processId:seq", a sequência de entrega (campo
+    `seq`) neste processo; `since` (ou o cabeçalho Last-Event-ID) retoma
+    depois dela, com as entregas ainda retidas. A sequência não vale em
+    outro processo (cada um entrega 'causal'/'fifo' na sua ordem): um id
+    de outro processo (reconexão que o balanceador mandou para outra
+    réplica) recomeça com um evento "reset" e todo o histórico retido, para
+    o cliente descartar pelo `id` da mensagem o que já viu."""
+    try:
+        position = parse_position(since or request.headers.get('last-event-id'))
+    except ValueError:
+        raise HTTPException(status_code=400,
+                            detail="since deve ser 'processId:seq' ou uma sequência de entrega")
+    reset = None
+    if position is not None and position[0] not in (None, config.process_id):
+        reset = {'processId': config.process_id, 'lastEventId': event_id(*position)}
+        # Todo o histórico retido (antes da sequência 0)
+        position = (config.process_id, -1)
+    try:
+        sub, backlog = await core.subscribe(position[1] if position is not None else None)
+    except TooManySubscribers:
+        raise HTTPException(status_code=503, detail="Limite de assinantes atingido")
+    return StreamingResponse(
+        _sse_events(core, config.process_id, sub, backlog, reset),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@router.post("/election/start")
+async def start_election(core=Depends(_core)):
+    """Inicia processo de eleição Bully"""
+    return await core.call('election.start')
+
+@router.post("/eleicao")
+async def receive_election(request: ElectionRequest, core=Depends(_core)):
+    """Q3 - Endpoint /eleicao para receber mensagem de eleição"""
+    should_respond_ok = await core.call('election.receive', sender_id=request.sender_id,
+                                        epoch=request.epoch)
+    return {"ok": should_respond_ok}
+
+@router.post("/coordenador")
+async def receive_coordinator(request: CoordinatorRequest, core=Depends(_core)):
+    """Q3 - Endpoint /coordenador para receber anúncio de coordenador"""
+    await core.call('election.coordinator', coordinator_id=request.coordinator_id,
+                    epoch=request.epoch, relay=request.relay)
+    return {"status": "coordinator_received"}
+
+@router.post("/heartbeat")
+async def receive_heartbeat(request: HeartbeatRequest, core=Depends(_core)):
+    """Responde aos heartbeats do detector de falhas"""
+    return await core.call('election.heartbeat', sender_id=request.sender_id, epoch=request.epoch)
+
+@router.get("/election/leader")
+async def get_election_leader(core=Depends(_core)):
+    """Coordenador atual pelo lease local (sem tráfego de rede)"""
+    return await core.call('election.leader')
+
+@router.get("/election/status")
+async def get_election_status(core=Depends(_core)):
+    """Retorna o status da eleição"""
+    return await core.call('election.status')
+
+
+# ==================== MUTEX ENDPOINTS ====================
+
+@router.post("/mutex/request-access")
+async def request_mutex_access(core=Depends(_core)):
+    """Q2 - Solicita acesso à seção crítica (token sob demanda ou Token Ring)"""
+    await core.call('mutex.request_access')
+    return {"status": "request_sent"}
+
+@router.post("/mutex/request")
+async def receive_mutex_request(request: MutexRequestRequest, core=Depends(_core)):
+    """Q2 - Recebe o pedido numerado de outro processo (modo 'demand')"""
+    await core.call('mutex.request', process_id=request.process_id, seq=request.seq)
+    return {"status": "request_received"}
+
+@router.post("/mutex/token")
+async def receive_token(request: TokenRequest, core=Depends(_core)):
+    """Q2 - Recebe o token de outro processo"""
+    await core.call('mutex.token', data=request.dict())
+    return {"status": "token_received"}
+
+@router.post("/mutex/release")
+async def release_mutex(core=Depends(_core)):
+    """Libera a seção crítica"""
+    await core.call('mutex.release')
+    return {"status": "released"}
+
+@router.get("/mutex/status")
+async def get_mutex_status(core=Depends(_core)):
+    """Retorna o status do mutex"""
+    return await core.call('mutex.status')
+
+
+# ==================== LOCKS NOMEADOS ====================
+
+@router.post("/locks/{name}/acquire")
+async def acquire_lock(name: str, request: LockAcquireRequest, core=Depends(_core)):
+    """Adquire o lock `name` (long-poll até timeout_ms)
+
+    A resposta traz granted, fencingToken e a expiração do lease."""
+    try:
+        return await core.call('locks.acquire', name=name, owner=request.owner,
+                               lease_ms=request.lease_ms, timeout_ms=request.timeout_ms,
+                               forwarded=request.forwarded)
+    except LockUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.post("/locks/{name}/release")
+async def release_lock(name: str, request: LockReleaseRequest, core=Depends(_core)):
+    """Libera o lock `name` concedido com o fencing token informado"""
+    try:
+        return await core.call('locks.release', name=name, fencing_token=request.fencing_token,
+                               forwarded=request.forwarded)
+    except LockUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.get("/locks")
+async def get_locks(core=Depends(_core)):
+    """Locks concedidos e filas de espera neste processo (se for o coordenador)"""
+    return await core.call('locks.list')
+
+
+# ==================== LOGS ====================
+
+@router.get("/logging")
+async def get_logging(core=Depends(_core)):
+    """Níveis, amostragem, limites e descartes dos logs do processo"""
+    return await core.call('logging.status')
+
+@router.put("/logging")
+async def configure_logging(request: LoggingRequest, core=Depends(_core)):
+    """Muda níveis, amostragem e limites dos logs sem reiniciar"""
+    return await core.call('logging.configure', level=request.level, levels=request.levels,
+                           sample=request.sample, rate_limit=request.rate_limit)
+
+
+# ==================== DIAGNÓSTICO ====================
+
+def _debug_enabled(config: NodeConfig = Depends(_config)) -> None:
+    if not config.debug_endpoints:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@router.get("/debug/loop", dependencies=[Depends(_debug_enabled)])
+async def get_loop_status(core=Depends(_core)):
+    """Lag do event loop do núcleo e os últimos travamentos, com a pilha que os causou"""
+    status = await core.call('debug.loop')
+    if status is None:
+        raise HTTPException(status_code=404, detail="Monitor do event loop desligado (LOOP_MONITOR=0)")
+    return status
+
+@router.get("/debug/profile", response_class=PlainTextResponse,
+            dependencies=[Depends(_debug_enabled)])
+async def profile(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(DEFAULT_PROFILE_INTERVAL * 1000, ge=1, le=1000),
+    core=Depends(_core)
+):
+    """Amostra o event loop do núcleo por `seconds` e devolve as pilhas em formato collapsed
+
+    Cada linha é "raiz;...;folha contagem" (flamegraph.pl, speedscope, inferno).
+    Uma amostragem por vez: 409 se já houver outra em andamento."""
+    try:
+        result = await core.call('debug.profile', seconds=seconds, interval_ms=interval_ms)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(result['collapsed'], headers={
+        "X-Profile-Samples": str(result['samples']),
+        "X-Profile-Interval-Ms": str(result['intervalMs'])
+    })
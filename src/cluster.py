@@ -0,0 +1,261 @@
+"""
+Vários nós no mesmo processo, em um único event loop
+Cada nó é um app de create_app com estado próprio. As chamadas entre nós do
+mesmo processo vão direto ao núcleo do destino, em memória (sem sockets, HTTP
+nem JSON); só peers de fora do processo passam pelo PeerTransport. Cada nó
+continua escutando na sua porta para os clientes.
+
+Uso:
+    python -m src.cluster --nodes 5
+    python -m src.cluster --nodes 20 --base-port 4000 --host 127.0.0.1
+
+As demais configurações vêm das variáveis de ambiente de sempre (NodeConfig.from_env).
+"""
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import signal
+import time
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import unquote
+import uvicorn
+from fastapi import FastAPI
+
+from .app import create_app
+from .config import NodeConfig
+from .logs import setup_logging
+from .metrics import Metrics
+from .locks import LockUnavailable
+from .outbox import LINK_HEADER, Backpressure, parse_link
+from .sync import MAX_PULL
+from .transport import PeerError, PeerTransport
+from .wal import WALError
+from . import wire
+
+
+async def _msg_batch(core, payload, link):
+    await core.call('multicast.receive_batch', messages=payload['messages'], link=link)
+    return {"status": "received", "count": len(payload['messages'])}
+
+
+async def _ack_batch(core, payload, link):
+    await core.call('multicast.ack_batch', acks=payload['acks'], link=link)
+    return {"status": "ack_received", "count": len(payload['acks'])}
+
+
+async def _msg(core, payload, link):
+    await core.call('multicast.receive', data=payload)
+    return {"status": "received"}
+
+
+async def _ack(core, payload, link):
+    await core.call('multicast.ack', data=payload)
+    return {"status": "ack_received"}
+
+
+async def _election(core, payload, link):
+    ok = await core.call('election.receive', sender_id=payload['sender_id'],
+                         epoch=payload.get('epoch', 0))
+    return {"ok": ok}
+
+
+async def _coordinator(core, payload, link):
+    await core.call('election.coordinator', coordinator_id=payload['coordinator_id'],
+                    epoch=payload.get('epoch', 0), relay=payload.get('relay', True))
+    return {"status": "coordinator_received"}
+
+
+async def _heartbeat(core, payload, link):
+    return await core.call('election.heartbeat', sender_id=payload['sender_id'],
+                           epoch=payload.get('epoch', 0))
+
+
+async def _mutex_request(core, payload, link):
+    await core.call('mutex.request', process_id=payload['process_id'], seq=payload['seq'])
+    return {"status": "request_received"}
+
+
+async def _mutex_token(core, payload, link):
+    await core.call('mutex.token', data={'last_served': None, 'queue': None, **payload})
+    return {"status": "token_received"}
+
+
+async def _sync_summary(core, payload, link):
+    return await core.call('sync.summary', process_id=payload['process_id'],
+                           senders=payload['senders'])
+
+
+async def _sync_pull(core, payload, link):
+    return await core.call('sync.pull', ranges=payload['ranges'],
+                           limit=payload.get('limit', MAX_PULL))
+
+
+async def _sequencer_sync(core, payload, link):
+    return await core.call('sequencer.sync', term=payload['term'], sequencer=payload['sequencer'],
+                           since=payload.get('since', 0))
+
+
+# Endpoints entre processos, com a mesma resposta das rotas de src/app.py
+ROUTES = {
+    '/msg/batch': _msg_batch,
+    '/ack/batch': _ack_batch,
+    '/msg': _msg,
+    '/ack': _ack,
+    '/eleicao': _election,
+    '/coordenador': _coordinator,
+    '/heartbeat': _heartbeat,
+    '/mutex/request': _mutex_request,
+    '/mutex/token': _mutex_token,
+    '/sync/summary': _sync_summary,
+    '/sync/pull': _sync_pull,
+    '/sequencer/sync': _sequencer_sync,
+}
+
+# Decodificadores do formato binário, por endpoint
+BINARY_BODIES = {
+    '/msg/batch': lambda body: {'messages': wire.decode_messages(body)},
+    '/ack/batch': lambda body: {'acks': wire.decode_acks(body)},
+}
+
+
+async def _lock(core, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """/locks/{name}/acquire e /locks/{name}/release (encaminhados ao coordenador)"""
+    _, _, name, action = path.split('/')
+    name = unquote(name)
+    if action == 'acquire':
+        return await core.call('locks.acquire', name=name, owner=payload['owner'],
+                               lease_ms=payload.get('lease_ms'),
+                               timeout_ms=payload.get('timeout_ms', 10000),
+                               forwarded=payload.get('forwarded', False))
+    return await core.call('locks.release', name=name, fencing_token=payload['fencing_token'],
+                           forwarded=payload.get('forwarded', False))
+
+
+def _status(error: Exception) -> int:
+    """Status HTTP que a rota devolveria para o erro (ver PeerError.transient)"""
+    if isinstance(error, Backpressure):
+        return 429
+    if isinstance(error, (LockUnavailable, WALError)):
+        return 503
+    if isinstance(error, (KeyError, TypeError, ValueError)):
+        return 400
+    return 500
+
+
+class LoopbackTransport(PeerTransport):
+    """PeerTransport que entrega em memória as chamadas aos nós do mesmo processo
+
+    A chamada vai direto ao núcleo do destino (core.call), sem HTTP nem
+    serialização; só os peers que não estão em `apps` passam pelo HTTP.
+    Qualquer erro no destino vira PeerError, como um status >= 400."""
+
+    def __init__(self, peers: List[str], apps: Dict[int, FastAPI],
+                 metrics: Optional[Metrics] = None, process_id: Optional[int] = None):
+        super().__init__(peers, metrics=metrics)
+        self.apps = apps
+        # Nó dono do transporte (quem envia)
+        self.process_id = process_id
+
+    async def post(self, peer_id: int, path: str, payload: Optional[Dict[str, Any]] = None,
+                   timeout: Optional[float] = None, content: Optional[bytes] = None,
+                   content_type: Optional[str] = None,
+                   headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        app = self.apps.get(peer_id)
+        if app is None:
+            return await super().post(peer_id, path, payload, timeout, content,
+                                      content_type, headers)
+        rtt, errors = self._peer_series(peer_id, path)
+        start = time.perf_counter()
+        try:
+            if content is not None:
+                payload = BINARY_BODIES[path](content)
+            link = headers.get(LINK_HEADER) if headers else None
+            core = app.state.core
+            if path.startswith('/locks/'):
+                result = await _lock(core, path, payload)
+            else:
+                result = await ROUTES[path](core, payload,
+                                            list(parse_link(link)) if link else None)
+        except Exception as e:
+            errors.inc()
+            raise PeerError(f"{self.peers[peer_id]}{path}: {type(e).__name__} {e}", _status(e)) from e
+        rtt.observe(time.perf_counter() - start)
+        return result if result is not None else {}
+
+
+def create_cluster(base: NodeConfig, nodes: Optional[List[int]] = None,
+                   base_port: int = 3000,
+                   transport_factory: Callable[..., LoopbackTransport] = LoopbackTransport
+                   ) -> Dict[int, FastAPI]:
+    """Apps dos nós `nodes` (padrão: todos os base.total_processes) ligados por loopback
+
+    Os peers que não estão em `nodes` continuam nas URLs de base.peers.
+    `transport_factory` recebe os argumentos de LoopbackTransport (ex.: uma
+    subclasse que simula latência, como em bench/cluster_bench.py)."""
+    if nodes is None:
+        nodes = list(range(base.total_processes))
+    peers = list(base.peers)
+    for process_id in nodes:
+        peers[process_id] = f'http://localhost:{base_port + process_id}'
+    apps: Dict[int, FastAPI] = {}
+    for process_id in nodes:
+        config = dataclasses.replace(base, process_id=process_id, port=base_port + process_id,
+                                     peers=peers, core_socket=None, role='single', workers=1)
+        metrics = Metrics()
+        transport = transport_factory(peers, apps, metrics=metrics, process_id=process_id)
+        apps[process_id] = create_app(config, transport, metrics=metrics)
+    return apps
+
+
+class _ColocatedServer(uvicorn.Server):
+    """Servidor de um nó; os sinais são tratados uma vez só, por serve_cluster"""
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+
+async def serve_cluster(apps: Dict[int, FastAPI], host: str = '127.0.0.1',
+                        log_level: str = 'info') -> None:
+    """Serve todos os apps no event loop atual até SIGINT/SIGTERM"""
+    servers = [
+        _ColocatedServer(uvicorn.Config(app, host=host, port=app.state.config.port,
+                                        log_level=log_level))
+        for app in apps.values()
+    ]
+
+    def stop() -> None:
+        for server in servers:
+            server.should_exit = True
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop)
+    print(f"🧩 {len(apps)} nós no mesmo processo: portas "
+          f"{min(a.state.config.port for a in apps.values())}.."
+          f"{max(a.state.config.port for a in apps.values())}")
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Sobe vários nós no mesmo processo")
+    parser.add_argument('--nodes', type=int, default=None,
+                        help="quantidade de nós (padrão: TOTAL_PROCESSES)")
+    parser.add_argument('--base-port', type=int, default=3000,
+                        help="porta do nó 0; o nó i escuta em base-port + i")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args(argv)
+
+    base = NodeConfig.from_env()
+    setup_logging(base.log_format, base.log_level, base.log_queue_size,
+                  base.log_sample, base.log_rate_limit)
+    if args.nodes is not None:
+        base = dataclasses.replace(base, total_processes=args.nodes, peers=None)
+    apps = create_cluster(base, base_port=args.base_port)
+    asyncio.run(serve_cluster(apps, args.host, args.log_level))
+
+
+if __name__ == '__main__':
+    main()
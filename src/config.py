@@ -0,0 +1,146 @@
+"""
+Configuração de um nó
+Tudo que antes era lido do ambiente na importação de src/main.py fica em um
+NodeConfig, para que cada app (create_app) monte um nó isolado e vários nós
+possam rodar no mesmo processo.
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional
+from .dissemination import DEFAULT_FANOUT
+from .logs import DEFAULT_QUEUE_SIZE, parse_event_map
+
+NODE_ROLES = ('single', 'supervisor', 'core', 'worker')
+
+
+@dataclass
+class NodeConfig:
+    """Parâmetros de um nó; `from_env` lê as mesmas variáveis de ambiente de sempre"""
+    process_id: int = 0
+    total_processes: int = 3
+    port: Optional[int] = None
+    # URLs dos peers (padrão: DNS do StatefulSet no Kubernetes ou localhost:3000+i)
+    peers: Optional[List[str]] = None
+    kubernetes: bool = False
+
+    # Janela (ms) e tamanho máximo dos lotes de /msg e /ack enviados a cada peer
+    batch_window_ms: float = 5
+    batch_max_size: int = 100
+    # Lotes em voo por peer e limite da fila de saída de cada peer (acima dele: 429)
+    max_in_flight: int = 4
+    peer_queue_limit: int = 10000
+    # Quantidade de mensagens entregues mantidas em memória
+    history_size: int = 1000
+    # Ids de mensagens entregues (e ACKs antecipados) lembrados para descartar repetições
+    dedup_window: int = 10000
+    # WAL do multicast (desligado sem diretório); cada processo usa um subdiretório
+    wal_dir: Optional[str] = None
+    wal_commit_interval_ms: float = 2
+    wal_snapshot_every: int = 10000
+    # Bytes do WAL ainda não gravados a partir dos quais envios e lotes recebem 503
+    wal_max_buffer_bytes: int = 64 * 1024 * 1024
+    # Intervalo (ms) entre trocas de resumo da anti-entropia (0 desliga)
+    sync_interval_ms: float = 1000
+    # Detector de falhas do coordenador (heartbeats + phi-accrual)
+    failure_detector: bool = True
+    heartbeat_interval_ms: float = 200
+    phi_threshold: float = 8
+    # Ordem das mensagens enviadas sem `order`: 'total', 'causal', 'fifo' ou 'sequencer'
+    default_order: str = 'total'
+    # Ordem 'sequencer': intervalo (ms) de reenvio das mensagens ainda sem número
+    sequencer_resubmit_ms: float = 1000
+    # Codificação dos lotes enviados aos peers: 'json' ou 'binary'
+    wire_format: str = 'json'
+    # Circulação do token: 'demand' (Suzuki–Kasami) ou 'ring'
+    mutex_mode: str = 'demand'
+    # Lease (ms) padrão e máximo dos locks nomeados
+    lock_default_lease_ms: int = 5000
+    lock_max_lease_ms: int = 10000
+    # Difusão de mensagens, ACKs e anúncios: 'direct' ou 'tree'
+    dissemination_mode: str = 'direct'
+    dissemination_fanout: int = DEFAULT_FANOUT
+
+    # Workers HTTP por pod: com mais de 1, um processo núcleo guarda todo o estado
+    # e os workers (mesma porta) encaminham as operações a ele pelo socket core_socket
+    workers: int = 1
+    core_socket: Optional[str] = None
+    # 'single', 'supervisor' (python -m src.main com workers > 1), 'core' ou 'worker'
+    role: str = 'single'
+
+    # Monitor do event loop: lag (ms) a partir do qual um atraso conta como travamento
+    loop_monitor: bool = True
+    loop_stall_threshold_ms: float = 100
+    # /debug/loop e /debug/profile (expõem pilhas do processo: só com DEBUG_ENDPOINTS=1)
+    debug_endpoints: bool = False
+
+    # Logs (valem para o processo todo): nível, 'text' ou 'json', tamanho da fila
+    # de escrita e, por evento, fração amostrada e máximo por segundo
+    log_level: str = 'INFO'
+    log_format: str = 'text'
+    log_queue_size: int = DEFAULT_QUEUE_SIZE
+    log_sample: Dict[str, float] = field(default_factory=dict)
+    log_rate_limit: Dict[str, float] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if self.role not in NODE_ROLES:
+            raise ValueError(f"role deve ser um de {NODE_ROLES}")
+        if self.port is None:
+            self.port = 3000 + self.process_id
+        if self.core_socket is None:
+            self.core_socket = f'/tmp/multicast-core-{self.process_id}.sock'
+        if self.peers is None:
+            self.peers = self.default_peers()
+
+    def default_peers(self) -> List[str]:
+        if self.kubernetes:
+            # No Kubernetes: usa DNS interno
+            return [
+                f'http://multicast-api-{i}.multicast-api.default.svc.cluster.local:3000'
+                for i in range(self.total_processes)
+            ]
+        # Local: usa localhost com portas diferentes
+        return [f'http://localhost:{3000 + i}' for i in range(self.total_processes)]
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str] = os.environ) -> 'NodeConfig':
+        process_id = int(env.get('PROCESS_ID', '0'))
+        workers = int(env.get('WORKERS', '1'))
+        return cls(
+            process_id=process_id,
+            total_processes=int(env.get('TOTAL_PROCESSES', '3')),
+            port=int(env.get('PORT', 3000 + process_id)),
+            kubernetes=env.get('KUBERNETES_SERVICE_HOST') is not None,
+            batch_window_ms=float(env.get('MULTICAST_BATCH_WINDOW_MS', '5')),
+            batch_max_size=int(env.get('MULTICAST_BATCH_MAX_SIZE', '100')),
+            max_in_flight=int(env.get('MULTICAST_MAX_IN_FLIGHT', '4')),
+            peer_queue_limit=int(env.get('MULTICAST_PEER_QUEUE_LIMIT', '10000')),
+            history_size=int(env.get('MULTICAST_HISTORY_SIZE', '1000')),
+            dedup_window=int(env.get('MULTICAST_DEDUP_WINDOW', '10000')),
+            wal_dir=env.get('MULTICAST_WAL_DIR'),
+            wal_commit_interval_ms=float(env.get('MULTICAST_WAL_COMMIT_INTERVAL_MS', '2')),
+            wal_snapshot_every=int(env.get('MULTICAST_WAL_SNAPSHOT_EVERY', '10000')),
+            wal_max_buffer_bytes=int(env.get('MULTICAST_WAL_MAX_BUFFER_BYTES', str(64 * 1024 * 1024))),
+            sync_interval_ms=float(env.get('MULTICAST_SYNC_INTERVAL_MS', '1000')),
+            failure_detector=env.get('FAILURE_DETECTOR', '1') == '1',
+            heartbeat_interval_ms=float(env.get('ELECTION_HEARTBEAT_INTERVAL_MS', '200')),
+            phi_threshold=float(env.get('ELECTION_PHI_THRESHOLD', '8')),
+            default_order=env.get('MULTICAST_DEFAULT_ORDER', 'total'),
+            sequencer_resubmit_ms=float(env.get('SEQUENCER_RESUBMIT_MS', '1000')),
+            wire_format=env.get('MULTICAST_WIRE_FORMAT', 'json'),
+            mutex_mode=env.get('MUTEX_MODE', 'demand'),
+            lock_default_lease_ms=int(env.get('LOCK_DEFAULT_LEASE_MS', '5000')),
+            lock_max_lease_ms=int(env.get('LOCK_MAX_LEASE_MS', '10000')),
+            dissemination_mode=env.get('DISSEMINATION_MODE', 'direct'),
+            dissemination_fanout=int(env.get('DISSEMINATION_FANOUT', str(DEFAULT_FANOUT))),
+            workers=workers,
+            core_socket=env.get('CORE_SOCKET'),
+            role=env.get('NODE_ROLE', 'single' if workers <= 1 else 'supervisor'),
+            loop_monitor=env.get('LOOP_MONITOR', '1') == '1',
+            loop_stall_threshold_ms=float(env.get('LOOP_STALL_THRESHOLD_MS', '100')),
+            debug_endpoints=env.get('DEBUG_ENDPOINTS', '0') == '1',
+            log_level=env.get('LOG_LEVEL', 'INFO'),
+            log_format=env.get('LOG_FORMAT', 'text'),
+            log_queue_size=int(env.get('LOG_QUEUE_SIZE', str(DEFAULT_QUEUE_SIZE))),
+            log_sample=parse_event_map(env.get('LOG_SAMPLE')),
+            log_rate_limit=parse_event_map(env.get('LOG_RATE_LIMIT')),
+        )
@@ -0,0 +1,512 @@
+"""
+Núcleo de coordenação com um único escritor
+Relógio, filas, token e locks vivem em um só processo (o núcleo). Os
+endpoints HTTP não tocam nos serviços: chamam operações nomeadas com
+`core.call(op, ...)`. Com um processo só, a chamada é direta; com vários
+workers HTTP (WORKERS > 1), cada worker faz o parsing e a validação e
+encaminha a operação ao núcleo por um socket Unix local.
+
+Quadro do canal: tamanho (u32 big-endian) | JSON
+Pedido:   {"id", "op", "args"}       Resposta: {"id", "ok"} ou {"id", "error"}
+Eventos de /multicast/stream chegam como {"sub", "event"} (null = assinante lento).
+"""
+import asyncio
+import itertools
+import json
+import os
+import struct
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from .election import ElectionService
+from .locks import LockService, LockUnavailable
+from .logs import get_pipeline
+from .metrics import Metrics
+from .models import Message
+from .multicast import MulticastService, SendSeqUnknown
+from .mutex import MutexService
+from .outbox import Backpressure
+from .profiling import ProfilerBusy, get_loop_monitor, profile_loop
+from .stream import Subscription, TooManySubscribers
+from .sync import AntiEntropyService
+from .wal import WALError
+
+_LENGTH = struct.Struct('!I')
+# Maior quadro aceito no canal (um lote de sync/pull cabe com folga)
+MAX_FRAME = 64 * 1024 * 1024
+
+
+class CoreError(Exception):
+    """Falha inesperada de uma operação executada no núcleo"""
+
+
+class CoreUnavailable(CoreError):
+    """Conexão com o núcleo perdida (ou não aberta): o pedido não chegou a ser atendido"""
+
+
+def _election_status(election: ElectionService) -> Dict[str, Any]:
+    status = election.get_status()
+    return {
+        "processId": status.processId,
+        "coordinatorId": status.coordinatorId,
+        "isCoordinator": status.isCoordinator,
+        "electionInProgress": status.electionInProgress,
+        "electionEpoch": status.electionEpoch,
+        "lastElectionMessages": status.lastElectionMessages
+    }
+
+
+def _link(value: Optional[List[int]]) -> Optional[Tuple[int, int, int, int]]:
+    return tuple(value) if value is not None else None
+
+
+class CoordinationCore:
+    """Dono de todo o estado de coordenação do nó; executa as operações em ordem"""
+
+    def __init__(self, multicast: MulticastService, election: ElectionService,
+                 mutex: MutexService, locks: LockService, anti_entropy: AntiEntropyService,
+                 metrics: Metrics):
+        self.multicast = multicast
+        self.election = election
+        self.mutex = mutex
+        self.locks = locks
+        self.anti_entropy = anti_entropy
+        self.metrics = metrics
+        self._ops: Dict[str, Callable[..., Awaitable[Any]]] = {
+            name[4:].replace('__', '.'): getattr(self, name)
+            for name in dir(self) if name.startswith('_op_')
+        }
+
+    async def call(self, op: str, **args) -> Any:
+        handler = self._ops.get(op)
+        if handler is None:
+            raise CoreError(f"operação desconhecida: {op}")
+        return await handler(**args)
+
+    async def subscribe(self, since: Optional[int]) -> Tuple[Subscription, List[Tuple[int, Message]]]:
+        return self.multicast.subscribe(since)
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self.multicast.stream.unsubscribe(sub)
+
+    # ==================== MULTICAST ====================
+
+    async def _op_multicast__send(self, content: str, order: Optional[str] = None) -> Dict[str, Any]:
+        msg = await self.multicast.send_message(content, order)
+        return {
+            "message": {
+                "id": msg.id,
+                "processId": msg.processId,
+                "timestamp": msg.timestamp,
+                "content": msg.content,
+                "order": msg.order
+            },
+            "queueDepth": self.multicast.queue_depth()
+        }
+
+    async def _op_multicast__send_batch(self, contents: List[str],
+                                        order: Optional[str] = None) -> Dict[str, Any]:
+        messages = await self.multicast.send_messages(contents, order)
+        return {
+            "ids": [msg.id for msg in messages],
+            "processId": self.multicast.process_id,
+            "firstTimestamp": messages[0].timestamp,
+            "lastTimestamp": messages[-1].timestamp,
+            "order": messages[0].order,
+            "queueDepth": self.multicast.queue_depth()
+        }
+
+    async def _op_multicast__receive(self, data: Dict[str, Any]) -> None:
+        self.multicast.receive_message(data)
+
+    async def _op_multicast__ack(self, data: Dict[str, Any]) -> None:
+        self.multicast.receive_ack(data)
+
+    async def _op_multicast__receive_batch(self, messages: List[Dict[str, Any]],
+                                           link: Optional[List[int]] = None) -> None:
+        self.multicast.receive_message_batch(messages, _link(link))
+
+    async def _op_multicast__ack_batch(self, acks: List[Dict[str, Any]],
+                                       link: Optional[List[int]] = None) -> None:
+        self.multicast.receive_ack_batch(acks, _link(link))
+
+    async def _op_multicast__delay_ack(self, message_id: str) -> None:
+        self.multicast.set_delay_for_message(message_id)
+
+    async def _op_multicast__status(self) -> Dict[str, Any]:
+        status = self.multicast.get_status()
+        return {
+            "processId": status.processId,
+            "logicalClock": status.logicalClock,
+            "messageQueueSize": status.messageQueueSize,
+            "deliveredCount": status.deliveredCount,
+            "outboundQueueDepth": status.outboundQueueDepth,
+            "causalQueueSize": status.causalQueueSize,
+            "vectorClock": status.vectorClock,
+            "defaultOrder": status.defaultOrder,
+            "deliveredByOrder": status.deliveredByOrder,
+            "duplicatesDropped": status.duplicatesDropped,
+            "shedByPeer": status.shedByPeer,
+            "recoveredByOrder": status.recoveredByOrder,
+            "deliveredOutOfOrder": status.deliveredOutOfOrder,
+            "skippedBySender": status.skippedBySender,
+            "sequencer": status.sequencer
+        }
+
+    async def _op_multicast__queue(self, cursor: Optional[int], limit: int) -> Dict[str, Any]:
+        return {
+            "queue": self.multicast.get_queue(limit),
+            "causalQueue": self.multicast.get_causal_queue(limit),
+            "sequencerQueue": (self.multicast.sequencer.get_queue(limit)
+                               if self.multicast.sequencer is not None else []),
+            **self.multicast.get_delivered(cursor, limit)
+        }
+
+    async def _op_sync__summary(self, process_id: int, senders: Dict[str, Any]) -> Dict[str, Any]:
+        return self.anti_entropy.receive_summary(process_id, senders)
+
+    async def _op_sync__pull(self, ranges: Dict[str, List[List[int]]], limit: int) -> Dict[str, Any]:
+        return self.anti_entropy.serve_pull(ranges, limit)
+
+    async def _op_sequencer__sync(self, term: int, sequencer: int, since: int) -> Dict[str, Any]:
+        return self.multicast.sequencer.receive_sync(term, sequencer, since)
+
+    # ==================== ELEIÇÃO ====================
+
+    async def _op_election__start(self) -> Dict[str, Any]:
+        await self.election.start_election()
+        return _election_status(self.election)
+
+    async def _op_election__receive(self, sender_id: int, epoch: int) -> bool:
+        return self.election.receive_election(sender_id, epoch)
+
+    async def _op_election__coordinator(self, coordinator_id: int, epoch: int, relay: bool) -> None:
+        self.election.receive_coordinator(coordinator_id, epoch, relay)
+
+    async def _op_election__heartbeat(self, sender_id: int, epoch: int) -> Dict[str, Any]:
+        return self.election.receive_heartbeat(sender_id, epoch)
+
+    async def _op_election__leader(self) -> Dict[str, Any]:
+        return self.election.get_lease_info()
+
+    async def _op_election__status(self) -> Dict[str, Any]:
+        return _election_status(self.election)
+
+    # ==================== MUTEX E LOCKS ====================
+
+    async def _op_mutex__request_access(self) -> None:
+        await self.mutex.request_access()
+
+    async def _op_mutex__request(self, process_id: int, seq: int) -> None:
+        self.mutex.receive_request(process_id, seq)
+
+    async def _op_mutex__token(self, data: Dict[str, Any]) -> None:
+        self.mutex.receive_token(data)
+
+    async def _op_mutex__release(self) -> None:
+        await self.mutex.release_access()
+
+    async def _op_mutex__status(self) -> Dict[str, Any]:
+        status = self.mutex.get_status()
+        return {
+            "processId": status.processId,
+            "mode": self.mutex.mode,
+            "hasToken": self.mutex.has_token,
+            "inCriticalSection": status.inCriticalSection,
+            "wantsAccess": self.mutex.wants_access,
+            "queueSize": status.queueSize
+        }
+
+    async def _op_locks__acquire(self, name: str, owner: str, lease_ms: Optional[int],
+                                 timeout_ms: int, forwarded: bool) -> Dict[str, Any]:
+        return await self.locks.acquire(name, owner, lease_ms, timeout_ms, forwarded)
+
+    async def _op_locks__release(self, name: str, fencing_token: int, forwarded: bool) -> Dict[str, Any]:
+        return await self.locks.release_remote(name, fencing_token, forwarded)
+
+    async def _op_locks__list(self) -> Dict[str, Any]:
+        return self.locks.get_locks()
+
+    async def _op_metrics__render(self, skip: Tuple[str, ...] = ()) -> str:
+        return self.metrics.registry.render(skip)
+
+    # ==================== LOGS ====================
+
+    async def _op_logging__status(self) -> Dict[str, Any]:
+        return get_pipeline().status()
+
+    async def _op_logging__configure(self, level: Optional[str] = None,
+                                     levels: Optional[Dict[str, str]] = None,
+                                     sample: Optional[Dict[str, float]] = None,
+                                     rate_limit: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        return get_pipeline().configure(level, levels, sample, rate_limit)
+
+
+    # ==================== DIAGNÓSTICO ====================
+
+    async def _op_debug__loop(self) -> Optional[Dict[str, Any]]:
+        monitor = get_loop_monitor()
+        return monitor.status() if monitor is not None else None
+
+    async def _op_debug__profile(self, seconds: float, interval_ms: float) -> Dict[str, Any]:
+        return await profile_loop(seconds, interval_ms / 1000)
+
+
+# ==================== CANAL LOCAL ====================
+
+async def _read_frame(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    if length > MAX_FRAME:
+        raise CoreError(f"quadro de {length} bytes excede o limite")
+    return json.loads(await reader.readexactly(length))
+
+
+def _write_frame(writer: asyncio.StreamWriter, data: Dict[str, Any]) -> None:
+    body = json.dumps(data, separators=(',', ':')).encode()
+    writer.write(_LENGTH.pack(len(body)) + body)
+
+
+def _message_to_wire(msg: Message) -> Dict[str, Any]:
+    return {'id': msg.id, 'processId': msg.processId, 'timestamp': msg.timestamp,
+            'content': msg.content, 'acks': msg.acks, 'order': msg.order, 'vclock': msg.vclock,
+            'sequence': msg.sequence, 'recovered': msg.recovered, 'outOfOrder': msg.outOfOrder}
+
+
+def _message_from_wire(data: Dict[str, Any]) -> Message:
+    return Message(id=data['id'], processId=data['processId'], timestamp=data['timestamp'],
+                   content=data['content'], acks=data['acks'],
+                   order=data.get('order', 'total'), vclock=data.get('vclock'),
+                   sequence=data.get('sequence'), recovered=data.get('recovered', False),
+                   outOfOrder=data.get('outOfOrder', False))
+
+
+def _encode_error(error: Exception) -> Dict[str, Any]:
+    if isinstance(error, Backpressure):
+        return {'type': 'Backpressure', 'peer': error.peer_id, 'depth': error.depth,
+                'retryAfter': error.retry_after}
+    if isinstance(error, LockUnavailable):
+        return {'type': 'LockUnavailable', 'detail': str(error)}
+    if isinstance(error, TooManySubscribers):
+        return {'type': 'TooManySubscribers'}
+    if isinstance(error, ProfilerBusy):
+        return {'type': 'ProfilerBusy', 'detail': str(error)}
+    if isinstance(error, WALError):
+        return {'type': 'WALError', 'detail': str(error)}
+    if isinstance(error, SendSeqUnknown):
+        return {'type': 'SendSeqUnknown', 'detail': str(error)}
+    if isinstance(error, ValueError):
+        return {'type': 'ValueError', 'detail': str(error)}
+    return {'type': 'CoreError', 'detail': f"{type(error).__name__}: {error}"}
+
+
+def _decode_error(data: Dict[str, Any]) -> Exception:
+    kind = data.get('type')
+    if kind == 'Backpressure':
+        return Backpressure(data['peer'], data['depth'], data['retryAfter'])
+    if kind == 'LockUnavailable':
+        return LockUnavailable(data['detail'])
+    if kind == 'TooManySubscribers':
+        return TooManySubscribers()
+    if kind == 'ProfilerBusy':
+        return ProfilerBusy(data['detail'])
+    if kind == 'WALError':
+        return WALError(data['detail'])
+    if kind == 'SendSeqUnknown':
+        return SendSeqUnknown(data['detail'])
+    if kind == 'ValueError':
+        return ValueError(data['detail'])
+    return CoreError(data.get('detail', 'erro no núcleo'))
+
+
+class CoreServer:
+    """Atende os workers HTTP no socket Unix; cada pedido vira uma tarefa no loop do núcleo
+
+    As tarefas começam na ordem de chegada, então operações síncronas (a
+    maioria) são aplicadas na ordem em que o worker as enviou."""
+
+    def __init__(self, core: CoordinationCore, path: str):
+        self.core = core
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        subs: Dict[int, Tuple[Subscription, asyncio.Task]] = {}
+        tasks = set()
+        try:
+            while True:
+                try:
+                    request = await _read_frame(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                task = asyncio.create_task(self._execute(request, writer, subs))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+            for sub, pump in subs.values():
+                pump.cancel()
+                self.core.unsubscribe(sub)
+            writer.close()
+
+    async def _execute(self, request: Dict[str, Any], writer: asyncio.StreamWriter,
+                       subs: Dict[int, Tuple[Subscription, asyncio.Task]]) -> None:
+        request_id, op, args = request['id'], request['op'], request.get('args', {})
+        try:
+            if op == 'multicast.subscribe':
+                result = await self._subscribe(request_id, args.get('since'), writer, subs)
+            elif op == 'multicast.unsubscribe':
+                sub, pump = subs.pop(args['sub'], (None, None))
+                if sub is not None:
+                    pump.cancel()
+                    self.core.unsubscribe(sub)
+                result = None
+            else:
+                result = await self.core.call(op, **args)
+            response = {'id': request_id, 'ok': result}
+        except Exception as e:
+            response = {'id': request_id, 'error': _encode_error(e)}
+        _write_frame(writer, response)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _subscribe(self, sub_id: int, since: Optional[int], writer: asyncio.StreamWriter,
+                         subs: Dict[int, Tuple[Subscription, asyncio.Task]]) -> Dict[str, Any]:
+        sub, backlog = await self.core.subscribe(since)
+        subs[sub_id] = (sub, asyncio.create_task(self._pump(sub_id, sub, writer)))
+        return {'backlog': [[seq, _message_to_wire(msg)] for seq, msg in backlog]}
+
+    @staticmethod
+    async def _pump(sub_id: int, sub: Subscription, writer: asyncio.StreamWriter) -> None:
+        """Repassa ao worker as entregas de uma assinatura de /multicast/stream"""
+        while True:
+            item = await sub.queue.get()
+            # seq None: intervalo abandonado (dict), repassado como está
+            event = None if item is None else [item[0], item[1] if item[0] is None
+                                               else _message_to_wire(item[1])]
+            _write_frame(writer, {'sub': sub_id, 'event': event})
+            await writer.drain()
+            if item is None:
+                return
+
+
+class CoreClient:
+    """Lado do worker: mesma interface de CoordinationCore, executada no núcleo
+
+    Uma conexão por worker com pedidos em pipeline (casados pelo id)."""
+
+    def __init__(self, path: str, queue_size: int = 256):
+        self.path = path
+        self.queue_size = queue_size
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._subs: Dict[int, Subscription] = {}
+        self._sub_ids: Dict[Subscription, int] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+
+    async def connect(self, attempts: int = 50, delay: float = 0.1) -> None:
+        """Conecta ao núcleo, esperando ele subir"""
+        for attempt in range(attempts):
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+                break
+            except (FileNotFoundError, ConnectionError):
+                if attempt == attempts - 1:
+                    raise
+                await asyncio.sleep(delay)
+        self._reader_task = asyncio.create_task(self._read_loop(reader))
+
+    async def close(self) -> None:
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    async def call(self, op: str, **args) -> Any:
+        return await self._request(op, args)
+
+    async def _request(self, op: str, args: Dict[str, Any], request_id: Optional[int] = None) -> Any:
+        if self._writer is None:
+            raise CoreUnavailable("worker não conectado ao núcleo")
+        request_id = request_id or next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            _write_frame(self._writer, {'id': request_id, 'op': op, 'args': args})
+            await self._writer.drain()
+        except ConnectionError as e:
+            self._pending.pop(request_id, None)
+            raise CoreUnavailable(f"conexão com o núcleo perdida: {e}") from e
+        return await future
+
+    async def subscribe(self, since: Optional[int]) -> Tuple[Subscription, List[Tuple[int, Message]]]:
+        sub_id = next(self._ids)
+        sub = self._subs[sub_id] = Subscription(self.queue_size)
+        self._sub_ids[sub] = sub_id
+        try:
+            result = await self._request('multicast.subscribe',
+                                         {'since': since}, sub_id)
+        except Exception:
+            self._subs.pop(sub_id, None)
+            self._sub_ids.pop(sub, None)
+            raise
+        return sub, [(seq, _message_from_wire(data)) for seq, data in result['backlog']]
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        sub_id = self._sub_ids.pop(sub, None)
+        if sub_id is not None and self._subs.pop(sub_id, None) is not None and self._writer is not None:
+            asyncio.create_task(self._request('multicast.unsubscribe', {'sub': sub_id}))
+
+    def _end(self, sub: Subscription) -> None:
+        """Esvazia a fila e sinaliza o fim da assinatura (None), como DeliveryStream"""
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(None)
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                if 'sub' in frame:
+                    sub = self._subs.get(frame['sub'])
+                    if sub is not None:
+                        event = frame['event']
+                        item = None if event is None else (
+                            event[0], event[1] if event[0] is None else _message_from_wire(event[1]))
+                        try:
+                            sub.queue.put_nowait(item)
+                        except asyncio.QueueFull:
+                            # Cliente HTTP atrasado: encerra a assinatura como no núcleo
+                            self.unsubscribe(sub)
+                            self._end(sub)
+                    continue
+                future = self._pending.pop(frame['id'], None)
+                if future is None or future.done():
+                    continue
+                if 'error' in frame:
+                    future.set_exception(_decode_error(frame['error']))
+                else:
+                    future.set_result(frame['ok'])
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            error = CoreUnavailable(f"conexão com o núcleo perdida: {e}")
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._pending.clear()
+            for sub in self._subs.values():
+                self._end(sub)
+            self._writer = None
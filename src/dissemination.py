@@ -0,0 +1,59 @@
+"""
+Estratégia de difusão para os peers
+'direct': a origem envia a cada um dos N-1 peers (O(N) conexões e envios por nó).
+'tree': uma árvore k-ária fixa (raiz 0) liga os processos; cada item sai da
+origem para os vizinhos na árvore e cada nó o repassa aos vizinhos do lado
+oposto ao da origem. Cada nó só fala com até `fanout` + 1 vizinhos, então o
+número de lotes que envia por janela não cresce com N.
+O caminho entre dois nós na árvore é único e os links são FIFO, então tudo que
+sai de uma mesma origem chega a cada nó na ordem de envio (a ordenação total
+por ACKs depende disso).
+"""
+from typing import List
+
+DISSEMINATION_MODES = ('direct', 'tree')
+DEFAULT_FANOUT = 3
+
+
+class Dissemination:
+    """Calcula para quem cada processo envia (ou repassa) o que veio de uma origem"""
+
+    def __init__(self, total_processes: int, mode: str = 'direct', fanout: int = DEFAULT_FANOUT):
+        if mode not in DISSEMINATION_MODES:
+            raise ValueError(f"mode deve ser um de {DISSEMINATION_MODES}")
+        if fanout < 1:
+            raise ValueError("fanout deve ser >= 1")
+        self.total_processes = total_processes
+        self.mode = mode
+        self.fanout = fanout
+
+    def targets(self, process_id: int, origin: int) -> List[int]:
+        """Peers para os quais `process_id` envia um item originado em `origin`"""
+        if self.mode == 'direct':
+            if process_id != origin:
+                return []
+            return [pid for pid in range(self.total_processes) if pid != origin]
+        neighbors = self.neighbors(process_id)
+        if process_id != origin:
+            neighbors.remove(self._toward(process_id, origin))
+        return neighbors
+
+    def neighbors(self, process_id: int) -> List[int]:
+        """Pai e filhos de `process_id` na árvore"""
+        first = process_id * self.fanout + 1
+        children = list(range(first, min(first + self.fanout, self.total_processes)))
+        return ([self._parent(process_id)] if process_id else []) + children
+
+    def _parent(self, process_id: int) -> int:
+        return (process_id - 1) // self.fanout
+
+    def _toward(self, process_id: int, origin: int) -> int:
+        """Vizinho de `process_id` no caminho até `origin`"""
+        node = origin
+        while node > process_id:
+            parent = self._parent(node)
+            if parent == process_id:
+                # A origem está na subárvore deste filho
+                return node
+            node = parent
+        return self._parent(process_id)
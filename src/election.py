@@ -3,147 +3,373 @@ Serviço de Eleição de Líder usando Algoritmo do Valentão (Bully)
 Q3 - Processo com maior ID vira líder
 """
 import asyncio
-from typing import List, Optional
-import requests
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+from .dissemination import Dissemination
+from .failure_detector import PhiAccrualDetector
+from .logs import EventLog
+from .metrics import Metrics
 from .models import ElectionMessage, ElectionStatus
+from .transport import PeerError, PeerTransport
+
+# Intervalo (segundos) entre heartbeats ao coordenador
+DEFAULT_HEARTBEAT_INTERVAL = 0.2
+# Suspeita (phi) a partir da qual o coordenador é considerado falho
+DEFAULT_PHI_THRESHOLD = 8.0
+# Espera (segundos) por um OK antes de contatar também o próximo processo maior
+DEFAULT_PROBE_INTERVAL = 0.05
+# Espera (segundos) pelo anúncio do coordenador depois de receber OK
+DEFAULT_ELECTION_TIMEOUT = 1.0
 
 
 class ElectionService:
     """Implementa eleição de líder usando o algoritmo Bully"""
     
-    def __init__(self, process_id: int, total_processes: int, peers: List[str]):
+    def __init__(self, process_id: int, total_processes: int, peers: List[str],
+                 transport: Optional[PeerTransport] = None,
+                 metrics: Optional[Metrics] = None,
+                 heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL,
+                 phi_threshold: float = DEFAULT_PHI_THRESHOLD,
+                 probe_interval: float = DEFAULT_PROBE_INTERVAL,
+                 election_timeout: float = DEFAULT_ELECTION_TIMEOUT,
+                 dissemination: Optional[Dissemination] = None):
         self.process_id = process_id
+        self.log = EventLog(process_id, 'election')
         self.coordinator_id: Optional[int] = None
         self.peers = peers
+        self.transport = transport or PeerTransport(peers)
+        self.metrics = metrics or Metrics()
         self.is_in_election = False
         self.total_processes = total_processes
+        # Anúncio do coordenador direto a todos ou repassado numa árvore
+        self.dissemination = dissemination or Dissemination(total_processes)
+        # Época da eleição: eleições concorrentes na mesma época se fundem
+        self.election_epoch = 0
+        self.probe_interval = probe_interval
+        self.election_timeout = election_timeout
+        self._announced = asyncio.Event()
+        # Chamados com (coordinator_id, epoch) a cada coordenador anunciado ou assumido
+        self.coordinator_listeners: List[Callable[[Optional[int], int], None]] = []
+        # Mensagens enviadas por este processo na eleição atual / na última
+        self._election_messages = 0
+        self.last_election_messages = 0
+
+        # Detector de falhas do coordenador (heartbeats em segundo plano)
+        self.heartbeat_interval = heartbeat_interval
+        self.phi_threshold = phi_threshold
+        self.detector = PhiAccrualDetector(first_interval=heartbeat_interval)
+        # Lease local do coordenador: renovado a cada heartbeat respondido
+        self.lease_duration = heartbeat_interval * 5
+        self.lease_expires_at = 0.0
+        self._last_election_at = 0.0
+        self._heartbeat_in_flight = False
+        self._monitor_task: Optional[asyncio.Task] = None
     
-    async def start_election(self) -> None:
-        """Inicia o processo de eleição (algoritmo Bully)"""
+    async def start_election(self, epoch: Optional[int] = None) -> None:
+        """Inicia o processo de eleição (algoritmo Bully)
+
+        Sem `epoch`, abre uma nova época; com `epoch`, participa da eleição
+        já em andamento naquela época (recebida via /eleicao)."""
         if self.is_in_election:
-            print(f"[Process {self.process_id}] ⚠️ Já está em processo de eleição")
+            self.log.info('election_in_progress', "⚠️ Já está em processo de eleição")
             return
         
         self.is_in_election = True
-        print(f"\n[Process {self.process_id}] 🗳️ Iniciando eleição Bully")
-        
-        # Envia mensagem ELECTION para processos com ID maior
-        higher_process_ids = list(range(self.process_id + 1, self.total_processes))
-        
-        if not higher_process_ids:
-            # Sou o processo com maior ID, me torno coordenador imediatamente
-            print(f"[Process {self.process_id}] 👑 Maior ID, me tornando coordenador")
-            await self.become_coordinator()
-            return
-        
-        print(f"[Process {self.process_id}] 📨 Enviando ELECTION para processos: {higher_process_ids}")
-        
-        received_ok = False
-        
-        # Envia ELECTION para todos os processos com ID maior
-        tasks = []
-        for process_id in higher_process_ids:
-            tasks.append(self._send_election_to_peer(process_id))
-        
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Verifica se alguém respondeu OK
-        for result in results:
-            if result is True:
-                received_ok = True
-                break
-        
-        if not received_ok:
-            # Ninguém respondeu, me torno coordenador
-            print(f"[Process {self.process_id}] ✅ Nenhum processo maior respondeu")
-            await self.become_coordinator()
+        if epoch is None:
+            self.election_epoch += 1
         else:
-            # Alguém respondeu, aguardo anúncio de coordenador
-            print(f"[Process {self.process_id}] ⏳ Processo maior respondeu, aguardando anúncio")
+            self.election_epoch = max(self.election_epoch, epoch)
+        self.log.info('election_started', "🗳️ Iniciando eleição Bully (época {epoch})",
+                      epoch=self.election_epoch)
+        self.metrics.elections.inc()
+        started = time.monotonic()
+        self._last_election_at = started
+        self._election_messages = 0
+        self._announced.clear()
+        try:
+            await self._run_election()
+        finally:
             self.is_in_election = False
+            self.last_election_messages = self._election_messages
+            self.metrics.election_duration.observe(time.monotonic() - started)
+            self.metrics.election_messages.observe(self._election_messages)
+    
+    async def _run_election(self) -> None:
+        """Envia ELECTION aos processos de ID maior e decide pelo resultado"""
+        while True:
+            # Do maior para o menor: o maior vivo costuma responder primeiro
+            higher_process_ids = list(range(self.total_processes - 1, self.process_id, -1))
+            
+            if not higher_process_ids:
+                # Sou o processo com maior ID, me torno coordenador imediatamente
+                self.log.info('election_highest_id', "👑 Maior ID, me tornando coordenador")
+                await self.become_coordinator()
+                return
+            
+            if not await self._probe_higher(higher_process_ids):
+                # Ninguém respondeu, me torno coordenador
+                self.log.info('election_no_answer', "✅ Nenhum processo maior respondeu")
+                await self.become_coordinator()
+                return
+            
+            # Alguém respondeu, aguardo anúncio de coordenador
+            self.log.info('election_waiting', "⏳ Processo maior respondeu, aguardando anúncio")
+            try:
+                await asyncio.wait_for(self._announced.wait(), self.election_timeout)
+                return
+            except asyncio.TimeoutError:
+                # Quem respondeu OK caiu antes de anunciar: nova época
+                self.election_epoch += 1
+                self.log.warning('election_restarted', "⌛ Anúncio não chegou, reiniciando (época {epoch})",
+                                 epoch=self.election_epoch)
+    
+    async def _probe_higher(self, process_ids: List[int]) -> bool:
+        """Envia ELECTION em ondas e para no primeiro OK
+
+        Cada peer seguinte só é contatado quando o anterior falha ou demora
+        mais que `probe_interval`; os envios restantes são cancelados."""
+        pending: Set[asyncio.Task] = set()
+        try:
+            for process_id in process_ids:
+                pending.add(asyncio.create_task(self._send_election_to_peer(process_id)))
+                self._election_messages += 1
+                done, pending = await asyncio.wait(
+                    pending, timeout=self.probe_interval, return_when=asyncio.FIRST_COMPLETED
+                )
+                if any(task.result() for task in done):
+                    return True
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if any(task.result() for task in done):
+                    return True
+            return False
+        finally:
+            for task in pending:
+                task.cancel()
     
     async def _send_election_to_peer(self, peer_id: int) -> bool:
         """Envia mensagem ELECTION para um peer via endpoint /eleicao"""
         try:
-            peer = self.peers[peer_id]
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: requests.post(
-                    f"{peer}/eleicao",
-                    json={'sender_id': self.process_id},
-                    timeout=2
-                )
+            data = await self.transport.post(
+                peer_id,
+                '/eleicao',
+                {'sender_id': self.process_id, 'epoch': self.election_epoch},
+                timeout=2
             )
+            return data.get('ok', False)
             
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('ok', False)
-            return False
-            
-        except Exception as e:
-            print(f"[Process {self.process_id}] ❌ Processo {peer_id} não respondeu (OK)")
+        except PeerError:
+            self.log.info('election_no_ok', "❌ Processo {peer} não respondeu (OK)", peer=peer_id)
             return False
     
-    def receive_election(self, sender_id: int) -> bool:
+    def receive_election(self, sender_id: int, epoch: int = 0) -> bool:
         """Recebe mensagem ELECTION via endpoint /eleicao
         Retorna True (OK) se tiver ID maior que o sender"""
         
-        print(f"\n[Process {self.process_id}] 📩 Recebeu ELECTION de Processo {sender_id}")
+        self.log.info('election_received', "📩 Recebeu ELECTION de Processo {sender} (época {epoch})",
+                      sender=sender_id, epoch=epoch)
+        self.election_epoch = max(self.election_epoch, epoch)
         
         if self.process_id > sender_id:
-            # Tenho ID maior, respondo OK e inicio minha própria eleição
-            print(f"[Process {self.process_id}] ✅ Respondendo OK (tenho ID maior)")
+            # Tenho ID maior, respondo OK
+            self.log.info('election_ok_sent', "✅ Respondendo OK (tenho ID maior)")
             
-            # Inicia eleição assíncrona
-            asyncio.create_task(self._delayed_start_election())
+            if self.is_in_election:
+                # Eleições concorrentes se fundem na que já está em andamento
+                pass
+            elif self.coordinator_id == self.process_id:
+                # Já sou o coordenador: basta reanunciar para quem perguntou (sem repasse)
+                asyncio.create_task(self._announce_coordinator(
+                    sender_id, self.process_id, self.election_epoch, relay=False))
+            else:
+                asyncio.create_task(self.start_election(epoch))
             return True
         else:
             # ID menor, não respondo
-            print(f"[Process {self.process_id}] ⛔ Ignorando (ID menor)")
+            self.log.info('election_ignored', "⛔ Ignorando (ID menor)")
             return False
     
-    async def _delayed_start_election(self) -> None:
-        """Inicia eleição após pequeno atraso"""
-        await asyncio.sleep(0.5)
-        await self.start_election()
-    
     async def become_coordinator(self) -> None:
         """Torna-se o coordenador e anuncia para todos"""
         self.coordinator_id = self.process_id
         self.is_in_election = False
+        self._renew_lease()
+        self._announced.set()
         
-        print(f"\n[Process {self.process_id}] 👑 SOU O COORDENADOR!")
+        self.log.info('became_coordinator', "👑 SOU O COORDENADOR!", epoch=self.election_epoch)
+        self._notify_listeners()
         
-        # Anuncia via endpoint /coordenador para todos os processos
-        tasks = []
-        for idx, peer in enumerate(self.peers):
-            if idx != self.process_id:
-                tasks.append(self._announce_coordinator(peer))
-        
-        await asyncio.gather(*tasks, return_exceptions=True)
+        # Anuncia via endpoint /coordenador (a todos, ou aos filhos na árvore)
+        await self._announce_to(self.dissemination.targets(self.process_id, self.process_id),
+                                self.process_id, self.election_epoch)
+    
+    async def _announce_to(self, peer_ids: List[int], coordinator_id: int, epoch: int) -> None:
+        await asyncio.gather(
+            *(self._announce_coordinator(pid, coordinator_id, epoch) for pid in peer_ids),
+            return_exceptions=True
+        )
     
-    async def _announce_coordinator(self, peer: str) -> None:
-        """Anuncia que é o coordenador via endpoint /coordenador"""
+    async def _announce_coordinator(self, peer_id: int, coordinator_id: int, epoch: int,
+                                    relay: bool = True) -> None:
+        """Anuncia o coordenador via endpoint /coordenador
+
+        No modo 'tree', se o peer não responder, anuncia direto aos filhos
+        dele, para que o resto da árvore não fique sem saber do novo coordenador."""
+        self._election_messages += 1
         try:
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
-                lambda: requests.post(
-                    f"{peer}/coordenador",
-                    json={'coordinator_id': self.process_id},
-                    timeout=3
-                )
+            await self.transport.post(
+                peer_id,
+                '/coordenador',
+                {'coordinator_id': coordinator_id, 'epoch': epoch, 'relay': relay},
+                timeout=3
             )
-        except Exception as e:
-            print(f"[Process {self.process_id}] ❌ Erro anunciando para {peer}: {str(e)}")
+        except PeerError as e:
+            self.log.warning('announce_failed', "❌ Erro anunciando para Processo {peer}: {error}",
+                             peer=peer_id, error=str(e))
+            if relay and self.dissemination.mode == 'tree':
+                await self._announce_to(self.dissemination.targets(peer_id, coordinator_id),
+                                        coordinator_id, epoch)
     
-    def receive_coordinator(self, coordinator_id: int) -> None:
-        """Recebe anúncio de novo coordenador via endpoint /coordenador"""
-        print(f"\n[Process {self.process_id}] 👑 Processo {coordinator_id} é o coordenador")
+    def receive_coordinator(self, coordinator_id: int, epoch: int = 0, relay: bool = True) -> None:
+        """Recebe anúncio de novo coordenador via endpoint /coordenador
+
+        Com `relay`, repassa o anúncio aos filhos na árvore do coordenador."""
+        if (epoch < self.election_epoch and self.coordinator_id is not None
+                and coordinator_id < self.coordinator_id):
+            # Anúncio atrasado de uma época anterior
+            self.log.info('stale_announcement', "⛔ Ignorando anúncio antigo de Processo {coordinator}",
+                          coordinator=coordinator_id, epoch=epoch)
+            return
+        
+        self.log.info('coordinator_announced', "👑 Processo {coordinator} é o coordenador",
+                      coordinator=coordinator_id, epoch=epoch)
         
         self.coordinator_id = coordinator_id
+        self.election_epoch = max(self.election_epoch, epoch)
         self.is_in_election = False
+        self._announced.set()
+        self.detector.reset(time.monotonic())
+        self._renew_lease()
+        self._notify_listeners()
+        children = self.dissemination.targets(self.process_id, coordinator_id) if relay else []
+        if children:
+            asyncio.create_task(self._announce_to(children, coordinator_id, self.election_epoch))
+    
+    def _notify_listeners(self) -> None:
+        for listener in self.coordinator_listeners:
+            listener(self.coordinator_id, self.election_epoch)
+
+    # ==================== DETECTOR DE FALHAS ====================
+    
+    def start_monitor(self) -> None:
+        """Inicia o envio periódico de heartbeats ao coordenador"""
+        if self._monitor_task is None:
+            self._monitor_task = asyncio.create_task(self._monitor_loop())
+    
+    async def stop_monitor(self) -> None:
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
+    
+    async def _monitor_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                self._check_coordinator()
+            except Exception as e:
+                self.log.error('failure_detector_error', "❌ Erro no detector de falhas: {error}",
+                               error=str(e))
+    
+    def _check_coordinator(self) -> None:
+        """Um passo do detector: envia heartbeat ou dispara eleição se houver suspeita"""
+        if self.is_in_election:
+            return
+        now = time.monotonic()
+        
+        if self.coordinator_id is None:
+            # Sem coordenador conhecido (início ou anúncio que não chegou)
+            if now - self._last_election_at > self.lease_duration:
+                asyncio.create_task(self.start_election())
+            return
+        
+        if self.coordinator_id == self.process_id:
+            self._renew_lease()
+            return
+        
+        phi = self.detector.phi(now)
+        if phi > self.phi_threshold:
+            self.log.warning('coordinator_suspected', "💀 Coordenador {coordinator} suspeito (phi={phi:.1f})",
+                             coordinator=self.coordinator_id, phi=phi)
+            self.metrics.coordinator_suspicions.inc()
+            self.coordinator_id = None
+            self.lease_expires_at = 0.0
+            asyncio.create_task(self.start_election())
+            return
+        
+        if not self._heartbeat_in_flight:
+            asyncio.create_task(self._send_heartbeat(self.coordinator_id))
+    
+    async def _send_heartbeat(self, coordinator_id: int) -> None:
+        """Envia heartbeat via endpoint /heartbeat e alimenta o detector"""
+        self._heartbeat_in_flight = True
+        try:
+            data = await self.transport.post(
+                coordinator_id,
+                '/heartbeat',
+                {'sender_id': self.process_id, 'epoch': self.election_epoch},
+                timeout=self.lease_duration
+            )
+        except PeerError:
+            return
+        finally:
+            self._heartbeat_in_flight = False
+        
+        if coordinator_id != self.coordinator_id:
+            return
+        if data.get('coordinatorId') != coordinator_id:
+            # O processo não se considera mais coordenador (ex.: reiniciou)
+            self.log.warning('coordinator_resigned', "⚠️ Processo {coordinator} não é mais coordenador",
+                             coordinator=coordinator_id)
+            self.coordinator_id = None
+            self.lease_expires_at = 0.0
+            asyncio.create_task(self.start_election())
+            return
+        self.election_epoch = max(self.election_epoch, data.get('epoch', 0))
+        self.detector.heartbeat(time.monotonic())
+        self._renew_lease()
+    
+    def receive_heartbeat(self, sender_id: int, epoch: int = 0) -> Dict[str, Any]:
+        """Responde a um heartbeat via endpoint /heartbeat
+
+        As épocas trocadas nos heartbeats fazem um coordenador que reiniciou
+        (e voltou com época baixa) alcançar a época do cluster."""
+        self.election_epoch = max(self.election_epoch, epoch)
+        return {'coordinatorId': self.coordinator_id, 'processId': self.process_id,
+                'epoch': self.election_epoch}
+    
+    def _renew_lease(self) -> None:
+        self.lease_expires_at = time.monotonic() + self.lease_duration
+    
+    def get_leader(self) -> Optional[int]:
+        """Coordenador atual pelo lease local, sem acessar a rede
+
+        None se não houver coordenador ou o lease tiver expirado."""
+        if self.coordinator_id is None or time.monotonic() >= self.lease_expires_at:
+            return None
+        return self.coordinator_id
+    
+    def get_lease_info(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        watching = self.coordinator_id is not None and self.coordinator_id != self.process_id
+        return {
+            'coordinatorId': self.get_leader(),
+            'leaseRemaining': round(max(self.lease_expires_at - now, 0.0), 3),
+            'phi': round(self.detector.phi(now), 3) if watching else 0.0
+        }
     
     def get_status(self) -> ElectionStatus:
         """Retorna o status da eleição"""
@@ -151,7 +377,9 @@ class ElectionService:
             processId=self.process_id,
             coordinatorId=self.coordinator_id,
             isCoordinator=(self.coordinator_id == self.process_id),
-            electionInProgress=self.is_in_election
+            electionInProgress=self.is_in_election,
+            electionEpoch=self.election_epoch,
+            lastElectionMessages=self.last_election_messages
         )
 """Arquivo removido. Toda a lógica está em src/main.py"""
 
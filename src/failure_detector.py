@@ -0,0 +1,68 @@
+"""
+Detector de falhas phi-accrual (Hayashibara et al.)
+Em vez de um timeout fixo, calcula a suspeita (phi) a partir da distribuição
+dos intervalos entre heartbeats recentes: o limiar se adapta à rede
+"""
+import math
+from collections import deque
+from typing import Deque, Optional
+
+
+class PhiAccrualDetector:
+    """Suspeita de falha de um único processo monitorado
+
+    phi = -log10(P(o próximo heartbeat chegar depois do tempo já decorrido)),
+    com os intervalos modelados como normais. phi = 8 equivale a uma chance
+    de 1e-8 de o processo ainda estar vivo."""
+
+    def __init__(self, first_interval: float, window: int = 100, min_std: float = 0.05):
+        # Intervalo esperado antes de haver histórico
+        self.first_interval = first_interval
+        # Desvio mínimo, para não suspeitar por jitter em redes muito estáveis
+        self.min_std = min_std
+        self.intervals: Deque[float] = deque(maxlen=window)
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self.last_heartbeat: Optional[float] = None
+
+    def reset(self, now: Optional[float] = None) -> None:
+        """Recomeça o histórico (novo processo monitorado)"""
+        self.intervals.clear()
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self.last_heartbeat = now
+
+    def heartbeat(self, now: float) -> None:
+        """Registra a chegada de um heartbeat em O(1)"""
+        if self.last_heartbeat is not None:
+            interval = now - self.last_heartbeat
+            if len(self.intervals) == self.intervals.maxlen:
+                evicted = self.intervals[0]
+                self._sum -= evicted
+                self._sum_sq -= evicted * evicted
+            self.intervals.append(interval)
+            self._sum += interval
+            self._sum_sq += interval * interval
+        self.last_heartbeat = now
+
+    def phi(self, now: float) -> float:
+        """Nível de suspeita no instante `now` (0 = sem suspeita)"""
+        if self.last_heartbeat is None:
+            return 0.0
+        if self.intervals:
+            count = len(self.intervals)
+            mean = self._sum / count
+            variance = max(self._sum_sq / count - mean * mean, 0.0)
+        else:
+            mean = self.first_interval
+            variance = (self.first_interval / 4) ** 2
+        std = max(math.sqrt(variance), self.min_std)
+
+        # Aproximação logística da cauda da normal (a mesma usada pelo Akka)
+        elapsed = now - self.last_heartbeat
+        y = (elapsed - mean) / std
+        exponent = -y * (1.5976 + 0.070566 * y * y)
+        e = math.exp(max(-700.0, min(700.0, exponent)))
+        if elapsed > mean:
+            return -math.log10(e / (1.0 + e))
+        return -math.log10(1.0 - 1.0 / (1.0 + e))
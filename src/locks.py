@@ -0,0 +1,321 @@
+"""
+Locks nomeados com lease e fencing token
+O coordenador eleito (Bully) mantém o estado de todos os locks; os demais
+processos encaminham os pedidos para ele. Cada nome tem o próprio dono e a
+própria fila FIFO, então recursos independentes não disputam o mesmo token.
+"""
+import asyncio
+import time
+from collections import deque
+from dataclasses import asdict
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import quote
+from .election import ElectionService
+from .logs import EventLog
+from .metrics import Metrics
+from .models import LockGrant
+from .transport import PeerError, PeerTransport
+
+# Lease padrão e máximo (ms) de uma concessão
+DEFAULT_LEASE_MS = 5000
+DEFAULT_MAX_LEASE_MS = 10000
+# Espera máxima (ms) de um acquire em long-poll
+MAX_WAIT_MS = 60000
+# Folga (segundos) do timeout HTTP ao encaminhar um acquire ao coordenador
+FORWARD_SLACK = 2.0
+# Bits do contador dentro do fencing token (a época ocupa os bits acima)
+COUNTER_BITS = 32
+
+
+class LockUnavailable(Exception):
+    """Sem coordenador alcançável para atender o pedido"""
+
+
+class _Waiter:
+    __slots__ = ('owner', 'lease_ms', 'future')
+
+    def __init__(self, owner: str, lease_ms: int, future: asyncio.Future):
+        self.owner = owner
+        self.lease_ms = lease_ms
+        self.future = future
+
+
+class _LockState:
+    """Dono atual, expiração do lease e fila de espera de um lock"""
+    __slots__ = ('holder', 'expiry', 'waiters')
+
+    def __init__(self):
+        self.holder: Optional[LockGrant] = None
+        self.expiry: Optional[asyncio.TimerHandle] = None
+        self.waiters: Deque[_Waiter] = deque()
+
+
+class LockService:
+    """Locks nomeados centralizados no coordenador
+
+    O fencing token é (época da eleição << 32) | contador: cresce a cada
+    concessão e também entre coordenadores, pois toda nova liderança vem
+    de uma época maior. Quem protege um recurso deve recusar escritas com
+    token menor que o último visto. Ao assumir no lugar de outro
+    coordenador, espera `failover_grace` (contado da troca) antes da
+    primeira concessão, para que os leases dados pelo anterior expirem;
+    sem coordenador anterior conhecido não há carência."""
+
+    def __init__(self, process_id: int, election: ElectionService,
+                 transport: Optional[PeerTransport] = None,
+                 metrics: Optional[Metrics] = None,
+                 default_lease_ms: int = DEFAULT_LEASE_MS,
+                 max_lease_ms: int = DEFAULT_MAX_LEASE_MS,
+                 failover_grace: Optional[float] = None):
+        self.process_id = process_id
+        self.log = EventLog(process_id, 'locks')
+        self.election = election
+        self.transport = transport or election.transport
+        self.metrics = metrics or Metrics()
+        self.default_lease_ms = default_lease_ms
+        self.max_lease_ms = max_lease_ms
+        self.failover_grace = max_lease_ms / 1000 if failover_grace is None else failover_grace
+        self._locks: Dict[str, _LockState] = {}
+        # Liderança atual: época de referência do fencing token e contador
+        self._leading = False
+        self._token_epoch = 0
+        self._counter = 0
+        self._grace_until = 0.0
+        self._grace_timer: Optional[asyncio.TimerHandle] = None
+        # Último coordenador anunciado pela eleição
+        self._coordinator: Optional[int] = None
+        election.coordinator_listeners.append(self._coordinator_changed)
+
+    # ==================== API ====================
+
+    async def acquire(self, name: str, owner: str, lease_ms: Optional[int] = None,
+                      timeout_ms: int = 0, forwarded: bool = False) -> Dict[str, Any]:
+        """Concede o lock a `owner`, esperando até `timeout_ms` (long-poll)
+
+        Retorna a concessão com `granted=True` ou `granted=False` se o prazo
+        acabar. Pedir de novo um lock que já é seu renova o lease."""
+        timeout_ms = max(0, min(timeout_ms, MAX_WAIT_MS))
+        leader = self._leader(forwarded)
+        if leader != self.process_id:
+            payload = {'owner': owner, 'lease_ms': lease_ms, 'timeout_ms': timeout_ms,
+                       'forwarded': True}
+            return await self._forward(leader, f'/locks/{quote(name, safe="")}/acquire',
+                                       payload, timeout_ms / 1000 + FORWARD_SLACK)
+
+        self._check_leadership()
+        lease_ms = max(1, min(lease_ms or self.default_lease_ms, self.max_lease_ms))
+        state = self._locks.get(name)
+        if state is None:
+            state = self._locks[name] = _LockState()
+
+        if state.holder is not None and state.holder.owner == owner:
+            # Renovação pelo dono atual: mesmo token, lease novo
+            return self._result(self._grant(name, state, owner, lease_ms, state.holder.fencingToken))
+        if (state.holder is None and not state.waiters
+                and asyncio.get_running_loop().time() >= self._grace_until):
+            self.metrics.lock_wait.observe(0.0)
+            return self._result(self._grant(name, state, owner, lease_ms))
+        if timeout_ms == 0:
+            self._discard_if_idle(name, state)
+            return self._refused(name, state)
+
+        waiter = _Waiter(owner, lease_ms, asyncio.get_running_loop().create_future())
+        state.waiters.append(waiter)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling() == 0:
+                # Quem foi cancelado foi a espera, não o pedido: vira 503
+                raise LockUnavailable(f"Processo {self.process_id} deixou de ser o coordenador")
+            # Cliente desconectou: devolve o lock se ele chegou a ser concedido
+            if (waiter.future.done() and not waiter.future.cancelled()
+                    and waiter.future.exception() is None):
+                self.release(name, waiter.future.result().fencingToken)
+            raise
+        finally:
+            if not waiter.future.done():
+                waiter.future.cancel()
+                if waiter in state.waiters:
+                    state.waiters.remove(waiter)
+                self._discard_if_idle(name, state)
+
+        if waiter.future.cancelled():
+            return self._refused(name, state)
+        self.metrics.lock_wait.observe(time.monotonic() - started)
+        return self._result(waiter.future.result())
+
+    async def release_remote(self, name: str, fencing_token: int,
+                             forwarded: bool = False) -> Dict[str, Any]:
+        """Libera o lock no coordenador (encaminhando se preciso)"""
+        leader = self._leader(forwarded)
+        if leader != self.process_id:
+            payload = {'fencing_token': fencing_token, 'forwarded': True}
+            return await self._forward(leader, f'/locks/{quote(name, safe="")}/release',
+                                       payload, FORWARD_SLACK)
+        self._check_leadership()
+        return {'name': name, 'released': self.release(name, fencing_token)}
+
+    def release(self, name: str, fencing_token: int) -> bool:
+        """Libera o lock se `fencing_token` for o da concessão atual"""
+        state = self._locks.get(name)
+        if state is None or state.holder is None or state.holder.fencingToken != fencing_token:
+            return False
+        self.log.info('lock_released', "🔓 Lock '{name}' liberado por {owner}",
+                      name=name, owner=state.holder.owner)
+        self._clear_holder(state)
+        self._grant_next(name)
+        return True
+
+    def get_locks(self) -> Dict[str, Any]:
+        """Locks concedidos e filas de espera (visão do coordenador)"""
+        return {
+            'isCoordinator': self.election.coordinator_id == self.process_id,
+            'locks': [
+                {'name': name,
+                 'holder': asdict(state.holder) if state.holder else None,
+                 'waiters': len(state.waiters)}
+                for name, state in self._locks.items()
+            ]
+        }
+
+    # ==================== COORDENADOR ====================
+
+    def _leader(self, forwarded: bool) -> int:
+        leader = self.election.coordinator_id
+        if leader is None:
+            raise LockUnavailable("Nenhum coordenador conhecido")
+        if leader != self.process_id and forwarded:
+            # Visões diferentes do coordenador: não encaminha de novo
+            raise LockUnavailable(f"Processo {self.process_id} não é o coordenador")
+        if leader != self.process_id:
+            self._step_down()
+        return leader
+
+    async def _forward(self, leader: int, path: str, payload: Dict[str, Any],
+                       timeout: float) -> Dict[str, Any]:
+        try:
+            return await self.transport.post(leader, path, payload, timeout=timeout)
+        except PeerError as e:
+            raise LockUnavailable(f"Coordenador {leader} indisponível: {str(e)}") from e
+
+    def _coordinator_changed(self, coordinator_id: Optional[int], epoch: int) -> None:
+        """Chamado pela eleição a cada coordenador anunciado ou assumido"""
+        previous, self._coordinator = self._coordinator, coordinator_id
+        if coordinator_id != self.process_id:
+            self._step_down()
+        elif not self._leading:
+            # Sem coordenador anterior ninguém pode ter um lease ainda válido
+            self._take_over(grace=previous is not None and previous != self.process_id)
+
+    def _check_leadership(self) -> None:
+        """Garante o estado de líder e a época do fencing token"""
+        epoch = self.election.election_epoch
+        if not self._leading:
+            self._take_over(grace=self._coordinator not in (None, self.process_id))
+        if epoch != self._token_epoch:
+            self._token_epoch = epoch
+            self._counter = 0
+
+    def _take_over(self, grace: bool) -> None:
+        """Assume a liderança do zero; com `grace`, abre o período de carência"""
+        self._leading = True
+        loop = asyncio.get_running_loop()
+        self._grace_until = loop.time() + (self.failover_grace if grace else 0.0)
+        if grace and self.failover_grace > 0:
+            self.log.info('locks_taken_over',
+                          "🔒 Assumindo os locks (época {epoch}), carência de {grace:.1f}s",
+                          epoch=self.election.election_epoch, grace=self.failover_grace)
+            self._grace_timer = loop.call_at(self._grace_until, self._end_grace)
+
+    def _step_down(self) -> None:
+        """Deixou de ser coordenador: descarta o estado dos locks"""
+        if not self._leading:
+            return
+        self._leading = False
+        if self._grace_timer is not None:
+            self._grace_timer.cancel()
+            self._grace_timer = None
+        for state in self._locks.values():
+            self._clear_holder(state)
+            for waiter in state.waiters:
+                if not waiter.future.done():
+                    # O long-poll termina com LockUnavailable (503): o cliente tenta no novo coordenador
+                    waiter.future.set_exception(LockUnavailable(
+                        f"Processo {self.process_id} deixou de ser o coordenador"))
+        self._locks.clear()
+
+    def _end_grace(self) -> None:
+        self._grace_timer = None
+        for name in list(self._locks):
+            self._grant_next(name)
+
+    def _next_token(self) -> int:
+        self._counter += 1
+        return (self._token_epoch << COUNTER_BITS) | self._counter
+
+    def _grant(self, name: str, state: _LockState, owner: str, lease_ms: int,
+               fencing_token: Optional[int] = None) -> LockGrant:
+        if state.expiry is not None:
+            state.expiry.cancel()
+        token = self._next_token() if fencing_token is None else fencing_token
+        state.holder = LockGrant(
+            name=name,
+            owner=owner,
+            fencingToken=token,
+            leaseMs=lease_ms,
+            expiresAt=time.time() + lease_ms / 1000
+        )
+        state.expiry = asyncio.get_running_loop().call_later(
+            lease_ms / 1000, self._expire, name, token)
+        self.log.info('lock_granted', "🔒 Lock '{name}' concedido a {owner} (token {token})",
+                      name=name, owner=owner, token=token)
+        return state.holder
+
+    def _grant_next(self, name: str) -> None:
+        """Passa o lock livre para o primeiro da fila que ainda espera"""
+        state = self._locks.get(name)
+        if state is None or state.holder is not None:
+            return
+        if asyncio.get_running_loop().time() < self._grace_until:
+            return
+        while state.waiters:
+            waiter = state.waiters.popleft()
+            if waiter.future.done():
+                continue
+            waiter.future.set_result(self._grant(name, state, waiter.owner, waiter.lease_ms))
+            return
+        self._discard_if_idle(name, state)
+
+    def _expire(self, name: str, fencing_token: int) -> None:
+        state = self._locks.get(name)
+        if state is None or state.holder is None or state.holder.fencingToken != fencing_token:
+            return
+        self.log.warning('lease_expired', "⌛ Lease do lock '{name}' expirou ({owner})",
+                         name=name, owner=state.holder.owner)
+        state.expiry = None
+        state.holder = None
+        self._grant_next(name)
+
+    @staticmethod
+    def _clear_holder(state: _LockState) -> None:
+        if state.expiry is not None:
+            state.expiry.cancel()
+            state.expiry = None
+        state.holder = None
+
+    def _discard_if_idle(self, name: str, state: _LockState) -> None:
+        """Remove locks sem dono nem fila (memória limitada ao que está em uso)"""
+        if state.holder is None and not state.waiters and self._locks.get(name) is state:
+            del self._locks[name]
+
+    @staticmethod
+    def _result(grant: LockGrant) -> Dict[str, Any]:
+        return {'granted': True, **asdict(grant)}
+
+    @staticmethod
+    def _refused(name: str, state: _LockState) -> Dict[str, Any]:
+        return {'granted': False, 'name': name,
+                'holder': state.holder.owner if state.holder else None}
@@ -0,0 +1,289 @@
+"""
+Logs estruturados fora do event loop
+Os serviços registram eventos com nome e campos:
+
+    self.log.info('token_passed', "🎫 Passando token para Processo {to}", to=3)
+
+O registro entra em uma fila limitada e uma thread separada formata e escreve
+no stdout. Uma escrita lenta (pipe cheio no Kubernetes) não trava o loop: com a
+fila cheia o registro é descartado e contado. Cada evento pode ter amostragem
+(fração registrada) e limite por segundo, e os níveis mudam em tempo de
+execução (PUT /logging). A configuração vale para o processo inteiro.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, TextIO
+
+LOGGER_NAME = 'multicast'
+LOG_FORMATS = ('text', 'json')
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+# Registros aguardando a thread de escrita (acima disso: descartados)
+DEFAULT_QUEUE_SIZE = 10000
+# Chaves do JSON que os campos não sobrescrevem (um campo com esse nome vira field_<nome>)
+RESERVED_KEYS = frozenset(('ts', 'level', 'logger', 'event', 'processId', 'msg', 'suppressed', 'exc'))
+
+
+class EventLog:
+    """Logger de um componente de um processo; mensagem e campos só são formatados na thread de escrita"""
+    __slots__ = ('process_id', '_logger')
+
+    def __init__(self, process_id: int, component: str):
+        self.process_id = process_id
+        self._logger = logging.getLogger(f'{LOGGER_NAME}.{component}')
+
+    def _log(self, level: int, event: str, message: str, fields: Dict[str, Any]) -> None:
+        if self._logger.isEnabledFor(level):
+            if _pipeline is None:
+                # Sem setup_logging o registro vai aos handlers do logging padrão,
+                # que não conhecem os campos: formata aqui mesmo
+                message = _format(message, fields)
+            # Cópia: o registro só é formatado depois, na thread de escrita
+            self._logger.log(level, message, extra={
+                'event': event, 'processId': self.process_id, 'fields': dict(fields)
+            })
+
+    def debug(self, event: str, message: str, **fields) -> None:
+        self._log(logging.DEBUG, event, message, fields)
+
+    def info(self, event: str, message: str, **fields) -> None:
+        self._log(logging.INFO, event, message, fields)
+
+    def warning(self, event: str, message: str, **fields) -> None:
+        self._log(logging.WARNING, event, message, fields)
+
+    def error(self, event: str, message: str, **fields) -> None:
+        self._log(logging.ERROR, event, message, fields)
+
+
+class EventFilter(logging.Filter):
+    """Amostragem e limite por segundo de cada evento, aplicados antes da fila"""
+
+    def __init__(self):
+        super().__init__()
+        # Fração registrada (0..1) e máximo por segundo, por nome de evento
+        self.sample: Dict[str, float] = {}
+        self.rate_limit: Dict[str, float] = {}
+        self.sampled_out: Counter = Counter()
+        self.rate_limited: Counter = Counter()
+        # Balde de fichas por evento: (fichas, instante da última recarga)
+        self._buckets: Dict[str, list] = {}
+        # Suprimidos pelo limite desde o último registro do evento
+        self._suppressed: Counter = Counter()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, 'event', None)
+        if event is None:
+            return True
+        rate = self.sample.get(event)
+        if rate is not None and random.random() >= rate:
+            self.sampled_out[event] += 1
+            return False
+        limit = self.rate_limit.get(event)
+        if limit is not None:
+            now = time.monotonic()
+            bucket = self._buckets.get(event)
+            if bucket is None:
+                bucket = self._buckets[event] = [limit, now]
+            bucket[0] = min(limit, bucket[0] + (now - bucket[1]) * limit)
+            bucket[1] = now
+            if bucket[0] < 1:
+                self.rate_limited[event] += 1
+                self._suppressed[event] += 1
+                return False
+            bucket[0] -= 1
+            suppressed = self._suppressed.pop(event, 0)
+            if suppressed:
+                record.suppressed = suppressed
+        return True
+
+    def configure(self, sample: Optional[Dict[str, float]] = None,
+                  rate_limit: Optional[Dict[str, float]] = None) -> None:
+        """Substitui a amostragem e/ou os limites (taxa >= 1 ou limite <= 0 removem o evento)"""
+        if sample is not None:
+            self.sample = {event: max(0.0, rate) for event, rate in sample.items() if rate < 1}
+        if rate_limit is not None:
+            self.rate_limit = {event: limit for event, limit in rate_limit.items() if limit > 0}
+            self._buckets.clear()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que nunca bloqueia: com a fila cheia, descarta e conta"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A formatação fica para a thread de escrita
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _format(message: str, fields: Optional[Dict[str, Any]]) -> str:
+    if fields:
+        try:
+            return message.format(**fields)
+        except (KeyError, IndexError, ValueError):
+            pass
+    return message
+
+
+def _render(record: logging.LogRecord) -> str:
+    return _format(record.getMessage(), getattr(record, 'fields', None))
+
+
+class TextFormatter(logging.Formatter):
+    """Mesmo formato dos prints de antes: [Process X] mensagem"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        process_id = getattr(record, 'processId', None)
+        line = _render(record) if process_id is None else f"[Process {process_id}] {_render(record)}"
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            line += f" (+{suppressed} suprimidos)"
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro: ts, level, logger, event, processId, msg e os campos"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': getattr(record, 'event', None),
+            'processId': getattr(record, 'processId', None),
+            'msg': _render(record),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            for key, value in fields.items():
+                data[f'field_{key}' if key in RESERVED_KEYS else key] = value
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            data['suppressed'] = suppressed
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class LogPipeline:
+    """Fila limitada + thread de escrita para os loggers `multicast.*`"""
+
+    def __init__(self, fmt: str = 'text', level: str = 'INFO',
+                 queue_size: int = DEFAULT_QUEUE_SIZE, stream: Optional[TextIO] = None):
+        if fmt not in LOG_FORMATS:
+            raise ValueError(f"formato deve ser um de {LOG_FORMATS}")
+        self.format = fmt
+        self.queue: queue.Queue = queue.Queue(queue_size)
+        self.filter = EventFilter()
+        self.handler = _DroppingQueueHandler(self.queue)
+        self.handler.addFilter(self.filter)
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+        self.listener = logging.handlers.QueueListener(self.queue, output)
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.logger.setLevel(_level(level))
+        self.logger.propagate = False
+        self._running = False
+
+    def start(self) -> None:
+        if not self._running:
+            self._running = True
+            self.logger.addHandler(self.handler)
+            self.listener.start()
+
+    def stop(self) -> None:
+        """Escreve o que ainda está na fila e para a thread"""
+        if self._running:
+            self._running = False
+            self.logger.removeHandler(self.handler)
+            self.listener.stop()
+
+    def configure(self, level: Optional[str] = None, levels: Optional[Dict[str, str]] = None,
+                  sample: Optional[Dict[str, float]] = None,
+                  rate_limit: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """Muda níveis (global e por componente), amostragem e limites em tempo de execução"""
+        if level is not None:
+            self.logger.setLevel(_level(level))
+        for component, component_level in (levels or {}).items():
+            logging.getLogger(f'{LOGGER_NAME}.{component}').setLevel(_level(component_level))
+        self.filter.configure(sample, rate_limit)
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'format': self.format,
+            'level': logging.getLevelName(self.logger.level),
+            'levels': {
+                name[len(LOGGER_NAME) + 1:]: logging.getLevelName(logger.level)
+                for name, logger in logging.root.manager.loggerDict.items()
+                if name.startswith(LOGGER_NAME + '.') and isinstance(logger, logging.Logger)
+                and logger.level != logging.NOTSET
+            },
+            'sample': dict(self.filter.sample),
+            'rateLimit': dict(self.filter.rate_limit),
+            'queued': self.queue.qsize(),
+            'dropped': self.handler.dropped,
+            'sampledOut': dict(self.filter.sampled_out),
+            'rateLimited': dict(self.filter.rate_limited),
+        }
+
+
+def _level(name: str) -> int:
+    name = name.upper()
+    if name not in LOG_LEVELS:
+        raise ValueError(f"nível deve ser um de {LOG_LEVELS}")
+    return getattr(logging, name)
+
+
+def parse_event_map(value: Optional[str]) -> Dict[str, float]:
+    """'evento=valor,evento=valor' (LOG_SAMPLE e LOG_RATE_LIMIT) -> dict"""
+    result: Dict[str, float] = {}
+    for item in (value or '').split(','):
+        if item.strip():
+            event, _, number = item.partition('=')
+            result[event.strip()] = float(number)
+    return result
+
+
+_pipeline: Optional[LogPipeline] = None
+_lock = threading.Lock()
+
+
+def setup_logging(fmt: str = 'text', level: str = 'INFO', queue_size: int = DEFAULT_QUEUE_SIZE,
+                  sample: Optional[Dict[str, float]] = None,
+                  rate_limit: Optional[Dict[str, float]] = None,
+                  stream: Optional[TextIO] = None) -> LogPipeline:
+    """Liga a fila e a thread de escrita do processo (uma vez só; chamadas seguintes devolvem a mesma)
+
+    `stream` troca a saída (padrão: stdout)."""
+    global _pipeline
+    with _lock:
+        if _pipeline is None:
+            _pipeline = LogPipeline(fmt, level, queue_size, stream)
+            _pipeline.filter.configure(sample, rate_limit)
+            _pipeline.start()
+            atexit.register(_pipeline.stop)
+        return _pipeline
+
+
+def get_pipeline() -> LogPipeline:
+    """Pipeline do processo (criada com os padrões se ninguém chamou setup_logging)"""
+    return _pipeline or setup_logging()
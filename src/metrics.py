@@ -0,0 +1,313 @@
+"""
+Métricas no formato texto do Prometheus (endpoint /metrics)
+Implementação mínima, sem dependências: contadores, gauges e histogramas
+com buckets fixos. Registrar uma observação custa uma busca binária e
+algumas somas, então a instrumentação pode ficar ligada em produção.
+"""
+import bisect
+import math
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Buckets (segundos) para latências: de 0,5 ms a 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Buckets (segundos) para durações longas (posse do token, eleições)
+DURATION_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        # Métricas sem labels têm uma única série, criada já exportando zero
+        self._unlabeled = self.labels() if not self.labelnames else None
+
+    def labels(self, *values):
+        """Série com os valores de label dados (criada na primeira vez)"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: esperados labels {self.labelnames}")
+            child = self._new_child()
+            self._children[key] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        lines.extend(self._samples())
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    """Contador monotônico"""
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._unlabeled.inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}'
+            for key, child in self._children.items()
+        ]
+
+
+class _GaugeChild:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Lê o valor de `function` só na hora de exportar (custo zero no caminho quente)"""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    """Valor instantâneo"""
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._unlabeled.set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._unlabeled.set_function(function)
+
+    def _samples(self) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}'
+            for key, child in self._children.items()
+        ]
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """Histograma com buckets fixos"""
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._unlabeled.observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        bucket_labels = self.labelnames + ('le',)
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                labels = _format_labels(bucket_labels, key + (_format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(child.sum)}')
+            lines.append(f'{self.name}_count{labels} {child.count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Conjunto de métricas exportadas juntas"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, skip: Sequence[str] = ()) -> str:
+        """Texto do Prometheus de todas as métricas, menos as de nome em `skip`"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            if metric.name not in skip:
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class HttpMetricsMiddleware:
+    """Middleware ASGI que mede a latência de cada requisição por rota e status"""
+
+    def __init__(self, app, metrics: 'Metrics'):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # O roteador grava a rota no scope; usa o template para limitar a cardinalidade
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            self.metrics.http_request_duration.labels(scope['method'], route, status).observe(
+                time.perf_counter() - start
+            )
+
+
+class Metrics:
+    """Métricas de um nó, compartilhadas pelo servidor e pelos serviços"""
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        r = self.registry.register
+
+        self.http_request_duration = r(Histogram(
+            'http_request_duration_seconds', 'Latência das requisições HTTP atendidas',
+            ('method', 'route', 'status')))
+
+        self.event_loop_lag = r(Histogram(
+            'event_loop_lag_seconds', 'Atraso do event loop em relação ao intervalo de medição'))
+        self.event_loop_stalls = r(Counter(
+            'event_loop_stalls_total', 'Travamentos do event loop acima do limite'))
+
+        self.multicast_holdback_depth = r(Gauge(
+            'multicast_holdback_depth', 'Mensagens na fila de espera (hold-back)'))
+        self.multicast_delivered = r(Counter(
+            'multicast_delivered_total', 'Mensagens entregues, por ordem de entrega', ('order',)))
+        self.multicast_shed = r(Counter(
+            'multicast_shed_total',
+            'Mensagens sem ACK não enviadas a um peer com a fila cheia (anti-entropia recupera)',
+            ('peer',)))
+        self.multicast_skipped = r(Counter(
+            'multicast_skipped_total',
+            'Mensagens abandonadas pela anti-entropia (fora do histórico dos peers), por remetente',
+            ('sender',)))
+        self.multicast_duplicates = r(Counter(
+            'multicast_duplicates_total', 'Mensagens e ACKs repetidos descartados na recepção',
+            ('kind',)))
+        self.multicast_delivery_delay = r(Histogram(
+            'multicast_delivery_delay_seconds',
+            'Tempo entre a chegada da mensagem e a entrega, por ordem de entrega', ('order',)))
+
+        self.multicast_peer_queue_depth = r(Gauge(
+            'multicast_peer_queue_depth', 'Itens na fila de saída de cada peer (buffer + em voo)',
+            ('peer',)))
+        self.multicast_peer_retries = r(Counter(
+            'multicast_peer_retries_total', 'Lotes reenviados a cada peer após falha',
+            ('peer',)))
+        self.multicast_peer_dropped = r(Counter(
+            'multicast_peer_dropped_total',
+            'Itens de lotes descartados por erro não transitório (ex.: 4xx, codificação)',
+            ('peer',)))
+
+        self.wal_fsync = r(Histogram(
+            'wal_fsync_duration_seconds', 'Duração de cada write + fsync em grupo do WAL'))
+        self.wal_rejected = r(Counter(
+            'wal_rejected_total', 'Operações recusadas com o buffer do WAL cheio (disco falhando)'))
+
+        self.peer_request_duration = r(Histogram(
+            'peer_request_duration_seconds', 'RTT das chamadas HTTP para outros processos',
+            ('peer', 'path')))
+        self.peer_request_errors = r(Counter(
+            'peer_request_errors_total', 'Chamadas para outros processos que falharam',
+            ('peer', 'path')))
+
+        self.mutex_token_hold = r(Histogram(
+            'mutex_token_hold_seconds', 'Tempo com o token entre recebê-lo e passá-lo adiante',
+            buckets=DURATION_BUCKETS))
+        self.mutex_token_rotation = r(Histogram(
+            'mutex_token_rotation_seconds', 'Intervalo entre duas chegadas do token neste processo',
+            buckets=DURATION_BUCKETS))
+
+        self.lock_wait = r(Histogram(
+            'lock_acquire_wait_seconds', 'Espera até a concessão de um lock nomeado',
+            buckets=DURATION_BUCKETS))
+
+        self.elections = r(Counter(
+            'elections_total', 'Eleições iniciadas por este processo'))
+        self.coordinator_suspicions = r(Counter(
+            'coordinator_suspicions_total', 'Vezes em que o detector de falhas suspeitou do coordenador'))
+        self.election_duration = r(Histogram(
+            'election_duration_seconds', 'Duração das eleições iniciadas por este processo',
+            buckets=DURATION_BUCKETS))
+        self.election_messages = r(Histogram(
+            'election_messages', 'Mensagens enviadas por este processo em cada eleição',
+            buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)))
+
+    def render(self) -> str:
+        return self.registry.render()
@@ -1,16 +1,45 @@
 # Definição de tipos e estruturas de dados para o sistema distribuído
-from dataclasses import dataclass, field
-from typing import Literal, Optional, Set
+from dataclasses import dataclass
+from typing import Any, Dict, List, Literal, Optional
 
+# Ordem de entrega de uma mensagem do multicast:
+# 'total' (Lamport + ACKs de todos), 'causal' (relógio vetorial), 'fifo' (por remetente)
+# ou 'sequencer' (ordem total numerada pelo coordenador eleito, sem ACKs)
+DeliveryOrder = Literal['total', 'causal', 'fifo', 'sequencer']
+DELIVERY_ORDERS = ('total', 'causal', 'fifo', 'sequencer')
 
-@dataclass
+
+@dataclass(slots=True)
 class Message:
-    """Mensagem do sistema de multicast"""
+    """Mensagem do sistema de multicast
+
+    Usa __slots__ e guarda os ACKs como bitmask (bit i = processo i)
+    para reduzir a memória por mensagem em trânsito."""
     id: str
     processId: int
     timestamp: int
     content: str
-    acks: Set[int] = field(default_factory=set)
+    acks: int = 0
+    # Número de sequência por remetente (1, 2, 3, ...); 0 = desconhecido
+    seq: int = 0
+    # Instante (time.monotonic) em que a mensagem entrou na fila de espera
+    received_at: float = 0.0
+    order: DeliveryOrder = 'total'
+    # 'causal'/'fifo': relógio vetorial do remetente no envio (ver MulticastService)
+    vclock: Optional[List[int]] = None
+    # 'sequencer': [sequenciador, mandato, gseq, base] (ver SequencerService); None = sem número
+    sequence: Optional[List[int]] = None
+    # Chegou pela anti-entropia em vez do envio original
+    recovered: bool = False
+    # 'total': entregue depois de uma mensagem posterior na ordem total (recuperada tarde)
+    outOfOrder: bool = False
+
+    def add_ack(self, process_id: int) -> None:
+        self.acks |= 1 << process_id
+
+    def ack_list(self) -> List[int]:
+        """IDs dos processos que já confirmaram a mensagem"""
+        return [pid for pid in range(self.acks.bit_length()) if self.acks >> pid & 1]
 
 
 @dataclass
@@ -33,6 +62,17 @@ class MutexGrant:
     coordinatorId: int
 
 
+@dataclass
+class LockGrant:
+    """Concessão de um lock nomeado (lease com fencing token)"""
+    name: str
+    owner: str
+    fencingToken: int
+    leaseMs: int
+    # Expiração do lease em tempo Unix (segundos)
+    expiresAt: float
+
+
 @dataclass
 class MulticastStatus:
     """Status do serviço de multicast"""
@@ -40,6 +80,26 @@ class MulticastStatus:
     logicalClock: int
     messageQueueSize: int
     deliveredCount: int
+    # Maior fila de saída entre os peers (itens ainda não confirmados)
+    outboundQueueDepth: int = 0
+    # Mensagens 'causal'/'fifo' aguardando dependências
+    causalQueueSize: int = 0
+    # Maior seq 'causal'/'fifo' entregue de cada remetente
+    vectorClock: Optional[List[int]] = None
+    defaultOrder: DeliveryOrder = 'total'
+    deliveredByOrder: Optional[Dict[str, int]] = None
+    # Cópias repetidas descartadas na recepção ('message' e 'ack')
+    duplicatesDropped: Optional[Dict[str, int]] = None
+    # Mensagens sem ACK não enviadas a um peer com a fila cheia (recuperadas por anti-entropia)
+    shedByPeer: Optional[Dict[str, int]] = None
+    # Entregas de mensagens recuperadas por anti-entropia, por ordem
+    recoveredByOrder: Optional[Dict[str, int]] = None
+    # Mensagens 'total' recuperadas entregues fora da ordem total
+    deliveredOutOfOrder: int = 0
+    # Sequências de cada remetente abandonadas (não retidas em nenhum peer consultado)
+    skippedBySender: Optional[Dict[str, int]] = None
+    # Estado da ordem 'sequencer' (mandato, base, entregues, filas)
+    sequencer: Optional[Dict[str, Any]] = None
 
 
 @dataclass
@@ -49,6 +109,8 @@ class ElectionStatus:
     coordinatorId: Optional[int]
     isCoordinator: bool
     electionInProgress: bool
+    electionEpoch: int = 0
+    lastElectionMessages: int = 0
 
 
 @dataclass
@@ -1,47 +1,988 @@
-from typing import List, Dict, Any
-from .models import Message, MulticastStatus
+"""
+Serviço de Multicast com Ordenação Total usando Relógio de Lamport
+Q1 - Todos os processos entregam as mensagens na mesma ordem
+
+Cada mensagem escolhe a ordem de entrega:
+- 'total': Lamport + ACKs de todos; mesma ordem em todos os processos
+- 'causal': relógio vetorial; entregue assim que as dependências causais
+  (mensagens 'causal'/'fifo' entregues pelo remetente antes do envio) forem
+  entregues aqui, sem ACKs
+- 'fifo': só a ordem de envio de cada remetente, sem ACKs
+- 'sequencer': ordem total numerada pelo coordenador eleito, sem ACKs
+  (ver src/sequencer.py); exige a eleição
+Sem ACKs a entrega custa um salto de rede em vez de uma rodada completa.
+Entre mensagens de ordens diferentes não há garantia de ordem.
+"""
 import asyncio
+import heapq
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Dict, Any, Iterable, Optional, Set, Tuple
+from .dissemination import Dissemination
+from .election import ElectionService
+from .logs import EventLog
+from .metrics import Metrics
+from .models import DELIVERY_ORDERS, DeliveryOrder, Message, MulticastStatus
+from .outbox import (DEFAULT_MAX_IN_FLIGHT, DEFAULT_QUEUE_LIMIT, LINK_HEADER, Backpressure,
+                     LinkReceiver, PeerOutbox)
+from .sequencer import DEFAULT_RESUBMIT_INTERVAL, SequencerService
+from .store import DEFAULT_HISTORY_SIZE, DEFAULT_STABLE_IDS, DeliveredLog, StableIds
+from .stream import DeliveryStream, Subscription
+from .sync import SeenIndex, SenderWatermark
+from .transport import PeerTransport
+from .wal import (REC_ACK, REC_CAUSAL, REC_CAUSAL_HISTORY, REC_DELIVER, REC_EARLY_ACK,
+                  REC_HISTORY, REC_MESSAGE, REC_PENDING, REC_SEEN, REC_SEQUENCER, REC_STATE,
+                  REC_VECTOR, Record, WriteAheadLog)
+from . import wire
+
+# Atraso aplicado ao ACK das mensagens marcadas via /multicast/delay-ack
+ACK_DELAY_SECONDS = 5.0
+
+# Janela (segundos) e tamanho máximo dos lotes enviados a cada peer
+DEFAULT_BATCH_WINDOW = 0.005
+DEFAULT_BATCH_MAX_SIZE = 100
+
+# Caminhos dos lotes por tipo
+BATCH_PATHS = {'messages': '/msg/batch', 'acks': '/ack/batch'}
+
+
+class SendSeqUnknown(Exception):
+    """Nenhum peer confirmou a sequência de envio (reinício sem estado); tente de novo"""
+
 
 class MulticastService:
-    def __init__(self, process_id: int, total_processes: int, peers: List[str]):
+    """Implementa multicast com ordenação total (Lamport + ACKs ou sequenciador), causal ou FIFO"""
+
+    def __init__(self, process_id: int, total_processes: int, peers: List[str],
+                 transport: Optional[PeerTransport] = None,
+                 batch_window: float = DEFAULT_BATCH_WINDOW,
+                 batch_max_size: int = DEFAULT_BATCH_MAX_SIZE,
+                 history_size: int = DEFAULT_HISTORY_SIZE,
+                 wire_format: str = 'json',
+                 metrics: Optional[Metrics] = None,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 peer_queue_limit: int = DEFAULT_QUEUE_LIMIT,
+                 wal: Optional[WriteAheadLog] = None,
+                 dissemination: Optional[Dissemination] = None,
+                 default_order: DeliveryOrder = 'total',
+                 dedup_window: int = DEFAULT_STABLE_IDS,
+                 election: Optional[ElectionService] = None,
+                 sequencer_interval: float = DEFAULT_RESUBMIT_INTERVAL):
         self.process_id = process_id
+        self.log = EventLog(process_id, 'multicast')
         self.total_processes = total_processes
         self.peers = peers
+        self.transport = transport or PeerTransport(peers)
+        self.metrics = metrics or Metrics()
+        self.metrics.multicast_holdback_depth.set_function(self.undelivered_count)
+        self._delivered_metrics = {
+            order: (self.metrics.multicast_delivered.labels(order),
+                    self.metrics.multicast_delivery_delay.labels(order))
+            for order in DELIVERY_ORDERS
+        }
+        self.batch_window = batch_window
+        self.batch_max_size = batch_max_size
+        # 'json' ou 'binary' (ver src/wire.py) para os lotes entre processos
+        self.wire_format = wire_format
+        self.max_in_flight = max_in_flight
+        self.peer_queue_limit = peer_queue_limit
+        # Para quem enviar (ou repassar) mensagens e ACKs de cada origem
+        self.dissemination = dissemination or Dissemination(total_processes)
+        self._outboxes: Dict[int, PeerOutbox] = {}
+        # Identifica esta execução nos links: um reinício zera as sequências
+        self.incarnation = time.time_ns()
+        # Reordena os lotes recebidos de cada remetente
+        self.links = LinkReceiver()
+        if default_order not in DELIVERY_ORDERS:
+            raise ValueError(f"ordem deve ser uma de {DELIVERY_ORDERS}")
+        # Ordem das mensagens enviadas sem ordem explícita
+        self.default_order = default_order
         self.logical_clock = 0
-        self.message_queue = []
+        # Relógio vetorial: maior seq 'causal'/'fifo' entregue de cada remetente
+        self.vector: List[int] = [0] * total_processes
+        # Sequência das mensagens enviadas por este processo (1, 2, 3, ...)
+        self.send_seq = 0
+        # Sem estado recuperado, um reinício recomeçaria do 0 e repetiria (remetente, seq)
+        # que os peers já viram (descartadas como duplicatas): o primeiro envio espera
+        # `confirm_send_seq` (resumos da anti-entropia) trazer o que eles viram daqui
+        self.send_seq_confirmed = total_processes == 1
+        self.confirm_send_seq: Optional[Callable[[], Awaitable[bool]]] = None
+        self._confirming: Optional[asyncio.Future] = None
+        # (remetente, seq) de todas as mensagens já vistas (anti-entropia e duplicatas)
+        self.seen = SeenIndex()
+        # Fila de espera (hold-back) ordenada por (timestamp, processId)
+        self.message_queue: List[Tuple[int, int, str]] = []
+        # Mensagens ainda não entregues, indexadas por message_id
+        self.pending: Dict[str, Message] = {}
+        # ACKs (bitmask) que chegaram antes da própria mensagem; no máximo
+        # `dedup_window` (os mais antigos são descartados)
+        self.early_acks: Dict[str, int] = OrderedDict()
+        self.dedup_window = dedup_window
+        # Ids das últimas mensagens entregues: cópias e ACKs repetidos são descartados
+        self.stable_ids = StableIds(dedup_window)
+        self.duplicates = dict.fromkeys(('message', 'ack'), 0)
+        self._duplicate_metrics = {
+            kind: self.metrics.multicast_duplicates.labels(kind) for kind in self.duplicates
+        }
+        # Mensagens 'causal'/'fifo' aguardando dependências: por id e, por
+        # remetente, um heap de (seq, id) (só a menor seq de cada um pode ser a próxima)
+        self.causal_pending: Dict[str, Message] = {}
+        self.causal_queue: Dict[int, List[Tuple[int, str]]] = {}
+        # Bitmask com o ACK de todos os processos
+        self._all_acks = (1 << total_processes) - 1
+        # Mensagens estáveis (entregues) em um anel de tamanho fixo
+        self.history = DeliveredLog(history_size)
+        # Assinantes de /multicast/stream
+        self.stream = DeliveryStream()
         self.delivered_count = 0
+        # Entregas desde o início do processo, por ordem
+        self.delivered_by_order = dict.fromkeys(DELIVERY_ORDERS, 0)
+        # Anti-entropia: entregas recuperadas, as 'total' fora de ordem e as sequências
+        # abandonadas por remetente; (timestamp, processId) da maior entrega 'total'
+        self.recovered_by_order = dict.fromkeys(DELIVERY_ORDERS, 0)
+        self.out_of_order = 0
+        self.skipped: Dict[int, int] = {}
+        self.total_head: Tuple[int, int] = (-1, -1)
+        self.delayed_acks: Set[str] = set()
+        # Mensagens sem ACK deixadas de fora por peer com a fila cheia (e quem está de fora agora)
+        self.shed: Dict[int, int] = {}
+        self.shedding: Set[int] = set()
+        # Ordem 'sequencer': numeração pelo coordenador da eleição (sem eleição, indisponível)
+        self.sequencer = (SequencerService(self, election, sequencer_interval)
+                          if election is not None else None)
+        # Log durável opcional: o estado acima é reconstruído dele no reinício
+        self.wal = wal
+        if wal is not None:
+            wal.snapshot_source = self._snapshot_records
+            self._restore()
+
+    async def send_message(self, content: str, order: Optional[DeliveryOrder] = None) -> Message:
+        """Envia mensagem para todos os processos (incluindo ele mesmo)
+
+        `order` escolhe a ordem de entrega (padrão: default_order).
+        Levanta Backpressure se a fila de um peer de quem a entrega depende
+        estiver cheia (ver _check_backpressure)."""
+        return (await self.send_messages([content], order))[0]
+
+    async def send_messages(self, contents: List[str],
+                            order: Optional[DeliveryOrder] = None) -> List[Message]:
+        """Envia várias mensagens de uma vez, com timestamps e seqs contíguos
+
+        O bloco inteiro recebe os timestamps em um passo, vai ao WAL com um só
+        commit e segue para cada peer em um único lote."""
+        order = order or self.default_order
+        if order not in DELIVERY_ORDERS:
+            raise ValueError(f"ordem deve ser uma de {DELIVERY_ORDERS}")
+        for content in contents:
+            # Recusado aqui, e não no lote: um lote que não codifica travaria o link do peer
+            _check_content(content)
+        if order == 'sequencer' and self.sequencer is None:
+            raise ValueError("ordem 'sequencer' requer a eleição")
+        if not self.send_seq_confirmed:
+            await self._confirm_send_seq()
+        self._check_backpressure(order)
+        self._admit()
+        first_clock, first_seq = self.logical_clock + 1, self.send_seq + 1
+        self.logical_clock += len(contents)
+        self.send_seq += len(contents)
+        # Dependências: tudo que este processo já entregou ('fifo' só olha a própria entrada);
+        # dentro do bloco, cada mensagem depende da anterior
+        vclock = list(self.vector)
+        messages = []
+        for offset, content in enumerate(contents):
+            msg = Message(
+                # A encarnação separa os ids de execuções que recomeçaram o relógio
+                id=f"msg-{self.process_id}-{self.incarnation}-{first_clock + offset}",
+                processId=self.process_id,
+                timestamp=first_clock + offset,
+                content=content,
+                seq=first_seq + offset,
+                order=order
+            )
+            if order == 'total':
+                self._enqueue(msg)
+            elif order != 'sequencer':
+                msg.vclock = list(vclock)
+                vclock[self.process_id] = msg.seq
+                self._enqueue_causal(msg)
+            messages.append(msg)
+
+        if order == 'sequencer':
+            # Vão ao coordenador, que numera e difunde
+            self.sequencer.submit(messages)
+            if self.wal is not None:
+                await self.wal.sync()
+            return messages
+
+        self.send_to(self._outboxes_for(self.process_id), [self.to_payload(msg) for msg in messages],
+                     order)
+        if order == 'total':
+            for msg in messages:
+                self._ack(msg)
+        else:
+            self._try_deliver_causal()
+        if self.wal is not None:
+            # Só confirma ao cliente depois que as mensagens (e o relógio) estão no disco
+            await self.wal.sync()
+        return messages
+
+    def receive_message(self, data: Dict[str, Any]) -> None:
+        """Recebe mensagem via endpoint /msg e envia o ACK"""
+        self._admit()
+        self._receive_message(data)
+
+    def _receive_message(self, data: Dict[str, Any]) -> None:
+        self.logical_clock = max(self.logical_clock, data['timestamp']) + 1
+        msg = self.from_payload(data)
+        if msg.order == 'sequencer':
+            # Numeração e duplicatas por gseq (uma renumerada repete o (remetente, seq))
+            if self.sequencer is not None:
+                self.sequencer.receive(msg)
+            return
+        # Repassa na árvore da origem mesmo se já a tiver (pode ter vindo por anti-entropia)
+        relay = self._outboxes_for(msg.processId)
+        if relay:
+            self.send_to(relay, [self.to_payload(msg)], msg.order)
+        if (msg.id in self.pending or msg.id in self.causal_pending or msg.id in self.stable_ids
+                or (msg.seq and (msg.processId, msg.seq) in self.seen)):
+            self.count_duplicate('message')
+            return
+        if msg.order != 'total':
+            self._enqueue_causal(msg)
+            self._try_deliver_causal()
+            return
+        self._enqueue(msg)
+        if msg.id in self.delayed_acks:
+            asyncio.create_task(self._delayed_ack(msg))
+        else:
+            self._ack(msg)
+
+    def receive_message_batch(self, messages: List[Dict[str, Any]],
+                              link: Optional[Tuple[int, int, int, int]] = None) -> None:
+        """Recebe um lote de mensagens via endpoint /msg/batch (na ordem do link)"""
+        self._admit()
+        if link is not None:
+            self.links.accept(link, lambda: self._receive_message_batch(messages))
+            return
+        self._receive_message_batch(messages)
+
+    def _receive_message_batch(self, messages: List[Dict[str, Any]]) -> None:
+        for data in messages:
+            self._receive_message(data)
+
+    def receive_ack(self, data: Dict[str, Any]) -> None:
+        """Recebe ACK via endpoint /ack e tenta entregar a cabeça da fila"""
+        self._admit()
+        self.logical_clock = max(self.logical_clock, data['timestamp']) + 1
+        self._receive_ack(data)
+        self._try_deliver()
+
+    def receive_ack_batch(self, acks: List[Dict[str, Any]],
+                          link: Optional[Tuple[int, int, int, int]] = None) -> None:
+        """Recebe um lote de ACKs via endpoint /ack/batch (na ordem do link)"""
+        self._admit()
+        if link is not None:
+            self.links.accept(link, lambda: self._receive_ack_batch(acks))
+            return
+        self._receive_ack_batch(acks)
+
+    def _receive_ack_batch(self, acks: List[Dict[str, Any]]) -> None:
+        for data in acks:
+            self.logical_clock = max(self.logical_clock, data['timestamp']) + 1
+            self._receive_ack(data)
+        self._try_deliver()
+
+    def receive_synced(self, messages: List[Dict[str, Any]]) -> int:
+        """Aplica mensagens recuperadas por anti-entropia; retorna quantas eram novas
+
+        Os ACKs que vêm junto são somados aos locais. O próprio ACK só é
+        enviado se ainda faltar na cópia recebida: sem ele ninguém pode ter
+        entregue a mensagem, e com ele os peers já a conhecem. Mensagens
+        'causal'/'fifo' não têm ACKs: só entram na fila de dependências.
+
+        As novas são marcadas como recuperadas (`recovered` no stream e
+        `recoveredByOrder` no status); uma 'total' que chega depois de uma
+        posterior já entregue sai também com `outOfOrder`."""
+        self._admit()
+        count = 0
+        for data in messages:
+            self.logical_clock = max(self.logical_clock, data['timestamp']) + 1
+            key = (data['id_processo'], data.get('seq', 0))
+            if data.get('order') == 'sequencer':
+                if self.sequencer is not None and data.get('sequence'):
+                    msg = self.from_payload(data)
+                    msg.recovered = True
+                    if self.sequencer.receive(msg, relay=False):
+                        count += 1
+                continue
+            if data.get('order', 'total') != 'total':
+                if key[1] and key not in self.seen:
+                    msg = self.from_payload(data)
+                    msg.recovered = True
+                    self._enqueue_causal(msg)
+                    count += 1
+                continue
+            msg = self.pending.get(data['message_id'])
+            if msg is None:
+                if not key[1] or key in self.seen:
+                    continue
+                msg = self.from_payload(data)
+                msg.recovered = True
+                self._enqueue(msg)
+                count += 1
+            missing = data.get('acks', 0) & ~msg.acks
+            for process_id in range(self.total_processes):
+                if missing >> process_id & 1:
+                    self._record_ack(msg.id, process_id)
+            if not msg.acks >> self.process_id & 1:
+                self._ack(msg)
+        self._try_deliver()
+        self._try_deliver_causal()
+        return count
+
+    def skip_unavailable(self, process_id: int, first: int, last: int) -> None:
+        """Desiste das mensagens `first`..`last` de `process_id` (fora do histórico dos peers)
+
+        O intervalo é contado em `skippedBySender` e anunciado no stream como
+        evento "skipped". Sem isso as mensagens 'causal'/'fifo' que dependem
+        delas esperariam para sempre."""
+        self.seen.skip(process_id, first, last)
+        count = last - first + 1
+        self.skipped[process_id] = self.skipped.get(process_id, 0) + count
+        self.metrics.multicast_skipped.labels(process_id).inc(count)
+        self.stream.publish_skipped(process_id, first, last)
+        if 0 <= process_id < self.total_processes and self.vector[process_id] < last:
+            self.vector[process_id] = last
+            self._try_deliver_causal()
+
+    def adopt_send_seq(self, seq: int) -> None:
+        """Continua a numeração de envio vista por um peer (reinício sem WAL)
+
+        Chamado a cada resumo trocado com um peer; o primeiro confirma a
+        sequência e libera os envios."""
+        self.send_seq_confirmed = True
+        if seq > self.send_seq:
+            self.log.info('send_seq_adopted', "🔢 Sequência de envio ajustada para {seq}", seq=seq)
+            self.send_seq = seq
+
+    async def _confirm_send_seq(self) -> None:
+        """Espera um peer informar o que já viu deste processo; SendSeqUnknown se nenhum responder
+
+        Envios simultâneos esperam a mesma rodada."""
+        if self.confirm_send_seq is None:
+            self.send_seq_confirmed = True
+            return
+        if self._confirming is None or self._confirming.done():
+            self._confirming = asyncio.ensure_future(self.confirm_send_seq())
+        await asyncio.shield(self._confirming)
+        if not self.send_seq_confirmed:
+            raise SendSeqUnknown("nenhum peer confirmou a sequência de envio após o reinício")
+
+    def _admit(self) -> None:
+        """Recusa a operação (WALError) se o WAL acumula escrita demais sem gravar
+
+        Vem antes de qualquer mudança de estado. Nos lotes de peers vira 503,
+        e o remetente reenvia quando o disco voltar."""
+        if self.wal is not None:
+            self.wal.admit()
+
+    def forward(self, peers: Iterable[int], messages: List[Message]) -> None:
+        """Envia mensagens já formadas a `peers` pelas caixas de saída (via send_to)
+
+        Usado pela ordem 'sequencer': submissões ao coordenador, a difusão das
+        numeradas e o repasse na árvore do sequenciador."""
+        if messages:
+            self.send_to([self._outbox(peer_id) for peer_id in peers],
+                         [self.to_payload(msg) for msg in messages], messages[0].order)
+
+    def is_duplicate(self, msg: Message) -> bool:
+        """True se a mensagem já foi entregue ou vista (pelo (remetente, seq))"""
+        return msg.id in self.stable_ids or bool(msg.seq and (msg.processId, msg.seq) in self.seen)
+
+    def accept_ordered(self, msg: Message) -> bool:
+        """Entrega uma mensagem cuja vez foi decidida fora daqui (ordem 'sequencer')
+
+        Registra a entrega no WAL; uma mensagem já entregue (renumerada sem a
+        cópia definitiva) só é contada como repetida. True se foi entregue."""
+        if self.wal is not None:
+            self.wal.append((REC_DELIVER, self.logical_clock, msg.id))
+        if msg.id in self.stable_ids:
+            self.count_duplicate('message')
+            return False
+        self._deliver(msg)
+        return True
+
+    def set_delay_for_message(self, message_id: str) -> None:
+        """Marca uma mensagem para ter o ACK atrasado (teste)"""
+        self.delayed_acks.add(message_id)
+
+    def _enqueue(self, msg: Message) -> None:
+        """Insere a mensagem na fila de espera em O(log n)"""
+        if self.wal is not None:
+            self.wal.append((REC_MESSAGE, self.logical_clock, msg.processId, msg.timestamp,
+                             msg.seq, msg.id, msg.content))
+        if msg.seq:
+            self.seen.add(msg.processId, msg.seq)
+        msg.acks |= self.early_acks.pop(msg.id, 0)
+        msg.received_at = time.monotonic()
+        self.pending[msg.id] = msg
+        heapq.heappush(self.message_queue, (msg.timestamp, msg.processId, msg.id))
+
+    def _enqueue_causal(self, msg: Message) -> None:
+        """Coloca uma mensagem 'causal'/'fifo' na fila de dependências"""
+        if self.wal is not None:
+            self.wal.append((REC_CAUSAL, self.logical_clock, msg.processId, msg.timestamp, msg.seq,
+                             DELIVERY_ORDERS.index(msg.order), msg.vclock, msg.id, msg.content))
+        if msg.seq:
+            self.seen.add(msg.processId, msg.seq)
+        msg.received_at = time.monotonic()
+        self.causal_pending[msg.id] = msg
+        heapq.heappush(self.causal_queue.setdefault(msg.processId, []), (msg.seq, msg.id))
+
+    def _causal_ready(self, msg: Message) -> bool:
+        """Já foram entregues aqui as dependências da mensagem?
 
-    async def send_message(self, content: str) -> Message:
+        'fifo': a mensagem anterior do remetente; 'causal': também tudo que o
+        remetente tinha entregue de cada um dos outros processos."""
+        vector, sender = self.vector, msg.processId
+        if vector[sender] < msg.vclock[sender]:
+            return False
+        if msg.order == 'fifo':
+            return True
+        return all(have >= need for have, need in zip(vector, msg.vclock))
+
+    def _try_deliver_causal(self) -> None:
+        """Entrega as mensagens 'causal'/'fifo' cujas dependências já foram entregues
+
+        Cada entrega pode liberar mensagens de outros remetentes, então repete
+        até uma passada sem entregas."""
+        progress = True
+        while progress and self.causal_pending:
+            progress = False
+            for sender, heap in list(self.causal_queue.items()):
+                while heap:
+                    msg = self.causal_pending[heap[0][1]]
+                    if not self._causal_ready(msg):
+                        break
+                    heapq.heappop(heap)
+                    del self.causal_pending[msg.id]
+                    self.vector[sender] = max(self.vector[sender], msg.seq)
+                    if self.wal is not None:
+                        self.wal.append((REC_DELIVER, self.logical_clock, msg.id))
+                    self._deliver(msg)
+                    progress = True
+                if not heap:
+                    del self.causal_queue[sender]
+
+    def _record_ack(self, message_id: str, process_id: int) -> None:
+        """Registra um ACK; repetidos (ou de mensagem já entregue) são descartados"""
+        bit = 1 << process_id
+        msg = self.pending.get(message_id)
+        if msg is not None:
+            known = msg.acks
+        elif message_id in self.stable_ids:
+            known = bit
+        else:
+            known = self.early_acks.get(message_id, 0)
+        if known & bit:
+            self.count_duplicate('ack')
+            return
+        if self.wal is not None:
+            self.wal.append((REC_ACK, self.logical_clock, process_id, message_id))
+        if msg is not None:
+            msg.acks |= bit
+            return
+        self.early_acks[message_id] = known | bit
+        if len(self.early_acks) > self.dedup_window:
+            # Mensagem que nunca chegou: a anti-entropia a traz com os ACKs
+            self.early_acks.popitem(last=False)
+
+    def count_duplicate(self, kind: str = 'message') -> None:
+        """Conta uma repetição descartada ('message' ou 'ack')"""
+        self.duplicates[kind] += 1
+        self._duplicate_metrics[kind].inc()
+
+    def _try_deliver(self) -> None:
+        """Entrega a cabeça da fila enquanto ela tiver ACK de todos os processos"""
+        while self.message_queue:
+            _, _, message_id = self.message_queue[0]
+            msg = self.pending[message_id]
+            if msg.acks != self._all_acks:
+                break
+            heapq.heappop(self.message_queue)
+            del self.pending[message_id]
+            if self.wal is not None:
+                self.wal.append((REC_DELIVER, self.logical_clock, message_id))
+            self._deliver(msg)
+
+    def _deliver(self, msg: Message) -> None:
+        """Entrega à aplicação: histórico, métricas e assinantes de /multicast/stream"""
+        self.stable_ids.add(msg.id)
+        seq = self.history.append(msg)
+        self.delivered_count += 1
+        self.delivered_by_order[msg.order] += 1
+        if msg.order == 'total':
+            position = (msg.timestamp, msg.processId)
+            if position < self.total_head:
+                msg.outOfOrder = True
+                self.out_of_order += 1
+                self.log.warning('delivered_out_of_order',
+                                 "⚠️ {id} recuperada entregue fora da ordem total (ts={timestamp})",
+                                 id=msg.id, timestamp=msg.timestamp)
+            else:
+                self.total_head = position
+        if msg.recovered:
+            self.recovered_by_order[msg.order] += 1
+        delivered, delay = self._delivered_metrics[msg.order]
+        delivered.inc()
+        delay.observe(time.monotonic() - msg.received_at)
+        self.stream.publish(seq, msg)
+        self.log.info('message_delivered', "📬 Entregou {id} (ts={timestamp}, {order})",
+                      id=msg.id, timestamp=msg.timestamp, order=msg.order)
+
+    def _ack(self, msg: Message) -> None:
+        """Registra o próprio ACK e o coloca na caixa de saída de cada peer"""
         self.logical_clock += 1
-        msg = Message(
-            id=f"msg-{self.process_id}-{self.logical_clock}",
-            processId=self.process_id,
-            timestamp=self.logical_clock,
-            content=content
+        ack = {
+            'message_id': msg.id,
+            'process_id': self.process_id,
+            'timestamp': self.logical_clock
+        }
+        if self.dissemination.mode == 'tree':
+            # Bitmask para os vizinhos poderem agrupar ACKs da mesma mensagem
+            ack['acks'] = 1 << self.process_id
+        self._record_ack(msg.id, self.process_id)
+        self._try_deliver()
+        for outbox in self._outboxes_for(self.process_id):
+            outbox.add_ack(ack)
+
+    def _receive_ack(self, data: Dict[str, Any]) -> None:
+        """Registra um ACK (ou um grupo deles, no modo 'tree') e o repassa na árvore"""
+        mask = data.get('acks') or 1 << data['process_id']
+        relay: Dict[int, int] = {}
+        while mask:
+            process_id = (mask & -mask).bit_length() - 1
+            mask &= mask - 1
+            self._record_ack(data['message_id'], process_id)
+            for peer_id in self.dissemination.targets(self.process_id, process_id):
+                relay[peer_id] = relay.get(peer_id, 0) | 1 << process_id
+        for peer_id, bits in relay.items():
+            self._outbox(peer_id).add_ack({
+                'message_id': data['message_id'],
+                'process_id': (bits & -bits).bit_length() - 1,
+                'timestamp': data['timestamp'],
+                'acks': bits
+            })
+
+    async def _delayed_ack(self, msg: Message) -> None:
+        """Envia o ACK de uma mensagem marcada via /multicast/delay-ack"""
+        self.delayed_acks.discard(msg.id)
+        self.log.info('ack_delayed', "⏸️ Atrasando ACK de {id}", id=msg.id)
+        await asyncio.sleep(ACK_DELAY_SECONDS)
+        self._ack(msg)
+
+    @staticmethod
+    def to_payload(msg: Message) -> Dict[str, Any]:
+        """Formato de /msg (e dos lotes de /msg/batch)"""
+        data = {
+            'id_processo': msg.processId,
+            'timestamp': msg.timestamp,
+            'conteudo': msg.content,
+            'message_id': msg.id,
+            'seq': msg.seq
+        }
+        if msg.order == 'sequencer':
+            data['order'] = msg.order
+            if msg.sequence is not None:
+                data['sequence'] = msg.sequence
+        elif msg.order != 'total':
+            data['order'] = msg.order
+            data['vclock'] = msg.vclock
+        return data
+
+    @staticmethod
+    def from_payload(data: Dict[str, Any]) -> Message:
+        """Mensagem a partir do formato de /msg"""
+        return Message(
+            id=data['message_id'],
+            processId=data['id_processo'],
+            timestamp=data['timestamp'],
+            content=data['conteudo'],
+            seq=data.get('seq', 0),
+            order=data.get('order', 'total'),
+            vclock=data.get('vclock'),
+            sequence=data.get('sequence')
         )
-        self.message_queue.append(msg)
-        self.delivered_count += 1
-        return msg
 
-    def receive_message(self, data: Dict[str, Any]):
-        # Simula recebimento de mensagem
-        pass
+    @classmethod
+    def to_sync_dict(cls, msg: Message) -> Dict[str, Any]:
+        """Formato de /sync/pull: o de /msg mais o bitmask de ACKs"""
+        data = cls.to_payload(msg)
+        data['acks'] = msg.acks
+        return data
+
+    def _outboxes_for(self, origin: int) -> List[PeerOutbox]:
+        """Caixas de saída dos peers que recebem deste processo o que veio de `origin`
+
+        Criadas sob demanda; no modo 'direct' só a origem envia, a todos."""
+        return [self._outbox(idx) for idx in self.peers_for(origin)]
+
+    def peers_for(self, origin: int) -> List[int]:
+        """Peers que recebem deste processo o que veio de `origin` (árvore ou todos)"""
+        return self.dissemination.targets(self.process_id, origin)
+
+    def _outbox(self, peer_id: int) -> PeerOutbox:
+        outbox = self._outboxes.get(peer_id)
+        if outbox is None:
+            outbox = self._outboxes[peer_id] = self._new_outbox(peer_id)
+        return outbox
+
+    def _new_outbox(self, peer_id: int) -> PeerOutbox:
+        retries = self.metrics.multicast_peer_retries.labels(peer_id)
+        outbox = PeerOutbox(
+            peer_id, self._post_batch, self.batch_window, self.batch_max_size,
+            sender_id=self.process_id,
+            incarnation=self.incarnation,
+            max_in_flight=self.max_in_flight,
+            queue_limit=self.peer_queue_limit,
+            on_retry=retries.inc,
+            on_drop=self.metrics.multicast_peer_dropped.labels(peer_id).inc,
+            # Nada sai para os peers antes de estar no WAL (group commit na janela do lote)
+            before_send=self.wal.sync if self.wal is not None else None
+        )
+        self.metrics.multicast_peer_queue_depth.labels(peer_id).set_function(lambda: outbox.depth)
+        return outbox
+
+    def _check_backpressure(self, order: DeliveryOrder) -> None:
+        """Recusa novos envios só quando a entrega depende do peer com a fila cheia
+
+        'total' precisa do ACK de todos, então qualquer peer cheio recusa;
+        'sequencer' depende só do coordenador. Nas demais um peer lento fica
+        de fora dos envios (send_to) e não atrasa os outros."""
+        if order == 'total':
+            outboxes = self._outboxes.values()
+        elif order == 'sequencer' and self.sequencer.coordinator not in (None, self.process_id):
+            outboxes = [self._outbox(self.sequencer.coordinator)]
+        else:
+            return
+        for outbox in outboxes:
+            if outbox.full:
+                # Estimativa de espera: o tempo de escoar a fila em lotes cheios
+                batches = outbox.depth / max(self.batch_max_size * self.max_in_flight, 1)
+                raise Backpressure(outbox.peer_id, outbox.depth, max(1.0, batches * self.batch_window))
+
+    def send_to(self, outboxes: List[PeerOutbox], payloads: List[Dict[str, Any]],
+                order: DeliveryOrder) -> None:
+        """Coloca mensagens nas caixas de saída (várias seguem juntas em um lote)
+
+        Sem ACKs ('causal', 'fifo', 'sequencer'), um peer com a fila cheia é
+        deixado de fora até ela escoar: as mensagens puladas chegam a ele pela
+        anti-entropia, e os demais peers seguem recebendo normalmente."""
+        for outbox in outboxes:
+            if order != 'total' and outbox.full:
+                self._shed(outbox, len(payloads))
+                continue
+            if outbox.peer_id in self.shedding:
+                self.shedding.discard(outbox.peer_id)
+                self.log.info('peer_resumed', "▶️ Fila do Processo {peer} escoou, voltando a enviar",
+                              peer=outbox.peer_id)
+            if len(payloads) == 1:
+                outbox.add_message(payloads[0])
+            else:
+                outbox.add_messages(payloads)
+
+    def _shed(self, outbox: PeerOutbox, count: int) -> None:
+        self.shed[outbox.peer_id] = self.shed.get(outbox.peer_id, 0) + count
+        self.metrics.multicast_shed.labels(outbox.peer_id).inc(count)
+        if outbox.peer_id not in self.shedding:
+            self.shedding.add(outbox.peer_id)
+            self.log.warning('peer_shed',
+                             "⏭️ Fila do Processo {peer} cheia ({depth} itens): pulando o peer, "
+                             "a anti-entropia o alcança depois",
+                             peer=outbox.peer_id, depth=outbox.depth)
 
-    def receive_ack(self, data: Dict[str, Any]):
-        # Simula recebimento de ACK
-        pass
+    def queue_depth(self) -> int:
+        """Maior fila de saída entre os peers (itens não confirmados)"""
+        return max((outbox.depth for outbox in self._outboxes.values()), default=0)
 
-    def set_delay_for_message(self, message_id: str):
-        # Simula atraso
-        pass
+    async def _post_batch(self, peer_id: int, kind: str, items: List[Dict[str, Any]],
+                          link: str) -> None:
+        """Envia o lote em JSON ou no formato binário, conforme wire_format
+
+        Levanta PeerError em falha; a caixa de saída reenvia o lote."""
+        path = BATCH_PATHS[kind]
+        headers = {LINK_HEADER: link}
+        if self.wire_format == 'binary':
+            encode = wire.encode_messages if kind == 'messages' else wire.encode_acks
+            await self.transport.post(peer_id, path, timeout=2, content=encode(items),
+                                      content_type=wire.CONTENT_TYPE, headers=headers)
+        else:
+            await self.transport.post(peer_id, path, {kind: items}, timeout=2, headers=headers)
+
+    # ==================== WAL ====================
+
+    def _snapshot_records(self) -> List[Record]:
+        """Estado completo como registros de snapshot do WAL"""
+        records: List[Record] = [
+            (REC_STATE, self.logical_clock, self.delivered_count, self.history.next_seq),
+            (REC_VECTOR, list(self.vector))
+        ]
+        items, _ = self.history.page(None, self.history.capacity)
+        for seq, msg in items:
+            if msg.order == 'total':
+                records.append((REC_HISTORY, seq, msg.processId, msg.timestamp, msg.seq, msg.id,
+                                msg.content, msg.acks))
+            else:
+                records.append((REC_CAUSAL_HISTORY, seq, msg.processId, msg.timestamp, msg.seq,
+                                DELIVERY_ORDERS.index(msg.order), _order_ints(msg), msg.id,
+                                msg.content))
+        for msg in self.pending.values():
+            records.append((REC_PENDING, msg.processId, msg.timestamp, msg.seq, msg.id,
+                            msg.content, msg.acks))
+        for msg in self.causal_pending.values():
+            records.append((REC_CAUSAL, self.logical_clock, msg.processId, msg.timestamp, msg.seq,
+                            DELIVERY_ORDERS.index(msg.order), msg.vclock, msg.id, msg.content))
+        if self.sequencer is not None:
+            records.extend(self.sequencer.snapshot_records(self.logical_clock))
+        for message_id, acks in self.early_acks.items():
+            records.append((REC_EARLY_ACK, message_id, acks))
+        # Vistas de cada remetente, inclusive as que já saíram do histórico
+        for process_id, watermark in self.seen.senders.items():
+            records.append((REC_SEEN, process_id, watermark.contiguous, sorted(watermark.extras)))
+        return records
+
+    def _restore(self) -> None:
+        """Reconstrói relógio, fila de espera e histórico a partir do WAL"""
+        started = time.perf_counter()
+        count = 0
+        now = time.monotonic()
+        for record in self.wal.recover():
+            count += 1
+            kind = record[0]
+            if kind == REC_MESSAGE:
+                _, clock, process_id, timestamp, seq, message_id, content = record
+                self.logical_clock = max(self.logical_clock, clock)
+                msg = Message(id=message_id, processId=process_id, timestamp=timestamp,
+                              content=content, seq=seq, received_at=now)
+                if seq:
+                    self.seen.add(process_id, seq)
+                msg.acks |= self.early_acks.pop(message_id, 0)
+                self.pending[message_id] = msg
+                heapq.heappush(self.message_queue, (timestamp, process_id, message_id))
+            elif kind == REC_ACK:
+                _, clock, process_id, message_id = record
+                self.logical_clock = max(self.logical_clock, clock)
+                msg = self.pending.get(message_id)
+                if msg is not None:
+                    msg.add_ack(process_id)
+                else:
+                    self.early_acks[message_id] = self.early_acks.get(message_id, 0) | 1 << process_id
+            elif kind == REC_CAUSAL and DELIVERY_ORDERS[record[5]] == 'sequencer':
+                _, clock, process_id, timestamp, seq, order, sequence, message_id, content = record
+                self.logical_clock = max(self.logical_clock, clock)
+                if self.sequencer is not None:
+                    self.sequencer.restore_message(Message(
+                        id=message_id, processId=process_id, timestamp=timestamp, content=content,
+                        seq=seq, received_at=now, order='sequencer', sequence=sequence or None))
+            elif kind == REC_CAUSAL:
+                _, clock, process_id, timestamp, seq, order, vclock, message_id, content = record
+                self.logical_clock = max(self.logical_clock, clock)
+                if seq:
+                    self.seen.add(process_id, seq)
+                self.causal_pending[message_id] = Message(
+                    id=message_id, processId=process_id, timestamp=timestamp, content=content,
+                    seq=seq, received_at=now, order=DELIVERY_ORDERS[order], vclock=vclock)
+                heapq.heappush(self.causal_queue.setdefault(process_id, []), (seq, message_id))
+            elif kind == REC_DELIVER and record[2] in self.causal_pending:
+                _, clock, message_id = record
+                self.logical_clock = max(self.logical_clock, clock)
+                msg = self.causal_pending.pop(message_id)
+                heap = self.causal_queue[msg.processId]
+                heap.remove((msg.seq, message_id))
+                heapq.heapify(heap)
+                if not heap:
+                    del self.causal_queue[msg.processId]
+                self.vector[msg.processId] = max(self.vector[msg.processId], msg.seq)
+                self.history.append(msg)
+                self.delivered_count += 1
+            elif kind == REC_DELIVER and record[2] not in self.pending:
+                _, clock, message_id = record
+                self.logical_clock = max(self.logical_clock, clock)
+                msg = self.sequencer.restore_delivered(message_id) if self.sequencer else None
+                if msg is not None:
+                    self.history.append(msg)
+                    self.delivered_count += 1
+            elif kind == REC_DELIVER:
+                _, clock, message_id = record
+                self.logical_clock = max(self.logical_clock, clock)
+                msg = self.pending.pop(message_id)
+                if self.message_queue[0][2] == message_id:
+                    heapq.heappop(self.message_queue)
+                else:
+                    self.message_queue = [e for e in self.message_queue if e[2] != message_id]
+                    heapq.heapify(self.message_queue)
+                self.history.append(msg)
+                self.delivered_count += 1
+                self.total_head = max(self.total_head, (msg.timestamp, msg.processId))
+            elif kind == REC_STATE:
+                _, self.logical_clock, self.delivered_count, self.history.next_seq = record
+            elif kind == REC_HISTORY:
+                _, position, process_id, timestamp, seq, message_id, content, acks = record
+                self.history.restore(position, Message(id=message_id, processId=process_id,
+                                                       timestamp=timestamp, content=content,
+                                                       acks=acks, seq=seq))
+                self.total_head = max(self.total_head, (timestamp, process_id))
+            elif kind == REC_CAUSAL_HISTORY:
+                _, position, process_id, timestamp, seq, order, ints, message_id, content = record
+                msg = Message(id=message_id, processId=process_id, timestamp=timestamp,
+                              content=content, seq=seq, order=DELIVERY_ORDERS[order])
+                if msg.order == 'sequencer':
+                    msg.sequence = ints
+                else:
+                    msg.vclock = ints
+                self.history.restore(position, msg)
+            elif kind == REC_SEQUENCER:
+                if self.sequencer is not None:
+                    self.sequencer.restore_state(*record[1:])
+            elif kind == REC_VECTOR:
+                _, vector = record
+                for process_id, seq in enumerate(vector[:self.total_processes]):
+                    self.vector[process_id] = seq
+            elif kind == REC_PENDING:
+                _, process_id, timestamp, seq, message_id, content, acks = record
+                self.pending[message_id] = Message(id=message_id, processId=process_id,
+                                                   timestamp=timestamp, content=content,
+                                                   acks=acks, seq=seq, received_at=now)
+                heapq.heappush(self.message_queue, (timestamp, process_id, message_id))
+            elif kind == REC_EARLY_ACK:
+                _, message_id, acks = record
+                self.early_acks[message_id] = acks
+            elif kind == REC_SEEN:
+                _, process_id, contiguous, extras = record
+                self.seen.senders[process_id] = SenderWatermark(contiguous, set(extras))
+        items, _ = self.history.page(None, self.history.capacity)
+        for _, msg in items:
+            self.stable_ids.add(msg.id)
+        own = self.seen.senders.get(self.process_id)
+        if own is not None:
+            self.send_seq = own.highest
+        if count:
+            self.send_seq_confirmed = True
+        if self.sequencer is not None:
+            # Enviadas que ainda esperam número não estão nas vistas
+            self.send_seq = max([self.send_seq] + [msg.seq for msg in self.sequencer.unsequenced.values()])
+        if count:
+            self.log.info('wal_recovered',
+                          "💾 Estado recuperado do WAL: relógio={clock}, entregues={delivered}, "
+                          "pendentes={pending} ({records} registros em {ms:.1f} ms)",
+                          clock=self.logical_clock, delivered=self.delivered_count,
+                          pending=self.undelivered_count(), records=count,
+                          ms=(time.perf_counter() - started) * 1000)
 
     def get_status(self) -> MulticastStatus:
         return MulticastStatus(
             processId=self.process_id,
             logicalClock=self.logical_clock,
             messageQueueSize=len(self.message_queue),
-            deliveredCount=self.delivered_count
+            deliveredCount=self.delivered_count,
+            outboundQueueDepth=self.queue_depth(),
+            causalQueueSize=len(self.causal_pending),
+            vectorClock=list(self.vector),
+            defaultOrder=self.default_order,
+            deliveredByOrder=dict(self.delivered_by_order),
+            duplicatesDropped=dict(self.duplicates),
+            shedByPeer={str(peer_id): count for peer_id, count in self.shed.items()},
+            recoveredByOrder=dict(self.recovered_by_order),
+            deliveredOutOfOrder=self.out_of_order,
+            skippedBySender={str(process_id): count for process_id, count in self.skipped.items()},
+            sequencer=self.sequencer.status() if self.sequencer is not None else None
         )
 
-    def get_queue(self):
-        return [msg.__dict__ for msg in self.message_queue]
+    def undelivered(self) -> List[Message]:
+        """Mensagens recebidas e ainda não entregues, de todas as ordens"""
+        messages = list(self.pending.values()) + list(self.causal_pending.values())
+        if self.sequencer is not None:
+            messages.extend(self.sequencer.held.values())
+        return messages
+
+    def undelivered_count(self) -> int:
+        return (len(self.pending) + len(self.causal_pending)
+                + (len(self.sequencer.held) if self.sequencer is not None else 0))
+
+    def get_queue(self, limit: int) -> List[Dict[str, Any]]:
+        """Primeiras `limit` mensagens da fila de espera, na ordem total de entrega"""
+        return [
+            self.to_dict(self.pending[message_id])
+            for _, _, message_id in heapq.nsmallest(limit, self.message_queue)
+        ]
+
+    def get_causal_queue(self, limit: int) -> List[Dict[str, Any]]:
+        """Primeiras `limit` mensagens 'causal'/'fifo' aguardando dependências, por (remetente, seq)"""
+        held = sorted(self.causal_pending.values(), key=lambda msg: (msg.processId, msg.seq))
+        return [self.to_dict(msg) for msg in held[:limit]]
+
+    def get_delivered(self, cursor: Optional[int], limit: int) -> Dict[str, Any]:
+        """Página do histórico de entregas a partir de `cursor` (sequência de entrega)"""
+        items, next_cursor = self.history.page(cursor, limit)
+        delivered = []
+        for seq, msg in items:
+            entry = self.to_dict(msg)
+            entry['seq'] = seq
+            delivered.append(entry)
+        return {
+            'delivered': delivered,
+            'nextCursor': next_cursor,
+            'oldestCursor': self.history.first_seq
+        }
+
+    def subscribe(self, since: Optional[int]) -> Tuple[Subscription, List[Tuple[int, Message]]]:
+        """Assina as próximas entregas e retorna o histórico depois da sequência `since`
+
+        A assinatura e a cópia do histórico acontecem sem ceder o loop,
+        então nenhuma entrega fica de fora nem aparece duas vezes. Uma
+        sequência que este processo ainda não atribuiu veio de antes de um
+        reinício sem WAL: o histórico retido é enviado inteiro."""
+        sub = self.stream.subscribe()
+        backlog: List[Tuple[int, Message]] = []
+        if since is not None:
+            start = since + 1 if since < self.history.next_seq else None
+            backlog, _ = self.history.page(start, self.history.capacity)
+        return sub, backlog
+
+    @staticmethod
+    def to_dict(msg: Message) -> Dict[str, Any]:
+        data = {
+            'id': msg.id,
+            'processId': msg.processId,
+            'timestamp': msg.timestamp,
+            'content': msg.content,
+            'acks': msg.ack_list(),
+            'order': msg.order
+        }
+        if msg.vclock is not None:
+            data['vclock'] = msg.vclock
+        if msg.sequence is not None:
+            data['gseq'] = msg.sequence[2]
+            data['term'] = msg.sequence[1]
+        if msg.recovered:
+            data['recovered'] = True
+        if msg.outOfOrder:
+            data['outOfOrder'] = True
+        return data
+
+
+def _check_content(content: str) -> None:
+    """O conteúdo precisa caber no formato binário e no WAL (UTF-8, até 4 GiB)"""
+    try:
+        size = len(content.encode())
+    except UnicodeEncodeError as e:
+        raise ValueError(f"conteúdo não é UTF-8 válido: {e.reason}") from e
+    if size >= 1 << 32:
+        raise ValueError("conteúdo grande demais")
+
+
+def _order_ints(msg: Message) -> List[int]:
+    """Inteiros da ordem no WAL: [sequenciador, mandato, gseq, base] ou o vclock"""
+    if msg.order == 'sequencer':
+        return msg.sequence or []
+    return msg.vclock
@@ -1,122 +1,231 @@
 import asyncio
 import time
-from typing import List, Optional
-import requests
+from collections import deque
+from typing import Deque, List, Optional
+from .logs import EventLog
+from .metrics import Metrics
 from .models import MutexStatus
+from .transport import PeerError, PeerTransport
+
+# Modos de circulação do token
+MUTEX_MODES = ('demand', 'ring')
 
 
 class MutexService:
-    """Implementa exclusão mútua usando Token Ring"""
-    
-    def __init__(self, process_id: int, total_processes: int, peers: List[str]):
+    """Implementa exclusão mútua baseada em token
+
+    Modo 'demand' (padrão, Suzuki–Kasami): quem quer entrar difunde um pedido
+    numerado; o token leva a última requisição atendida de cada processo e a
+    fila de espera, e fica parado no último dono enquanto ninguém pede.
+    Sem disputa, adquirir custa uma difusão e um salto do token.
+    Modo 'ring': Token Ring original, o token circula sem parar."""
+
+    def __init__(self, process_id: int, total_processes: int, peers: List[str],
+                 transport: Optional[PeerTransport] = None,
+                 critical_section_duration: float = 2.0,
+                 metrics: Optional[Metrics] = None,
+                 mode: str = 'demand'):
+        if mode not in MUTEX_MODES:
+            raise ValueError(f"mode deve ser um de {MUTEX_MODES}")
         self.process_id = process_id
+        self.log = EventLog(process_id, 'mutex')
         self.total_processes = total_processes
         self.peers = peers
+        self.transport = transport or PeerTransport(peers)
+        self.metrics = metrics or Metrics()
+        self.mode = mode
         self.has_token = (process_id == 0)  # Processo 0 começa com o token
         self.in_critical_section = False
         self.wants_access = False
         self.critical_section_counter = 0
-    
+        # Duração (segundos) da operação simulada na região crítica
+        self.critical_section_duration = critical_section_duration
+        # Instantes da chegada atual e da anterior do token (métricas)
+        self._token_since: Optional[float] = time.monotonic() if self.has_token else None
+        self._last_token_arrival: Optional[float] = None
+        # Suzuki–Kasami: maior número de pedido visto de cada processo (RN)
+        self.request_numbers: List[int] = [0] * total_processes
+        # Estado que viaja com o token: último pedido atendido (LN) e fila de espera
+        self.last_served: List[int] = [0] * total_processes
+        self.token_queue: Deque[int] = deque()
+
     def has_token_status(self) -> bool:
         """Verifica se este processo tem o token"""
         return self.has_token
-    
+
     async def request_access(self) -> None:
         """Solicita acesso à seção crítica"""
+        if self.mode == 'demand' and self.wants_access and not self.has_token:
+            # Pedido já difundido e ainda pendente: não gera outro número
+            return
         self.wants_access = True
-        print(f"\n[Process {self.process_id}] 🔐 Solicitando acesso à região crítica")
-        
+        self.log.info('access_requested', "🔐 Solicitando acesso à região crítica")
+
         # Se já tem o token, entra imediatamente
         if self.has_token:
             await self._enter_critical_section()
+        elif self.mode == 'demand':
+            await self._broadcast_request()
         else:
-            print(f"[Process {self.process_id}] ⏳ Aguardando token...")
-    
+            self.log.info('waiting_token', "⏳ Aguardando token...")
+
+    async def _broadcast_request(self) -> None:
+        """Difunde o pedido numerado para todos os outros processos"""
+        self.request_numbers[self.process_id] += 1
+        payload = {'process_id': self.process_id, 'seq': self.request_numbers[self.process_id]}
+        others = [pid for pid in range(self.total_processes) if pid != self.process_id]
+
+        self.log.info('token_requested', "📢 Pedindo o token (pedido #{seq})", seq=payload['seq'])
+        results = await asyncio.gather(
+            *(self.transport.post(pid, '/mutex/request', payload, timeout=5) for pid in others),
+            return_exceptions=True
+        )
+        for pid, result in zip(others, results):
+            if isinstance(result, PeerError):
+                self.log.warning('token_request_failed', "❌ Erro pedindo token ao Processo {peer}: {error}",
+                                 peer=pid, error=str(result))
+        self.log.info('waiting_token', "⏳ Aguardando token...")
+
+    def receive_request(self, process_id: int, seq: int) -> None:
+        """Registra o pedido de outro processo; o dono ocioso entrega o token"""
+        self.request_numbers[process_id] = max(self.request_numbers[process_id], seq)
+
+        if self.mode != 'demand' or not self.has_token:
+            return
+        if self.wants_access or self.in_critical_section:
+            # O pedido entra na fila quando este processo sair da região crítica
+            return
+        if self.request_numbers[process_id] == self.last_served[process_id] + 1:
+            self.log.info('request_received', "📨 Pedido de Processo {requester}, token parado aqui",
+                          requester=process_id)
+            asyncio.create_task(self._pass_token())
+
     async def _enter_critical_section(self) -> None:
         """Entra na seção crítica"""
         if not self.has_token:
             return
-        
+
         self.in_critical_section = True
         self.critical_section_counter += 1
-        
-        print(f"\n[Process {self.process_id}] ✅ ENTROU NA REGIÃO CRÍTICA (#{self.critical_section_counter})")
-        print(f"[Process {self.process_id}] 🔧 Executando operação crítica...")
-        
+
+        self.log.info('critical_section_entered', "✅ ENTROU NA REGIÃO CRÍTICA (#{count})",
+                      count=self.critical_section_counter)
+        self.log.debug('critical_section_running', "🔧 Executando operação crítica...")
+
         # Simula trabalho na região crítica
-        await asyncio.sleep(2)
-        
-        print(f"[Process {self.process_id}] ✔️ Saiu da região crítica")
-        
+        await asyncio.sleep(self.critical_section_duration)
+
+        self.log.info('critical_section_left', "✔️ Saiu da região crítica")
+
         self.in_critical_section = False
         self.wants_access = False
-        
+
         # Passa o token para o próximo processo
         await self._pass_token()
-    
+
+    def _enqueue_waiting(self) -> None:
+        """Atualiza a fila do token com os pedidos ainda não atendidos (Suzuki–Kasami)"""
+        self.last_served[self.process_id] = self.request_numbers[self.process_id]
+        for offset in range(1, self.total_processes):
+            pid = (self.process_id + offset) % self.total_processes
+            if (self.request_numbers[pid] == self.last_served[pid] + 1
+                    and pid not in self.token_queue):
+                self.token_queue.append(pid)
+
     async def _pass_token(self) -> None:
-        """Passa o token para o próximo processo no anel"""
+        """Passa o token: ao próximo do anel ou ao primeiro da fila de pedidos"""
         if not self.has_token:
             return
-        
+
+        if self.mode == 'ring':
+            # Calcula o próximo processo no anel
+            await self._send_token((self.process_id + 1) % self.total_processes)
+            return
+
+        self._enqueue_waiting()
+        while self.token_queue:
+            next_process = self.token_queue.popleft()
+            if await self._send_token(next_process):
+                return
+            # Processo inalcançável: descarta o pedido e tenta o próximo da fila
+            self.last_served[next_process] = self.request_numbers[next_process]
+        self.log.info('token_parked', "🅿️ Ninguém aguardando, token parado aqui")
+
+    async def _send_token(self, next_process: int) -> bool:
+        """Envia o token a `next_process`; retorna False (e o mantém) se falhar"""
         # Libera o token
         self.has_token = False
-        
-        # Calcula o próximo processo no anel
-        next_process = (self.process_id + 1) % self.total_processes
-        next_peer = self.peers[next_process]
-        
-        print(f"[Process {self.process_id}] 🎫 Passando token para Processo {next_process}")
-        
+        held_since = self._token_since
+
+        self.log.info('token_passed', "🎫 Passando token para Processo {to}", to=next_process)
+
+        payload = {'from_process': self.process_id}
+        if self.mode == 'demand':
+            payload['last_served'] = self.last_served
+            payload['queue'] = list(self.token_queue)
         try:
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
-                lambda: requests.post(
-                    f"{next_peer}/mutex/token",
-                    json={'from_process': self.process_id},
-                    timeout=5
-                )
+            await self.transport.post(
+                next_process,
+                '/mutex/token',
+                payload,
+                timeout=5
             )
-        except Exception as e:
-            print(f"[Process {self.process_id}] ❌ Erro passando token: {str(e)}")
+        except PeerError as e:
+            self.log.warning('token_pass_failed', "❌ Erro passando token: {error}", error=str(e))
             # Se falhou, recupera o token
             self.has_token = True
-    
+            return False
+
+        if held_since is not None:
+            self.metrics.mutex_token_hold.observe(time.monotonic() - held_since)
+        return True
+
     def receive_token(self, token_data: dict) -> None:
         """Recebe o token de outro processo"""
         from_process = token_data.get('from_process', -1)
-        
-        print(f"\n[Process {self.process_id}] 🎫 Recebeu token de Processo {from_process}")
-        
+
+        self.log.info('token_received', "🎫 Recebeu token de Processo {sender}", sender=from_process)
+
         self.has_token = True
-        
+        now = time.monotonic()
+        if self._last_token_arrival is not None:
+            self.metrics.mutex_token_rotation.observe(now - self._last_token_arrival)
+        self._last_token_arrival = now
+        self._token_since = now
+        if self.mode == 'demand':
+            self.last_served = list(token_data.get('last_served') or [0] * self.total_processes)
+            self.token_queue = deque(token_data.get('queue') or ())
+
         # Se quer acesso, entra na região crítica
         if self.wants_access and not self.in_critical_section:
             asyncio.create_task(self._enter_critical_section())
-        else:
+        elif self.mode == 'ring':
             # Não precisa do token, passa adiante
-            print(f"[Process {self.process_id}] ➡️ Não precisa do token, passando adiante")
+            self.log.info('token_forwarded', "➡️ Não precisa do token, passando adiante")
+            asyncio.create_task(self._pass_token())
+        else:
+            # Encaminha a quem estiver na fila; sem pedidos, o token para aqui
             asyncio.create_task(self._pass_token())
-    
+
     async def release_access(self) -> None:
         """Libera explicitamente a seção crítica (se estiver nela)"""
         if self.in_critical_section:
-            print(f"[Process {self.process_id}] 🔓 Liberando região crítica")
+            self.log.info('critical_section_released', "🔓 Liberando região crítica")
             self.in_critical_section = False
             self.wants_access = False
             await self._pass_token()
         elif self.has_token and not self.wants_access:
-            # Tem token mas não quer usar, passa adiante
+            # Tem token mas não quer usar: passa adiante (no modo 'demand', só se houver pedidos)
             await self._pass_token()
-    
+
     def get_status(self) -> MutexStatus:
         """Retorna o status do mutex"""
         return MutexStatus(
             processId=self.process_id,
-            coordinatorId=None,  # Token Ring não tem coordenador
+            coordinatorId=None,  # Exclusão por token não tem coordenador
             isCoordinator=False,
             inCriticalSection=self.in_critical_section,
             hasAccessGranted=self.has_token,
-            queueSize=0  # Token Ring não usa fila
+            # Pedidos na fila do token (só conhecida por quem o tem)
+            queueSize=len(self.token_queue) if self.has_token else 0
         )
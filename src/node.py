@@ -0,0 +1,102 @@
+"""
+Montagem dos serviços de um nó a partir de um NodeConfig
+"""
+import os
+from typing import Optional
+from .config import NodeConfig
+from .core import CoordinationCore
+from .dissemination import Dissemination
+from .election import ElectionService
+from .locks import LockService
+from .metrics import Metrics
+from .multicast import MulticastService
+from .mutex import MutexService
+from .profiling import acquire_loop_monitor, release_loop_monitor
+from .sync import AntiEntropyService
+from .transport import PeerTransport
+from .wal import WriteAheadLog
+
+
+class Node:
+    """Serviços de coordenação de um nó e o núcleo que os expõe (core.call)"""
+
+    def __init__(self, config: NodeConfig, metrics: Optional[Metrics] = None,
+                 transport: Optional[PeerTransport] = None):
+        self.config = config
+        self.metrics = metrics or Metrics()
+        # Transporte compartilhado (pool de conexões keep-alive por peer)
+        self.transport = transport or PeerTransport(config.peers, metrics=self.metrics)
+
+        # Estratégia de difusão compartilhada por multicast e eleição
+        dissemination = Dissemination(config.total_processes, config.dissemination_mode,
+                                      config.dissemination_fanout)
+
+        # Log durável do multicast (opcional)
+        self.wal = WriteAheadLog(
+            os.path.join(config.wal_dir, f'process-{config.process_id}'),
+            commit_interval=config.wal_commit_interval_ms / 1000,
+            snapshot_every=config.wal_snapshot_every,
+            max_buffer_bytes=config.wal_max_buffer_bytes,
+            metrics=self.metrics,
+            process_id=config.process_id
+        ) if config.wal_dir else None
+
+        self.election = ElectionService(
+            config.process_id, config.total_processes, config.peers, self.transport,
+            metrics=self.metrics,
+            heartbeat_interval=config.heartbeat_interval_ms / 1000,
+            phi_threshold=config.phi_threshold,
+            dissemination=dissemination
+        )
+        self.multicast = MulticastService(
+            config.process_id, config.total_processes, config.peers, self.transport,
+            batch_window=config.batch_window_ms / 1000,
+            batch_max_size=config.batch_max_size,
+            history_size=config.history_size,
+            wire_format=config.wire_format,
+            metrics=self.metrics,
+            max_in_flight=config.max_in_flight,
+            peer_queue_limit=config.peer_queue_limit,
+            wal=self.wal,
+            dissemination=dissemination,
+            default_order=config.default_order,
+            dedup_window=config.dedup_window,
+            # Ordem 'sequencer': o coordenador eleito numera as mensagens
+            election=self.election,
+            sequencer_interval=config.sequencer_resubmit_ms / 1000
+        )
+        self.anti_entropy = AntiEntropyService(
+            config.process_id, config.total_processes, self.multicast, self.transport,
+            interval=config.sync_interval_ms / 1000
+        )
+        self.mutex = MutexService(config.process_id, config.total_processes, config.peers,
+                                  self.transport, metrics=self.metrics, mode=config.mutex_mode)
+        self.locks = LockService(
+            config.process_id, self.election, self.transport,
+            metrics=self.metrics,
+            default_lease_ms=config.lock_default_lease_ms,
+            max_lease_ms=config.lock_max_lease_ms
+        )
+        # Único escritor do estado; os endpoints só chamam core.call(...)
+        self.core = CoordinationCore(self.multicast, self.election, self.mutex,
+                                     self.locks, self.anti_entropy, self.metrics)
+
+    async def start(self) -> None:
+        """Inicia o detector de falhas, a anti-entropia, o sequenciador e o monitor do event loop"""
+        if self.config.loop_monitor:
+            acquire_loop_monitor(self.config.process_id, self.metrics,
+                                 threshold=self.config.loop_stall_threshold_ms / 1000)
+        if self.config.failure_detector:
+            self.election.start_monitor()
+        if self.config.sync_interval_ms > 0:
+            self.anti_entropy.start()
+        self.multicast.sequencer.start()
+
+    async def stop(self) -> None:
+        await release_loop_monitor(self.metrics)
+        await self.anti_entropy.stop()
+        await self.multicast.sequencer.stop()
+        await self.election.stop_monitor()
+        if self.wal is not None:
+            await self.wal.close()
+        await self.transport.close()
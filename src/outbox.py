@@ -0,0 +1,260 @@
+"""
+Caixa de saída por peer para o multicast
+Agrupa mensagens e ACKs por uma janela curta (ou até um tamanho máximo)
+e os envia em lotes para /msg/batch e /ack/batch. Até `max_in_flight` lotes
+ficam em voo ao mesmo tempo (pipeline); falhas transitórias (sem resposta,
+429, 5xx) são reenviadas com backoff, e as demais descartam o lote.
+Cada lote leva um número de sequência do link (cabeçalho X-Multicast-Link)
+e o receptor aplica os lotes de cada remetente na ordem, sem duplicatas.
+ACKs com bitmask (`acks`) da mesma mensagem ainda no buffer são agrupados em um só.
+"""
+import asyncio
+import random
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from .logs import EventLog
+from .transport import PeerError
+
+# (peer_id, tipo 'messages' ou 'acks', itens, cabeçalho do link)
+PostBatch = Callable[[int, str, List[Dict[str, Any]], str], Awaitable[None]]
+
+# Cabeçalho com remetente, encarnação, sequência do lote e base do link
+LINK_HEADER = 'X-Multicast-Link'
+
+# Lotes em voo por peer e itens enfileirados antes de recusar envios (429)
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_QUEUE_LIMIT = 10000
+# Backoff (segundos) entre reenvios: dobra a cada falha até o máximo
+RETRY_BASE = 0.05
+RETRY_MAX = 2.0
+
+
+class Backpressure(Exception):
+    """A fila de saída de um peer de quem o envio depende está cheia"""
+
+    def __init__(self, peer_id: int, depth: int, retry_after: float):
+        super().__init__(f"Fila do Processo {peer_id} cheia ({depth} itens)")
+        self.peer_id = peer_id
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+def format_link(sender: int, incarnation: int, seq: int, base: int) -> str:
+    return f"{sender}:{incarnation}:{seq}:{base}"
+
+
+def parse_link(value: str) -> Tuple[int, int, int, int]:
+    """(sender, incarnation, seq, base) a partir do cabeçalho X-Multicast-Link"""
+    parts = value.split(':')
+    if len(parts) != 4:
+        raise ValueError("X-Multicast-Link deve ser 'sender:incarnation:seq:base'")
+    sender, incarnation, seq, base = (int(part) for part in parts)
+    return sender, incarnation, seq, base
+
+
+class PeerOutbox:
+    """Buffer de saída de um peer com janela de lotes em voo e reenvio
+
+    Uma única tarefa monta os lotes e numera-os em ordem; o envio de cada
+    lote roda em paralelo, limitado por `max_in_flight`. Com a janela cheia,
+    os itens novos se acumulam no buffer (e formam lotes maiores)."""
+
+    def __init__(self, peer_id: int, post_batch: PostBatch, window: float, max_size: int,
+                 sender_id: int = 0, incarnation: int = 0,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 queue_limit: int = DEFAULT_QUEUE_LIMIT,
+                 on_retry: Optional[Callable[[], None]] = None,
+                 on_drop: Optional[Callable[[int], None]] = None,
+                 before_send: Optional[Callable[[], Awaitable[None]]] = None):
+        self.peer_id = peer_id
+        self.post_batch = post_batch
+        self.window = window
+        self.max_size = max_size
+        self.sender_id = sender_id
+        self.log = EventLog(sender_id, 'outbox')
+        self.incarnation = incarnation
+        self.queue_limit = queue_limit
+        self.on_retry = on_retry
+        # Chamado com a quantidade de itens de cada lote descartado
+        self.on_drop = on_drop
+        # Chamado antes de despachar cada grupo de lotes (ex.: esperar o WAL)
+        self.before_send = before_send
+        self.messages: List[Dict[str, Any]] = []
+        self.acks: List[Dict[str, Any]] = []
+        # ACKs agrupáveis ainda no buffer, por message_id
+        self._ack_index: Dict[str, Dict[str, Any]] = {}
+        # As primeiras `_unit_end` mensagens do buffer vão no mesmo lote (add_messages)
+        self._unit_end = 0
+        self.in_flight_items = 0
+        self.retries = 0
+        self.dropped = 0
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._next_seq = 0
+        self._in_flight_seqs: Set[int] = set()
+        self._senders: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.messages) + len(self.acks)
+
+    @property
+    def depth(self) -> int:
+        """Itens ainda não confirmados pelo peer (no buffer ou em voo)"""
+        return self.size + self.in_flight_items
+
+    @property
+    def full(self) -> bool:
+        return self.depth >= self.queue_limit
+
+    def add_message(self, payload: Dict[str, Any]) -> None:
+        self.messages.append(payload)
+        self._schedule()
+
+    def add_messages(self, payloads: List[Dict[str, Any]]) -> None:
+        """Enfileira mensagens que seguem juntas em um só lote, mesmo acima de max_size"""
+        self.messages.extend(payloads)
+        self._unit_end = len(self.messages)
+        self._schedule()
+
+    def add_ack(self, payload: Dict[str, Any]) -> None:
+        if 'acks' in payload:
+            # Juntar a um ACK anterior só o atrasa, nunca o adianta: a ordem FIFO se mantém
+            buffered = self._ack_index.get(payload['message_id'])
+            if buffered is not None:
+                buffered['acks'] |= payload['acks']
+                buffered['timestamp'] = max(buffered['timestamp'], payload['timestamp'])
+                return
+            payload = self._ack_index[payload['message_id']] = dict(payload)
+        self.acks.append(payload)
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        elif self.size >= self.max_size:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        """Espera a janela (ou o buffer encher) e despacha os lotes em ordem"""
+        while self.messages or self.acks:
+            if self.size < self.max_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            if self.before_send is not None:
+                try:
+                    await self.before_send()
+                except Exception as e:
+                    # Nada sai antes de before_send confirmar (ex.: WAL sem gravar); tenta de novo
+                    self.log.warning('before_send_failed', "⏸️ Lotes para Processo {peer} retidos: "
+                                     "{error}", peer=self.peer_id, error=str(e))
+                    await asyncio.sleep(RETRY_BASE)
+                    continue
+
+            while self.messages or self.acks:
+                await self._slots.acquire()
+                # Mensagens antes dos ACKs, para manter a ordem FIFO
+                if self.messages:
+                    count = max(self.max_size, self._unit_end)
+                    kind, items = 'messages', self.messages[:count]
+                    del self.messages[:count]
+                    self._unit_end = max(0, self._unit_end - count)
+                else:
+                    kind, items = 'acks', self.acks[:self.max_size]
+                    del self.acks[:self.max_size]
+                    for item in items:
+                        self._ack_index.pop(item['message_id'], None)
+                seq = self._next_seq
+                self._next_seq += 1
+                self._in_flight_seqs.add(seq)
+                self.in_flight_items += len(items)
+                task = asyncio.create_task(self._deliver(seq, kind, items))
+                self._senders.add(task)
+                task.add_done_callback(self._senders.discard)
+
+    async def _deliver(self, seq: int, kind: str, items: List[Dict[str, Any]]) -> None:
+        """Envia um lote até o peer confirmar, com backoff exponencial entre tentativas"""
+        attempt = 0
+        try:
+            while True:
+                # A base (menor sequência ainda em voo) permite ao peer que
+                # reiniciou retomar o link sem esperar lotes já confirmados
+                link = format_link(self.sender_id, self.incarnation, seq, min(self._in_flight_seqs))
+                try:
+                    await self.post_batch(self.peer_id, kind, items, link)
+                    return
+                except Exception as e:
+                    if not (isinstance(e, PeerError) and e.transient):
+                        # Repetir daria o mesmo erro e prenderia o link; a base dos
+                        # próximos lotes avisa o peer para não esperar por este
+                        self._drop(seq, items, e)
+                        return
+                    attempt += 1
+                    self.retries += 1
+                    if self.on_retry is not None:
+                        self.on_retry()
+                    if attempt == 1 or attempt % 10 == 0:
+                        self.log.warning('batch_retry', "🔁 Reenviando lote {seq} para Processo {peer} "
+                                         "(tentativa {attempt}): {error}",
+                                         seq=seq, peer=self.peer_id, attempt=attempt, error=str(e))
+                    delay = min(RETRY_MAX, RETRY_BASE * 2 ** (attempt - 1))
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        finally:
+            self._in_flight_seqs.discard(seq)
+            self.in_flight_items -= len(items)
+            self._slots.release()
+
+
+    def _drop(self, seq: int, items: List[Dict[str, Any]], error: Exception) -> None:
+        self.dropped += len(items)
+        if self.on_drop is not None:
+            self.on_drop(len(items))
+        self.log.error('batch_dropped', "❌ Lote {seq} para Processo {peer} descartado ({count} itens): "
+                       "{error}", seq=seq, peer=self.peer_id, count=len(items),
+                       error=f"{type(error).__name__} {error}")
+
+
+class _InboundLink:
+    __slots__ = ('incarnation', 'next_seq', 'pending')
+
+    def __init__(self, incarnation: int, next_seq: int):
+        self.incarnation = incarnation
+        self.next_seq = next_seq
+        self.pending: Dict[int, Callable[[], None]] = {}
+
+
+class LinkReceiver:
+    """Aplica os lotes de cada remetente na ordem do link, descartando reenvios
+
+    Lotes adiantados esperam (no máximo a janela em voo do remetente) até
+    os anteriores chegarem. Uma encarnação nova do remetente reinicia o link.
+    Abaixo da base nada mais está em voo: lotes que faltam ali foram
+    descartados pelo remetente e deixam de ser esperados."""
+
+    def __init__(self):
+        self._links: Dict[int, _InboundLink] = {}
+
+    def accept(self, link: Tuple[int, int, int, int], apply: Callable[[], None]) -> bool:
+        """Agenda `apply` para a vez do lote; False se já tiver sido aplicado"""
+        sender, incarnation, seq, base = link
+        inbound = self._links.get(sender)
+        if inbound is None or inbound.incarnation != incarnation:
+            inbound = self._links[sender] = _InboundLink(incarnation, base)
+        if seq < inbound.next_seq or seq in inbound.pending:
+            return False
+        inbound.pending[seq] = apply
+        while inbound.next_seq < base:
+            skipped = inbound.pending.pop(inbound.next_seq, None)
+            if skipped is not None:
+                skipped()
+            inbound.next_seq += 1
+        while inbound.next_seq in inbound.pending:
+            inbound.pending.pop(inbound.next_seq)()
+            inbound.next_seq += 1
+        return True
+
+    def pending_batches(self) -> int:
+        return sum(len(inbound.pending) for inbound in self._links.values())
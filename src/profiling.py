@@ -0,0 +1,275 @@
+"""
+Diagnóstico do event loop em produção
+- LoopMonitor: mede o atraso (lag) do loop a cada `interval` e registra os
+  travamentos acima de `threshold` com a pilha que estava rodando. Uma
+  thread vigia o loop e copia a pilha enquanto ele ainda está travado, então
+  o registro aponta o culpado (e não quem rodou depois).
+- profile_loop: profiler por amostragem; outra thread lê a pilha do loop a
+  cada `interval` e devolve as pilhas agrupadas no formato "collapsed"
+  (uma linha "raiz;...;folha contagem"), pronto para flamegraph.pl/speedscope.
+
+As duas coisas só leem sys._current_frames() de outra thread: nada é
+instrumentado no loop e o custo fica em uma leitura de pilha por amostra.
+Um monitor por event loop (vários nós de src/cluster.py compartilham um).
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional
+from .logs import EventLog
+from .metrics import Metrics
+
+# Intervalo (segundos) entre medições do lag e lag mínimo para contar como travamento
+DEFAULT_LOOP_INTERVAL = 0.05
+DEFAULT_STALL_THRESHOLD = 0.1
+# Travamentos mantidos em memória (com as pilhas)
+STALL_HISTORY = 50
+# Limites de /debug/profile
+MAX_PROFILE_SECONDS = 60
+DEFAULT_PROFILE_INTERVAL = 0.005
+MIN_PROFILE_INTERVAL = 0.001
+# Quadros por pilha (os mais próximos da raiz são descartados)
+MAX_STACK_DEPTH = 64
+
+
+class ProfilerBusy(Exception):
+    """Já há um /debug/profile em andamento neste processo"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    short = os.path.join(os.path.basename(os.path.dirname(path)), os.path.basename(path))
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame) -> str:
+    """Pilha da raiz até `frame` no formato collapsed: 'raiz;...;folha'"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def _stack_lines(frame) -> List[str]:
+    """Pilha legível, da folha para a raiz ('arquivo:linha em função')"""
+    lines = []
+    while frame is not None and len(lines) < MAX_STACK_DEPTH:
+        lines.append(f"{frame.f_code.co_filename}:{frame.f_lineno} em {frame.f_code.co_name}")
+        frame = frame.f_back
+    return lines
+
+
+class LoopMonitor:
+    """Mede o lag do event loop e guarda os travamentos com a pilha culpada"""
+
+    def __init__(self, process_id: int, interval: float = DEFAULT_LOOP_INTERVAL,
+                 threshold: float = DEFAULT_STALL_THRESHOLD):
+        self.process_id = process_id
+        self.log = EventLog(process_id, 'loop')
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: deque = deque(maxlen=STALL_HISTORY)
+        self.stall_count = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        # Métricas de cada nó que usa este loop (attach/detach)
+        self._metrics: List[Metrics] = []
+        self._loop_thread: Optional[int] = None
+        self._beat = time.monotonic()
+        # Pilha copiada pela vigia durante o travamento atual
+        self._stall_stack: Optional[List[str]] = None
+        self._stall_collapsed: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def attach(self, metrics: Metrics) -> None:
+        if metrics not in self._metrics:
+            self._metrics.append(metrics)
+
+    def detach(self, metrics: Metrics) -> None:
+        if metrics in self._metrics:
+            self._metrics.remove(metrics)
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _tick(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            lag = max(0.0, now - started - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            for metrics in self._metrics:
+                metrics.event_loop_lag.observe(lag)
+            if lag >= self.threshold:
+                self._record_stall(lag)
+            self._stall_stack = self._stall_collapsed = None
+
+    def _record_stall(self, lag: float) -> None:
+        self.stall_count += 1
+        for metrics in self._metrics:
+            metrics.event_loop_stalls.inc()
+        stack = self._stall_stack
+        self.stalls.append({
+            'at': time.time() - lag,
+            'durationMs': round(lag * 1000, 1),
+            # Sem pilha: o travamento acabou antes da vigia olhar
+            'stack': stack,
+            'collapsed': self._stall_collapsed
+        })
+        self.log.warning('loop_stall', "🐢 Event loop travado por {ms:.0f} ms em {where}",
+                         ms=lag * 1000, where=stack[0] if stack else '?')
+
+    def _watch(self) -> None:
+        """Thread vigia: copia a pilha do loop quando ele passa do limite sem responder"""
+        period = min(self.interval, self.threshold) / 2
+        while not self._stopped.wait(period):
+            if self._stall_stack is not None:
+                continue
+            if time.monotonic() - self._beat > self.interval + self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._stall_collapsed = collapse_stack(frame)
+                    self._stall_stack = _stack_lines(frame)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'processId': self.process_id,
+            'intervalMs': self.interval * 1000,
+            'thresholdMs': self.threshold * 1000,
+            'lastLagMs': round(self.last_lag * 1000, 3),
+            'maxLagMs': round(self.max_lag * 1000, 3),
+            'stalls': self.stall_count,
+            'recent': list(self.stalls)
+        }
+
+
+# Um monitor por event loop, compartilhado pelos nós que rodam nele
+_monitors: Dict[asyncio.AbstractEventLoop, LoopMonitor] = {}
+
+
+def acquire_loop_monitor(process_id: int, metrics: Metrics,
+                         interval: float = DEFAULT_LOOP_INTERVAL,
+                         threshold: float = DEFAULT_STALL_THRESHOLD) -> LoopMonitor:
+    """Monitor do loop atual (criado e iniciado na primeira chamada) ligado a `metrics`"""
+    loop = asyncio.get_running_loop()
+    monitor = _monitors.get(loop)
+    if monitor is None:
+        monitor = _monitors[loop] = LoopMonitor(process_id, interval, threshold)
+        monitor.start()
+    monitor.attach(metrics)
+    return monitor
+
+
+async def release_loop_monitor(metrics: Metrics) -> None:
+    """Desliga `metrics` do monitor do loop atual; para o monitor quando ninguém mais usa"""
+    loop = asyncio.get_running_loop()
+    monitor = _monitors.get(loop)
+    if monitor is None:
+        return
+    monitor.detach(metrics)
+    if not monitor._metrics:
+        del _monitors[loop]
+        await monitor.stop()
+
+
+def get_loop_monitor() -> Optional[LoopMonitor]:
+    return _monitors.get(asyncio.get_running_loop())
+
+
+_profile_lock = threading.Lock()
+
+
+def _sample(thread_id: int, seconds: float, interval: float) -> Dict[str, Any]:
+    """Amostra a pilha da thread `thread_id` por `seconds` (roda fora do loop)"""
+    stacks: Counter = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    next_at = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        if now < next_at:
+            time.sleep(next_at - now)
+        next_at += interval
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            stacks[collapse_stack(frame)] += 1
+            samples += 1
+        del frame
+    return {'samples': samples, 'stacks': stacks}
+
+
+async def profile_loop(seconds: float, interval: float = DEFAULT_PROFILE_INTERVAL) -> Dict[str, Any]:
+    """Amostra o event loop atual por `seconds` e devolve as pilhas em formato collapsed
+
+    A amostragem roda em uma thread própria (não no executor padrão, que pode
+    estar saturado justamente quando se quer medir). Levanta ProfilerBusy se
+    já houver uma amostragem em andamento."""
+    seconds = min(max(seconds, 0.0), MAX_PROFILE_SECONDS)
+    interval = max(interval, MIN_PROFILE_INTERVAL)
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("já há uma amostragem em andamento")
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    thread_id = threading.get_ident()
+
+    def finish(result, error: Optional[BaseException]) -> None:
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run() -> None:
+        # O lock só é liberado no fim da amostragem, mesmo se o pedido for cancelado
+        result, error = None, None
+        try:
+            result = _sample(thread_id, seconds, interval)
+        except Exception as e:
+            # Sem isso o pedido esperaria para sempre
+            error = e
+        finally:
+            _profile_lock.release()
+        loop.call_soon_threadsafe(finish, result, error)
+
+    threading.Thread(target=run, name='loop-profiler', daemon=True).start()
+    result = await future
+    lines = [f"{stack} {count}" for stack, count in result['stacks'].most_common()]
+    return {
+        'seconds': seconds,
+        'intervalMs': interval * 1000,
+        'samples': result['samples'],
+        'collapsed': '\n'.join(lines) + ('\n' if lines else '')
+    }
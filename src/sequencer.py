@@ -0,0 +1,455 @@
+"""
+Ordem total por sequenciador (ordem 'sequencer' do multicast)
+O remetente encaminha a mensagem ao coordenador eleito (ElectionService), que
+atribui números de sequência globais (gseq) e a difunde; cada processo entrega
+em ordem de gseq, sem ACKs. São O(N) mensagens por envio, contra O(N²) do
+Lamport + ACKs, e os lotes das caixas de saída diluem o custo por mensagem.
+
+Troca de coordenador: o novo abre um mandato (term) maior que todos os
+conhecidos e pergunta a cada processo o que já entregou, o que tem na fila e o
+que enviou sem número (/sequencer/sync). O maior gseq entregue (ou dado por
+definitivo) vira a base: até ela a numeração não muda, de qualquer mandato. O
+que passou da base é renumerado a partir de base + 1 no novo mandato, então a
+sequência continua sem lacunas. Cada mensagem numerada leva
+[sequenciador, mandato, gseq, base]; números de um mandato anterior acima da
+base conhecida são descartados (a mensagem volta renumerada).
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+from .election import ElectionService
+from .logs import EventLog
+from .models import DELIVERY_ORDERS, Message
+from .transport import PeerError
+from .wal import REC_CAUSAL, REC_SEQUENCER, Record
+
+if TYPE_CHECKING:
+    from .multicast import MulticastService
+
+# Intervalo (segundos) entre reenvios das mensagens próprias ainda sem número
+DEFAULT_RESUBMIT_INTERVAL = 1.0
+# Timeout de cada /sequencer/sync e tentativas de abrir o mandato
+SYNC_TIMEOUT = 2.0
+TAKEOVER_ATTEMPTS = 3
+
+_SEQUENCER_ORDER = DELIVERY_ORDERS.index('sequencer')
+
+
+class SequencerService:
+    """Numeração global das mensagens 'sequencer' pelo coordenador eleito"""
+
+    def __init__(self, multicast: 'MulticastService', election: ElectionService,
+                 interval: float = DEFAULT_RESUBMIT_INTERVAL):
+        self.multicast = multicast
+        self.election = election
+        self.process_id = multicast.process_id
+        self.log = EventLog(self.process_id, 'sequencer')
+        self.interval = interval
+        # Mandato aceito e seu sequenciador
+        self.term = 0
+        self.sequencer_id: Optional[int] = None
+        # Tudo até `base` é definitivo; `base_term` é o mandato que a anunciou
+        self.base = 0
+        self.base_term = 0
+        # Último gseq entregue aqui
+        self.delivered = 0
+        # Sequenciador: próximo gseq e se a recuperação do mandato terminou
+        self.next_gseq = 1
+        self.ready = False
+        # Numeradas aguardando as anteriores, por gseq (e gseq por id)
+        self.held: Dict[int, Message] = {}
+        self._held_ids: Dict[str, int] = {}
+        # Mensagens próprias ainda sem número, por id
+        self.unsequenced: Dict[str, Message] = {}
+        # Submissões de outros recebidas durante a recuperação do mandato
+        self._backlog: List[Message] = []
+        self._coordinator: Optional[Tuple[Optional[int], int]] = None
+        self._takeover: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+        self.renumbered = 0
+        election.coordinator_listeners.append(self._coordinator_changed)
+
+    @property
+    def coordinator(self) -> Optional[int]:
+        return self.election.coordinator_id
+
+    @property
+    def is_sequencer(self) -> bool:
+        return self.election.coordinator_id == self.process_id
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        for task in (self._task, self._takeover):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._takeover = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.resubmit()
+            except Exception as e:
+                self.log.error('sequencer_error', "❌ Erro no sequenciador: {error}", error=str(e))
+
+    # ==================== REMETENTE ====================
+
+    def submit(self, messages: List[Message]) -> None:
+        """Mensagens próprias: numera (se for o sequenciador) ou encaminha ao coordenador"""
+        now = time.monotonic()
+        for msg in messages:
+            self._wal_message(msg)
+            msg.received_at = now
+            self.unsequenced[msg.id] = msg
+        self._forward(messages)
+
+    def resubmit(self) -> None:
+        """Reenvia as mensagens próprias ainda sem número (coordenador caiu ou trocou)
+
+        Também retoma a recuperação do mandato se este processo for o
+        coordenador e ela não tiver terminado."""
+        if self.is_sequencer and not self.ready:
+            self._start_takeover()
+            return
+        now = time.monotonic()
+        stale = [msg for msg in self.unsequenced.values() if now - msg.received_at >= self.interval]
+        if stale:
+            self._forward(stale)
+
+    def _forward(self, messages: List[Message]) -> None:
+        coordinator = self.election.coordinator_id
+        if coordinator is None:
+            return
+        now = time.monotonic()
+        for msg in messages:
+            msg.received_at = now
+        if coordinator == self.process_id:
+            if self.ready:
+                for msg in messages:
+                    self._assign(msg)
+            # Sem mandato pronto: entram na renumeração da recuperação
+            return
+        self.multicast.forward([coordinator], messages)
+
+    # ==================== RECEPÇÃO ====================
+
+    def receive(self, msg: Message, relay: bool = True) -> bool:
+        """Submissão (sem número) ou mensagem numerada; True se a mensagem era nova"""
+        if msg.sequence is None:
+            if not self.is_sequencer:
+                # Coordenador antigo: o remetente reenvia ao atual
+                return False
+            if self.ready:
+                self._assign(msg)
+            else:
+                self._backlog.append(msg)
+            return False
+        if relay:
+            # Repassa na árvore do sequenciador (a origem da numeração)
+            self.multicast.forward(self.multicast.peers_for(msg.sequence[0]), [msg])
+        return self._accept(msg)
+
+    def _accept(self, msg: Message) -> bool:
+        """Guarda uma mensagem numerada e entrega o que estiver na vez"""
+        _, term, gseq, base = msg.sequence
+        if term > self.base_term:
+            self._adopt_base(term, msg.sequence[0], base)
+        elif term < self.term and gseq > self.base:
+            # Numeração de um mandato anterior, refeita pelo atual
+            return False
+        if msg.processId == self.process_id:
+            self.unsequenced.pop(msg.id, None)
+        held = self.held.get(gseq)
+        if gseq <= self.delivered or (held is not None and held.sequence[1] >= term):
+            self.multicast.count_duplicate('message')
+            return False
+        if held is not None:
+            del self._held_ids[held.id]
+        self._wal_message(msg)
+        if msg.seq:
+            self.multicast.seen.add(msg.processId, msg.seq)
+        msg.received_at = time.monotonic()
+        self.held[gseq] = msg
+        self._held_ids[msg.id] = gseq
+        self._deliver_ready()
+        return True
+
+    def _deliver_ready(self) -> None:
+        """Entrega em ordem de gseq enquanto a próxima estiver na fila
+
+        Número de mandato anterior só vale até a base conhecida; acima dela
+        espera a base do mandato atual."""
+        while self.delivered + 1 in self.held:
+            msg = self.held[self.delivered + 1]
+            if msg.sequence[1] < self.term and msg.sequence[2] > self.base:
+                break
+            del self.held[self.delivered + 1]
+            del self._held_ids[msg.id]
+            self.delivered += 1
+            self.multicast.accept_ordered(msg)
+
+    def _adopt_base(self, term: int, sequencer: int, base: int) -> None:
+        if term > self.term:
+            self.term = term
+            self.sequencer_id = sequencer
+            if sequencer != self.process_id:
+                self.ready = False
+        self.base_term = term
+        self.base = max(self.base, base)
+        self._drop_stale()
+        self._wal_state()
+
+    def _drop_stale(self) -> None:
+        """Descarta números de mandatos anteriores acima da base
+
+        As mensagens próprias voltam para a fila de reenvio."""
+        for gseq in [g for g, msg in self.held.items()
+                     if msg.sequence[1] < self.base_term and g > self.base]:
+            msg = self.held.pop(gseq)
+            del self._held_ids[msg.id]
+            if msg.processId == self.process_id:
+                msg.sequence = None
+                self.unsequenced[msg.id] = msg
+
+    # ==================== SEQUENCIADOR ====================
+
+    def _assign(self, msg: Message) -> None:
+        """Numera uma submissão (as repetidas são ignoradas)"""
+        if self.multicast.is_duplicate(msg) or msg.id in self._held_ids:
+            return
+        self._number(msg)
+
+    def _number(self, msg: Message) -> None:
+        numbered = Message(id=msg.id, processId=msg.processId, timestamp=msg.timestamp,
+                           content=msg.content, seq=msg.seq, order='sequencer',
+                           sequence=[self.process_id, self.term, self.next_gseq, self.base])
+        self.next_gseq += 1
+        self._accept(numbered)
+        self._fan_out(numbered)
+
+    def _fan_out(self, msg: Message) -> None:
+        self.multicast.forward(self.multicast.peers_for(self.process_id), [msg])
+
+    def _coordinator_changed(self, coordinator_id: Optional[int], epoch: int) -> None:
+        """Chamado pela eleição a cada coordenador anunciado ou assumido"""
+        if self._coordinator == (coordinator_id, epoch):
+            return
+        self._coordinator = (coordinator_id, epoch)
+        if coordinator_id == self.process_id:
+            self._start_takeover()
+            return
+        self.ready = False
+        self._backlog.clear()
+        if self.unsequenced:
+            self._forward(list(self.unsequenced.values()))
+
+    def _start_takeover(self) -> None:
+        if self._takeover is None or self._takeover.done():
+            self._takeover = asyncio.create_task(self.take_over())
+
+    async def take_over(self) -> None:
+        """Abre um novo mandato e continua a numeração a partir da base"""
+        self.ready = False
+        term = self.term + 1
+        replies: List[Dict[str, Any]] = []
+        for _ in range(TAKEOVER_ATTEMPTS):
+            self._open_term(term)
+            results = await asyncio.gather(*(
+                self._sync_peer(peer_id, term)
+                for peer_id in range(self.multicast.total_processes) if peer_id != self.process_id
+            ))
+            if not self.is_sequencer or self.term != term:
+                return
+            replies = [reply for reply in results if reply is not None]
+            newer = max((reply['term'] for reply in replies if reply.get('stale')), default=0)
+            if not newer:
+                break
+            term = newer + 1
+        else:
+            self.log.warning('sequencer_takeover_failed',
+                             "⚠️ Não conseguiu abrir um mandato de sequenciador (term={term})",
+                             term=term)
+            return
+        self._resequence(term, replies)
+
+    def _open_term(self, term: int) -> None:
+        self.term = term
+        self.sequencer_id = self.process_id
+        self._wal_state()
+
+    async def _sync_peer(self, peer_id: int, term: int) -> Optional[Dict[str, Any]]:
+        try:
+            return await self.multicast.transport.post(
+                peer_id, '/sequencer/sync',
+                {'term': term, 'sequencer': self.process_id, 'since': self.delivered},
+                timeout=SYNC_TIMEOUT
+            )
+        except PeerError:
+            return None
+
+    def receive_sync(self, term: int, sequencer: int, since: int) -> Dict[str, Any]:
+        """/sequencer/sync: aceita o mandato e devolve o que o novo sequenciador precisa
+
+        Entregues (até `delivered`), base conhecida, fila de numeradas, envios
+        próprios sem número e o histórico acima de `since`."""
+        if term < self.term or (term == self.term and sequencer != self.sequencer_id):
+            return {'stale': True, 'term': self.term}
+        if term > self.term:
+            self.term = term
+            self.sequencer_id = sequencer
+            self.ready = False
+            self._wal_state()
+        payload = self.multicast.to_payload
+        items, _ = self.multicast.history.page(None, self.multicast.history.capacity)
+        return {
+            'term': self.term,
+            'delivered': self.delivered,
+            'base': self.base,
+            'held': [payload(msg) for msg in self.held.values()],
+            'unsequenced': [payload(msg) for msg in self.unsequenced.values()],
+            'history': [payload(msg) for _, msg in items
+                        if msg.sequence is not None and msg.sequence[2] > since]
+        }
+
+    def _resequence(self, term: int, replies: List[Dict[str, Any]]) -> None:
+        """Junta as respostas do /sequencer/sync e retoma a numeração sem lacunas"""
+        replies.append(self.receive_sync(term, self.process_id, self.delivered))
+        to_message = self.multicast.from_payload
+        base = max(max(reply['delivered'], reply['base']) for reply in replies)
+        low = min(reply['delivered'] for reply in replies)
+        # Definitivas (até a base): cópias entregues primeiro
+        final: Dict[int, Message] = {}
+        for key in ('history', 'held'):
+            for reply in replies:
+                for data in reply[key]:
+                    msg = to_message(data)
+                    if msg.sequence[2] <= base:
+                        final.setdefault(msg.sequence[2], msg)
+        items, _ = self.multicast.history.page(None, self.multicast.history.capacity)
+        for _, msg in items:
+            if msg.sequence is not None and low < msg.sequence[2] <= base:
+                final.setdefault(msg.sequence[2], msg)
+        known = {msg.id for msg in final.values()}
+        # A renumerar: numeradas acima da base e envios sem número (na ordem antiga)
+        candidates: Dict[str, Message] = {}
+        for reply in replies:
+            for data in reply['held']:
+                msg = to_message(data)
+                old = candidates.get(msg.id)
+                if msg.sequence[2] > base and (old is None or old.sequence[2] > msg.sequence[2]):
+                    candidates[msg.id] = msg
+        for msg in [to_message(data) for reply in replies for data in reply['unsequenced']] + self._backlog:
+            candidates.setdefault(msg.id, msg)
+        self._backlog.clear()
+        pending = sorted(
+            (msg for msg in candidates.values()
+             if msg.id not in known and msg.id not in self.multicast.stable_ids),
+            key=lambda msg: (msg.sequence[2] if msg.sequence else float('inf'), msg.processId, msg.seq)
+        )
+
+        self.base_term, self.base = term, base
+        self._drop_stale()
+        self.next_gseq = base + 1
+        self._wal_state()
+        # As definitivas seguem com o novo mandato, que carrega a base aos atrasados
+        for gseq in sorted(final):
+            if gseq > low:
+                old = final[gseq]
+                msg = Message(id=old.id, processId=old.processId, timestamp=old.timestamp,
+                              content=old.content, seq=old.seq, order='sequencer',
+                              sequence=[self.process_id, term, gseq, base])
+                if gseq > self.delivered:
+                    self._accept(msg)
+                self._fan_out(msg)
+        missing = sum(1 for gseq in range(low + 1, base + 1) if gseq not in final)
+        if missing:
+            # Saíram de todos os históricos consultados: a anti-entropia as traz
+            self.log.warning('sequencer_gap', "⚠️ {missing} números até a base {base} sem cópia",
+                             missing=missing, base=base)
+        for msg in pending:
+            self._number(msg)
+        self.renumbered += len(pending)
+        self.ready = True
+        self.log.info('sequencer_took_over',
+                      "🔢 Sequenciador do mandato {term}: base={base}, renumeradas={count}",
+                      term=term, base=base, count=len(pending))
+
+    # ==================== WAL ====================
+
+    def _wal_message(self, msg: Message) -> None:
+        if self.multicast.wal is not None:
+            self.multicast.wal.append((REC_CAUSAL, self.multicast.logical_clock, msg.processId,
+                                       msg.timestamp, msg.seq, _SEQUENCER_ORDER,
+                                       msg.sequence or [], msg.id, msg.content))
+
+    def _wal_state(self) -> None:
+        if self.multicast.wal is not None:
+            self.multicast.wal.append(self._state_record())
+
+    def _state_record(self) -> Record:
+        sequencer = -1 if self.sequencer_id is None else self.sequencer_id
+        return (REC_SEQUENCER, self.term, sequencer, self.base_term, self.base, self.delivered)
+
+    def snapshot_records(self, clock: int) -> List[Record]:
+        records: List[Record] = [self._state_record()]
+        for msg in list(self.held.values()) + list(self.unsequenced.values()):
+            records.append((REC_CAUSAL, clock, msg.processId, msg.timestamp, msg.seq,
+                            _SEQUENCER_ORDER, msg.sequence or [], msg.id, msg.content))
+        return records
+
+    def restore_state(self, term: int, sequencer: int, base_term: int, base: int,
+                      delivered: int) -> None:
+        self.term, self.base_term, self.base = term, base_term, base
+        self.sequencer_id = None if sequencer < 0 else sequencer
+        self.delivered = max(self.delivered, delivered)
+        self._drop_stale()
+
+    def restore_message(self, msg: Message) -> None:
+        if msg.sequence is None:
+            self.unsequenced[msg.id] = msg
+            return
+        self.unsequenced.pop(msg.id, None)
+        gseq = msg.sequence[2]
+        held = self.held.get(gseq)
+        if held is not None:
+            del self._held_ids[held.id]
+        if msg.seq:
+            self.multicast.seen.add(msg.processId, msg.seq)
+        self.held[gseq] = msg
+        self._held_ids[msg.id] = gseq
+
+    def restore_delivered(self, message_id: str) -> Optional[Message]:
+        """Entrega registrada no WAL de uma mensagem numerada (None se não for uma)"""
+        gseq = self._held_ids.pop(message_id, None)
+        if gseq is None:
+            return None
+        self.delivered = max(self.delivered, gseq)
+        return self.held.pop(gseq)
+
+    # ==================== STATUS ====================
+
+    def status(self) -> Dict[str, Any]:
+        data = {
+            'term': self.term,
+            'sequencerId': self.sequencer_id,
+            'isSequencer': self.is_sequencer and self.ready,
+            'base': self.base,
+            'delivered': self.delivered,
+            'queueSize': len(self.held),
+            'unsequenced': len(self.unsequenced),
+            'renumbered': self.renumbered
+        }
+        if self.is_sequencer:
+            data['nextGseq'] = self.next_gseq
+        return data
+
+    def get_queue(self, limit: int) -> List[Dict[str, Any]]:
+        """Primeiras `limit` mensagens numeradas aguardando as anteriores, por gseq"""
+        return [self.multicast.to_dict(self.held[gseq]) for gseq in sorted(self.held)[:limit]]
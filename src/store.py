@@ -0,0 +1,88 @@
+"""
+Histórico de mensagens entregues com memória limitada
+Mensagens estáveis (entregues e com ACK de todos) saem da fila de espera
+e ficam em um anel de tamanho fixo, paginado por número de sequência de entrega.
+Os ids das últimas estáveis ficam em uma janela à parte, para descartar cópias.
+"""
+from collections import deque
+from typing import Deque, List, Optional, Set, Tuple
+from .models import Message
+
+# Quantidade padrão de mensagens entregues mantidas em memória
+DEFAULT_HISTORY_SIZE = 1000
+# Ids de mensagens estáveis lembrados para descartar cópias repetidas
+DEFAULT_STABLE_IDS = 10000
+
+
+class DeliveredLog:
+    """Anel com as últimas `capacity` mensagens entregues
+
+    Cada entrega recebe um número de sequência crescente (0, 1, 2, ...),
+    usado como cursor de paginação. As mais antigas são sobrescritas."""
+
+    def __init__(self, capacity: int = DEFAULT_HISTORY_SIZE):
+        if capacity < 1:
+            raise ValueError("capacity deve ser >= 1")
+        self.capacity = capacity
+        self._ring: List[Optional[Message]] = [None] * capacity
+        self.next_seq = 0
+
+    @property
+    def first_seq(self) -> int:
+        """Sequência da mensagem mais antiga ainda retida"""
+        return max(0, self.next_seq - self.capacity)
+
+    def __len__(self) -> int:
+        return self.next_seq - self.first_seq
+
+    def append(self, msg: Message) -> int:
+        """Guarda a mensagem entregue e retorna sua sequência de entrega"""
+        seq = self.next_seq
+        self._ring[seq % self.capacity] = msg
+        self.next_seq += 1
+        return seq
+
+    def restore(self, seq: int, msg: Message) -> None:
+        """Recoloca uma entrega com sua sequência original (recuperação do WAL)"""
+        self._ring[seq % self.capacity] = msg
+        self.next_seq = max(self.next_seq, seq + 1)
+
+    def page(self, cursor: Optional[int], limit: int) -> Tuple[List[Tuple[int, Message]], int]:
+        """Retorna até `limit` entregas a partir de `cursor` e o próximo cursor
+
+        Custa O(limit): o cursor é convertido direto em posição no anel.
+        Cursores mais antigos que a retenção começam na mais antiga retida."""
+        start = self.first_seq if cursor is None else max(cursor, self.first_seq)
+        end = min(start + max(limit, 0), self.next_seq)
+        items = [(seq, self._ring[seq % self.capacity]) for seq in range(start, end)]
+        return items, max(end, start)
+
+
+class StableIds:
+    """Ids das últimas `capacity` mensagens estáveis (entregues), com busca O(1)
+
+    Cópias repetidas (reenvios de /msg e /ack após timeout) de uma mensagem
+    que já saiu da fila de espera são reconhecidas aqui. Os ids entram na
+    entrega e saem na ordem em que entraram, então a memória não cresce com
+    o tempo de execução."""
+
+    def __init__(self, capacity: int = DEFAULT_STABLE_IDS):
+        if capacity < 1:
+            raise ValueError("capacity deve ser >= 1")
+        self.capacity = capacity
+        self._order: Deque[str] = deque()
+        self._ids: Set[str] = set()
+
+    def __contains__(self, message_id: str) -> bool:
+        return message_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, message_id: str) -> None:
+        if message_id in self._ids:
+            return
+        self._order.append(message_id)
+        self._ids.add(message_id)
+        if len(self._order) > self.capacity:
+            self._ids.discard(self._order.popleft())
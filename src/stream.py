@@ -0,0 +1,98 @@
+"""
+Distribuição das mensagens entregues para os assinantes de /multicast/stream
+Cada assinante tem uma fila limitada; quem não acompanha é desconectado
+(evento "lagged") e retoma a partir do último id recebido
+"""
+import asyncio
+from typing import Any, Optional, Set, Tuple
+from .models import Message
+
+# Mensagens pendentes por assinante antes de ser considerado lento
+DEFAULT_SUBSCRIBER_QUEUE_SIZE = 256
+# Máximo de assinantes simultâneos por processo
+DEFAULT_MAX_SUBSCRIBERS = 64
+
+
+class Subscription:
+    """Fila de entregas de um assinante"""
+
+    def __init__(self, queue_size: int):
+        # Itens (seq, Message), ou (None, intervalo) para mensagens abandonadas;
+        # None na fila sinaliza que o assinante ficou para trás
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.lagged = False
+
+
+class TooManySubscribers(Exception):
+    """Limite de assinantes simultâneos atingido"""
+
+
+class DeliveryStream:
+    """Publica cada mensagem entregue para todos os assinantes, sem bloquear"""
+
+    def __init__(self, queue_size: int = DEFAULT_SUBSCRIBER_QUEUE_SIZE,
+                 max_subscribers: int = DEFAULT_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: Set[Subscription] = set()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscription:
+        if len(self._subscribers) >= self.max_subscribers:
+            raise TooManySubscribers()
+        sub = Subscription(self.queue_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subscribers.discard(sub)
+
+    def publish(self, seq: int, msg: Message) -> None:
+        """Entrega (seq, msg) a cada assinante; assinantes com a fila cheia são descartados"""
+        self._put((seq, msg))
+
+    def publish_skipped(self, process_id: int, first: int, last: int) -> None:
+        """Avisa que as mensagens `first`..`last` de `process_id` nunca serão entregues"""
+        self._put((None, {'processId': process_id, 'fromSeq': first, 'toSeq': last}))
+
+    def _put(self, item: Tuple[Optional[int], Any]) -> None:
+        if not self._subscribers:
+            return
+        for sub in list(self._subscribers):
+            try:
+                sub.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self._drop(sub)
+
+    def _drop(self, sub: Subscription) -> None:
+        """Esvazia a fila do assinante lento e o avisa com None"""
+        self._subscribers.discard(sub)
+        sub.lagged = True
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(None)
+
+
+def parse_position(value: Optional[str]) -> Optional[Tuple[Optional[int], int]]:
+    """Converte o id de evento recebido ("2:12") em (processo, sequência de entrega)
+
+    A sequência segue a ordem de entrega do processo que emitiu o evento,
+    qualquer que seja a ordem de cada mensagem ('total', 'causal', 'fifo' ou
+    'sequencer'), então só vale nele. Um inteiro sozinho ("12") é uma
+    sequência deste processo (processo None)."""
+    if value is None or value == '':
+        return None
+    process, sep, seq_text = value.rpartition(':')
+    process_id = int(process) if sep else None
+    seq = int(seq_text)
+    if seq < 0 or (process_id is not None and process_id < 0):
+        raise ValueError("posição negativa")
+    return process_id, seq
+
+
+def event_id(process_id: int, seq: int) -> str:
+    """Id SSE da entrega `seq` do processo, aceito de volta em `since` / Last-Event-ID"""
+    return f"{process_id}:{seq}"
+
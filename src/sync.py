@@ -0,0 +1,313 @@
+"""
+Anti-entropia do multicast: um processo que volta de um reinício ou de uma
+partição recupera só as mensagens que perdeu
+Cada processo resume o que já viu de cada remetente pela maior sequência
+contígua mais as sequências isoladas acima dela. Em segundo plano, troca o
+resumo com um peer sorteado (push-pull) e cada lado busca em lote apenas
+os intervalos que faltam.
+"""
+import asyncio
+import bisect
+import random
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .logs import EventLog
+from .transport import PeerError, PeerTransport
+
+# Intervalo (segundos) entre duas trocas de resumo
+DEFAULT_SYNC_INTERVAL = 1.0
+# Máximo de mensagens devolvidas por /sync/pull
+MAX_PULL = 1000
+
+Ranges = Dict[int, List[Tuple[int, int]]]
+
+
+class SenderWatermark:
+    """Sequências vistas de um remetente: 1..contiguous mais `extras` acima"""
+    __slots__ = ('contiguous', 'extras')
+
+    def __init__(self, contiguous: int = 0, extras: Optional[Set[int]] = None):
+        self.contiguous = contiguous
+        self.extras: Set[int] = extras or set()
+
+    def __contains__(self, seq: int) -> bool:
+        return seq <= self.contiguous or seq in self.extras
+
+    def add(self, seq: int) -> bool:
+        """Marca `seq` como vista; False se já tinha sido vista"""
+        if seq in self:
+            return False
+        if seq == self.contiguous + 1:
+            self.contiguous = seq
+            while self.contiguous + 1 in self.extras:
+                self.contiguous += 1
+                self.extras.discard(self.contiguous)
+        else:
+            self.extras.add(seq)
+        return True
+
+    def skip(self, lo: int, hi: int) -> None:
+        """Dá o intervalo [lo, hi] por visto (mensagens que ninguém mais retém)"""
+        if lo <= self.contiguous + 1:
+            self.contiguous = max(self.contiguous, hi)
+            self.extras = {seq for seq in self.extras if seq > self.contiguous}
+            while self.contiguous + 1 in self.extras:
+                self.contiguous += 1
+                self.extras.discard(self.contiguous)
+        else:
+            self.extras.update(range(lo, hi + 1))
+
+    @property
+    def highest(self) -> int:
+        return max(self.extras, default=self.contiguous)
+
+    def missing_from(self, other: 'SenderWatermark') -> List[Tuple[int, int]]:
+        """Intervalos [lo, hi] que `other` já viu e este resumo não"""
+        ranges: List[Tuple[int, int]] = []
+
+        def add(seq: int) -> None:
+            if ranges and ranges[-1][1] == seq - 1:
+                ranges[-1] = (ranges[-1][0], seq)
+            else:
+                ranges.append((seq, seq))
+
+        # Trecho contíguo do outro lado: percorre só as lacunas deste resumo
+        start = self.contiguous + 1
+        for extra in sorted(e for e in self.extras if e <= other.contiguous):
+            if extra > start:
+                ranges.append((start, extra - 1))
+            start = extra + 1
+        if start <= other.contiguous:
+            ranges.append((start, other.contiguous))
+        for seq in sorted(other.extras):
+            if seq not in self:
+                add(seq)
+        return ranges
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'contiguous': self.contiguous, 'extras': sorted(self.extras)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SenderWatermark':
+        return cls(int(data.get('contiguous', 0)), {int(s) for s in data.get('extras', ())})
+
+
+class SeenIndex:
+    """Resumo do que este processo já viu, por remetente"""
+
+    def __init__(self):
+        self.senders: Dict[int, SenderWatermark] = {}
+
+    def add(self, process_id: int, seq: int) -> bool:
+        watermark = self.senders.get(process_id)
+        if watermark is None:
+            watermark = self.senders[process_id] = SenderWatermark()
+        return watermark.add(seq)
+
+    def skip(self, process_id: int, lo: int, hi: int) -> None:
+        watermark = self.senders.get(process_id)
+        if watermark is None:
+            watermark = self.senders[process_id] = SenderWatermark()
+        watermark.skip(lo, hi)
+
+    def __contains__(self, key: Tuple[int, int]) -> bool:
+        watermark = self.senders.get(key[0])
+        return watermark is not None and key[1] in watermark
+
+    def summary(self) -> Dict[str, Any]:
+        return {str(pid): watermark.to_dict() for pid, watermark in self.senders.items()}
+
+    def missing(self, summary: Dict[str, Any]) -> Ranges:
+        """Intervalos que o resumo do peer tem e este processo não"""
+        result: Ranges = {}
+        for key, data in summary.items():
+            theirs = SenderWatermark.from_dict(data)
+            ours = self.senders.get(int(key)) or SenderWatermark()
+            ranges = ours.missing_from(theirs)
+            if ranges:
+                result[int(key)] = ranges
+        return result
+
+
+class AntiEntropyService:
+    """Troca periódica de resumos e busca em lote das mensagens que faltam"""
+
+    def __init__(self, process_id: int, total_processes: int, multicast,
+                 transport: Optional[PeerTransport] = None,
+                 interval: float = DEFAULT_SYNC_INTERVAL):
+        self.process_id = process_id
+        self.log = EventLog(process_id, 'sync')
+        self.total_processes = total_processes
+        self.multicast = multicast
+        self.transport = transport or multicast.transport
+        self.interval = interval
+        self.pulled = 0
+        self._pulling: Set[int] = set()
+        # (remetente, seq) -> bitmask dos peers que responderam que não a retêm
+        self._unavailable: Dict[Tuple[int, int], int] = {}
+        # Bitmask de todos os peers (sem este processo)
+        self._all_peers = ((1 << total_processes) - 1) & ~(1 << process_id)
+        self._task: Optional[asyncio.Task] = None
+        multicast.confirm_send_seq = self.confirm_send_seq
+
+    def start(self) -> None:
+        if self._task is None and self.total_processes > 1:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def catch_up(self) -> int:
+        """Uma rodada com cada peer (ao iniciar: recupera o que perdeu fora do ar)"""
+        total = 0
+        for peer_id in range(self.total_processes):
+            if peer_id != self.process_id:
+                total += await self.sync_with(peer_id)
+        return total
+
+    async def confirm_send_seq(self) -> bool:
+        """Rodada com todos os peers ao mesmo tempo antes do primeiro envio (ver adopt_send_seq)
+
+        True se algum respondeu; a sequência adotada é a maior que eles viram."""
+        await asyncio.gather(*(self.sync_with(peer_id) for peer_id in range(self.total_processes)
+                               if peer_id != self.process_id))
+        return self.multicast.send_seq_confirmed
+
+    async def _loop(self) -> None:
+        try:
+            await self.catch_up()
+        except Exception as e:
+            self.log.error('sync_error', "❌ Erro na anti-entropia: {error}", error=str(e))
+        while True:
+            await asyncio.sleep(self.interval * random.uniform(0.5, 1.5))
+            try:
+                await self.sync_with(self._random_peer())
+            except Exception as e:
+                self.log.error('sync_error', "❌ Erro na anti-entropia: {error}", error=str(e))
+
+    def _random_peer(self) -> int:
+        return random.choice([pid for pid in range(self.total_processes) if pid != self.process_id])
+
+    async def sync_with(self, peer_id: int) -> int:
+        """Uma rodada push-pull com `peer_id`; retorna quantas mensagens buscou"""
+        try:
+            data = await self.transport.post(
+                peer_id, '/sync/summary',
+                {'process_id': self.process_id, 'senders': self.multicast.seen.summary()},
+                timeout=2
+            )
+        except PeerError:
+            return 0
+        senders = data.get('senders', {})
+        self._adopt_send_seq(senders)
+        return await self.pull(peer_id, self.multicast.seen.missing(senders))
+
+    def receive_summary(self, process_id: int, senders: Dict[str, Any]) -> Dict[str, Any]:
+        """Responde com o próprio resumo e, se o peer tiver algo novo, busca em seguida"""
+        self._adopt_send_seq(senders)
+        missing = self.multicast.seen.missing(senders)
+        if missing and process_id not in self._pulling:
+            asyncio.create_task(self.pull(process_id, missing))
+        return {'process_id': self.process_id, 'senders': self.multicast.seen.summary()}
+
+    def _adopt_send_seq(self, senders: Dict[str, Any]) -> None:
+        """Após um reinício sem WAL, não reutiliza sequências que os peers já viram"""
+        own = senders.get(str(self.process_id))
+        self.multicast.adopt_send_seq(SenderWatermark.from_dict(own).highest if own is not None else 0)
+
+    async def pull(self, peer_id: int, missing: Ranges) -> int:
+        """Busca em /sync/pull os intervalos que faltam e os entrega ao multicast"""
+        if not missing or peer_id in self._pulling:
+            return 0
+        self._pulling.add(peer_id)
+        try:
+            data = await self.transport.post(
+                peer_id, '/sync/pull',
+                {'ranges': {str(pid): ranges for pid, ranges in missing.items()}, 'limit': MAX_PULL},
+                timeout=5
+            )
+        except PeerError as e:
+            self.log.warning('sync_pull_failed', "❌ Erro buscando mensagens de Processo {peer}: {error}",
+                             peer=peer_id, error=str(e))
+            return 0
+        finally:
+            self._pulling.discard(peer_id)
+
+        messages = data.get('messages', [])
+        count = self.multicast.receive_synced(messages)
+        if count:
+            self.pulled += count
+            self.log.info('sync_recovered', "🔄 Recuperou {count} mensagens de Processo {peer}",
+                          count=count, peer=peer_id)
+        if not data.get('truncated'):
+            self._skip_unavailable(peer_id, missing)
+        return count
+
+    def _skip_unavailable(self, peer_id: int, missing: Ranges) -> None:
+        """O que o peer viu mas não devolveu já saiu do histórico dele
+
+        Um peer só pode ter descartado a mensagem do anel limitado (ou ter
+        voltado sem WAL) enquanto outro ainda a retém, então a resposta de um
+        só não basta: desiste quando o próprio remetente, ou todos os outros
+        peers, responderam que não a têm. Sem isso um processo que voltou sem
+        WAL pediria para sempre as mensagens antigas, e o resumo dele nunca
+        voltaria a ser contíguo. Cada intervalo abandonado aparece no status e
+        no stream (ver MulticastService.skip_unavailable)."""
+        seen = self.multicast.seen
+        for key in [key for key in self._unavailable if key in seen]:
+            del self._unavailable[key]
+        lost = 0
+        for process_id, ranges in missing.items():
+            for lo, hi in ranges:
+                start = None
+                for seq in range(lo, hi + 2):
+                    if seq <= hi and (process_id, seq) not in seen and self._confirmed(process_id, seq, peer_id):
+                        if start is None:
+                            start = seq
+                    elif start is not None:
+                        self.multicast.skip_unavailable(process_id, start, seq - 1)
+                        lost += seq - start
+                        start = None
+        if lost:
+            self.log.warning('sync_unavailable',
+                             "⚠️ {lost} mensagens não estão mais retidas no Processo {peer}, ignoradas",
+                             lost=lost, peer=peer_id)
+
+    def _confirmed(self, process_id: int, seq: int, peer_id: int) -> bool:
+        """Registra que `peer_id` não retém a mensagem; True se já dá para desistir dela"""
+        key = (process_id, seq)
+        answered = self._unavailable.get(key, 0) | 1 << peer_id
+        sender_gone = process_id != self.process_id and answered >> process_id & 1
+        if sender_gone or answered & self._all_peers == self._all_peers:
+            self._unavailable.pop(key, None)
+            return True
+        self._unavailable[key] = answered
+        return False
+
+    def serve_pull(self, ranges: Dict[str, List[List[int]]], limit: int = MAX_PULL) -> Dict[str, Any]:
+        """Mensagens retidas nos intervalos pedidos (no máximo `limit`)
+
+        Percorre só o que está retido (histórico e fila de espera), então o
+        custo não depende do tamanho dos intervalos pedidos."""
+        limit = max(0, min(limit, MAX_PULL))
+        wanted = {int(key): sorted((lo, hi) for lo, hi in pairs) for key, pairs in ranges.items()}
+        items, _ = self.multicast.history.page(None, self.multicast.history.capacity)
+        retained = [msg for _, msg in items] + self.multicast.undelivered()
+        found = sorted(
+            (msg for msg in retained if msg.seq and _in_ranges(wanted.get(msg.processId), msg.seq)),
+            key=lambda msg: (msg.processId, msg.seq)
+        )
+        return {'messages': [self.multicast.to_sync_dict(msg) for msg in found[:limit]],
+                'truncated': len(found) > limit}
+
+
+def _in_ranges(pairs: Optional[List[Tuple[int, int]]], seq: int) -> bool:
+    if not pairs:
+        return False
+    index = bisect.bisect_right(pairs, (seq, float('inf'))) - 1
+    return index >= 0 and pairs[index][0] <= seq <= pairs[index][1]
@@ -0,0 +1,110 @@
+"""
+Transporte HTTP assíncrono entre processos
+Um pool de conexões keep-alive por peer, compartilhado por eleição, mutex e multicast
+"""
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from .metrics import Metrics
+
+# Timeout padrão (segundos) das chamadas entre processos
+DEFAULT_TIMEOUT = 2.0
+
+
+class PeerError(Exception):
+    """Falha de comunicação com um peer (conexão, timeout ou status HTTP de erro)
+
+    `status` é o status HTTP da resposta (None sem resposta: conexão ou timeout)."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def transient(self) -> bool:
+        """Vale reenviar? Sem resposta, 429 e 5xx sim; os demais 4xx se repetiriam sempre"""
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+class PeerTransport:
+    """Cliente HTTP assíncrono com um pool de conexões por peer"""
+
+    def __init__(self, peers: List[str], max_connections: int = 10,
+                 keepalive_expiry: float = 30.0, metrics: Optional[Metrics] = None):
+        self.peers = peers
+        self.metrics = metrics or Metrics()
+        # Séries de RTT/erros por (peer, path), para não recriar labels a cada chamada
+        self._series: Dict[Tuple[int, str], tuple] = {}
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self._clients: Dict[int, httpx.AsyncClient] = {}
+
+    def _client(self, peer_id: int) -> httpx.AsyncClient:
+        """Cria sob demanda o cliente (e o pool) do peer"""
+        client = self._clients.get(peer_id)
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=self.peers[peer_id],
+                limits=self._limits,
+                timeout=DEFAULT_TIMEOUT
+            )
+            self._clients[peer_id] = client
+        return client
+
+    def _peer_series(self, peer_id: int, path: str) -> tuple:
+        series = self._series.get((peer_id, path))
+        if series is None:
+            series = (
+                self.metrics.peer_request_duration.labels(peer_id, path),
+                self.metrics.peer_request_errors.labels(peer_id, path),
+            )
+            self._series[(peer_id, path)] = series
+        return series
+
+    async def post(self, peer_id: int, path: str, payload: Optional[Dict[str, Any]] = None,
+                   timeout: Optional[float] = None, content: Optional[bytes] = None,
+                   content_type: Optional[str] = None,
+                   headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Envia POST para o peer e retorna a resposta JSON decodificada
+
+        O corpo é `payload` em JSON ou, se informado, `content` já codificado
+        com o `content_type` dado. Levanta PeerError em falha de conexão,
+        timeout ou status >= 400."""
+        url = f"{self.peers[peer_id]}{path}"
+        headers = dict(headers or {})
+        if content is not None:
+            headers['Content-Type'] = content_type
+            body = {'content': content}
+        else:
+            body = {'json': payload}
+        rtt, errors = self._peer_series(peer_id, path)
+        start = time.perf_counter()
+        try:
+            response = await self._client(peer_id).post(
+                path,
+                timeout=timeout if timeout is not None else DEFAULT_TIMEOUT,
+                headers=headers,
+                **body
+            )
+        except httpx.HTTPError as e:
+            errors.inc()
+            raise PeerError(f"{url}: {type(e).__name__} {e}") from e
+
+        if response.status_code >= 400:
+            errors.inc()
+            raise PeerError(f"{url}: HTTP {response.status_code}", response.status_code)
+        rtt.observe(time.perf_counter() - start)
+        try:
+            return response.json()
+        except ValueError:
+            return {}
+
+    async def close(self) -> None:
+        """Fecha todos os pools de conexão"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
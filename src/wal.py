@@ -0,0 +1,481 @@
+"""
+Log de escrita antecipada (WAL) do multicast, em segmentos só de acréscimo
+Cada evento (mensagem enfileirada, ACK, entrega) vira um registro binário
+curto. Os registros se acumulam em memória e uma única tarefa os grava com
+um fsync por grupo (group commit), fora do loop de eventos. A cada
+`snapshot_every` registros o estado inteiro vai para um snapshot e os
+segmentos anteriores são apagados: o reinício lê o snapshot e só a cauda
+do log, com leituras via mmap.
+
+Registro: tamanho (u32) | crc32 (u32) | tipo (u8) | corpo
+Inteiros em big-endian, textos em UTF-8, bitmasks de ACK como bytes big-endian.
+"""
+import asyncio
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+from .logs import EventLog
+from .metrics import Metrics
+
+# Tipos de registro do log
+REC_MESSAGE = 1
+REC_ACK = 2
+REC_DELIVER = 3
+# Mensagem 'causal'/'fifo'/'sequencer' (também usado no snapshot para as que aguardam);
+# a lista de inteiros é o vclock ou o [sequenciador, mandato, gseq, base]
+REC_CAUSAL = 4
+# Estado da ordem 'sequencer': mandato, sequenciador (-1 = nenhum), mandato da base, base
+# e último gseq entregue
+REC_SEQUENCER = 5
+# Tipos de registro do snapshot
+REC_STATE = 10
+REC_HISTORY = 11
+REC_PENDING = 12
+REC_EARLY_ACK = 13
+REC_SEEN = 14
+REC_VECTOR = 15
+REC_CAUSAL_HISTORY = 16
+
+# Janela (segundos) em que os registros se acumulam antes de um fsync
+DEFAULT_COMMIT_INTERVAL = 0.002
+# Registros entre dois snapshots
+DEFAULT_SNAPSHOT_EVERY = 10000
+# Tamanho (bytes) a partir do qual um segmento é fechado
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+# Bytes ainda não gravados a partir dos quais novas operações são recusadas
+DEFAULT_MAX_BUFFER_BYTES = 64 * 1024 * 1024
+
+_FRAME = struct.Struct('!IIB')
+_MESSAGE = struct.Struct('!qiqIHI')
+_ACK = struct.Struct('!qiH')
+_DELIVER = struct.Struct('!qH')
+_STATE = struct.Struct('!qqq')
+_HISTORY = struct.Struct('!qiqIHIH')
+_PENDING = struct.Struct('!iqIHIH')
+_EARLY_ACK = struct.Struct('!HH')
+_SEEN = struct.Struct('!iqI')
+_SEQ = struct.Struct('!q')
+_CAUSAL = struct.Struct('!iqIBHHI')
+_SEQUENCER = struct.Struct('!qiqqq')
+
+Record = Tuple[Any, ...]
+
+
+def _mask_bytes(mask: int) -> bytes:
+    return mask.to_bytes((mask.bit_length() + 7) // 8, 'big')
+
+
+def _causal_body(process_id: int, timestamp: int, seq: int, order: int, vclock: List[int],
+                 message_id: str, content: str) -> bytes:
+    """Corpo comum de REC_CAUSAL e REC_CAUSAL_HISTORY (ordem = índice em DELIVERY_ORDERS)"""
+    mid, text = message_id.encode(), content.encode()
+    return (_CAUSAL.pack(process_id, timestamp, seq, order, len(vclock), len(mid), len(text))
+            + b''.join(_SEQ.pack(v) for v in vclock) + mid + text)
+
+
+def _decode_causal(buf, pos: int) -> Record:
+    process_id, timestamp, seq, order, count, id_len, text_len = _CAUSAL.unpack_from(buf, pos)
+    pos += _CAUSAL.size
+    vclock = [_SEQ.unpack_from(buf, pos + i * _SEQ.size)[0] for i in range(count)]
+    pos += count * _SEQ.size
+    message_id = bytes(buf[pos:pos + id_len]).decode()
+    content = bytes(buf[pos + id_len:pos + id_len + text_len]).decode()
+    return (process_id, timestamp, seq, order, vclock, message_id, content)
+
+
+def encode_record(record: Record) -> bytes:
+    """Codifica um registro (tupla começando pelo tipo) com tamanho e CRC"""
+    kind = record[0]
+    if kind == REC_MESSAGE:
+        _, clock, process_id, timestamp, seq, message_id, content = record
+        mid, text = message_id.encode(), content.encode()
+        body = _MESSAGE.pack(clock, process_id, timestamp, seq, len(mid), len(text)) + mid + text
+    elif kind == REC_ACK:
+        _, clock, process_id, message_id = record
+        mid = message_id.encode()
+        body = _ACK.pack(clock, process_id, len(mid)) + mid
+    elif kind == REC_DELIVER:
+        _, clock, message_id = record
+        mid = message_id.encode()
+        body = _DELIVER.pack(clock, len(mid)) + mid
+    elif kind == REC_CAUSAL:
+        body = _SEQ.pack(record[1]) + _causal_body(*record[2:])
+    elif kind == REC_SEQUENCER:
+        body = _SEQUENCER.pack(*record[1:])
+    elif kind == REC_STATE:
+        _, clock, delivered_count, next_seq = record
+        body = _STATE.pack(clock, delivered_count, next_seq)
+    elif kind == REC_HISTORY:
+        _, position, process_id, timestamp, seq, message_id, content, acks = record
+        mid, text, mask = message_id.encode(), content.encode(), _mask_bytes(acks)
+        body = _HISTORY.pack(position, process_id, timestamp, seq,
+                             len(mid), len(text), len(mask)) + mid + text + mask
+    elif kind == REC_PENDING:
+        _, process_id, timestamp, seq, message_id, content, acks = record
+        mid, text, mask = message_id.encode(), content.encode(), _mask_bytes(acks)
+        body = _PENDING.pack(process_id, timestamp, seq, len(mid), len(text), len(mask)) + mid + text + mask
+    elif kind == REC_EARLY_ACK:
+        _, message_id, acks = record
+        mid, mask = message_id.encode(), _mask_bytes(acks)
+        body = _EARLY_ACK.pack(len(mid), len(mask)) + mid + mask
+    elif kind == REC_SEEN:
+        _, process_id, contiguous, extras = record
+        body = _SEEN.pack(process_id, contiguous, len(extras)) + b''.join(_SEQ.pack(s) for s in extras)
+    elif kind == REC_VECTOR:
+        _, vclock = record
+        body = _SEQ.pack(len(vclock)) + b''.join(_SEQ.pack(v) for v in vclock)
+    elif kind == REC_CAUSAL_HISTORY:
+        body = _SEQ.pack(record[1]) + _causal_body(*record[2:])
+    else:
+        raise ValueError(f"tipo de registro desconhecido: {kind}")
+    payload = bytes((kind,)) + body
+    return _FRAME.pack(len(payload), zlib.crc32(payload), kind) + body
+
+
+def _decode_body(kind: int, buf, pos: int) -> Record:
+    if kind == REC_MESSAGE:
+        clock, process_id, timestamp, seq, id_len, text_len = _MESSAGE.unpack_from(buf, pos)
+        pos += _MESSAGE.size
+        message_id = bytes(buf[pos:pos + id_len]).decode()
+        content = bytes(buf[pos + id_len:pos + id_len + text_len]).decode()
+        return (REC_MESSAGE, clock, process_id, timestamp, seq, message_id, content)
+    if kind == REC_ACK:
+        clock, process_id, id_len = _ACK.unpack_from(buf, pos)
+        pos += _ACK.size
+        return (REC_ACK, clock, process_id, bytes(buf[pos:pos + id_len]).decode())
+    if kind == REC_DELIVER:
+        clock, id_len = _DELIVER.unpack_from(buf, pos)
+        pos += _DELIVER.size
+        return (REC_DELIVER, clock, bytes(buf[pos:pos + id_len]).decode())
+    if kind in (REC_CAUSAL, REC_CAUSAL_HISTORY):
+        return (kind, _SEQ.unpack_from(buf, pos)[0]) + _decode_causal(buf, pos + _SEQ.size)
+    if kind == REC_SEQUENCER:
+        return (REC_SEQUENCER,) + _SEQUENCER.unpack_from(buf, pos)
+    if kind == REC_STATE:
+        return (REC_STATE,) + _STATE.unpack_from(buf, pos)
+    if kind == REC_HISTORY:
+        position, process_id, timestamp, seq, id_len, text_len, mask_len = _HISTORY.unpack_from(buf, pos)
+        pos += _HISTORY.size
+        message_id = bytes(buf[pos:pos + id_len]).decode()
+        pos += id_len
+        content = bytes(buf[pos:pos + text_len]).decode()
+        pos += text_len
+        acks = int.from_bytes(buf[pos:pos + mask_len], 'big')
+        return (REC_HISTORY, position, process_id, timestamp, seq, message_id, content, acks)
+    if kind == REC_PENDING:
+        process_id, timestamp, seq, id_len, text_len, mask_len = _PENDING.unpack_from(buf, pos)
+        pos += _PENDING.size
+        message_id = bytes(buf[pos:pos + id_len]).decode()
+        pos += id_len
+        content = bytes(buf[pos:pos + text_len]).decode()
+        pos += text_len
+        acks = int.from_bytes(buf[pos:pos + mask_len], 'big')
+        return (REC_PENDING, process_id, timestamp, seq, message_id, content, acks)
+    if kind == REC_EARLY_ACK:
+        id_len, mask_len = _EARLY_ACK.unpack_from(buf, pos)
+        pos += _EARLY_ACK.size
+        message_id = bytes(buf[pos:pos + id_len]).decode()
+        return (REC_EARLY_ACK, message_id, int.from_bytes(buf[pos + id_len:pos + id_len + mask_len], 'big'))
+    if kind == REC_SEEN:
+        process_id, contiguous, count = _SEEN.unpack_from(buf, pos)
+        pos += _SEEN.size
+        extras = [_SEQ.unpack_from(buf, pos + i * _SEQ.size)[0] for i in range(count)]
+        return (REC_SEEN, process_id, contiguous, extras)
+    if kind == REC_VECTOR:
+        (count,) = _SEQ.unpack_from(buf, pos)
+        return (REC_VECTOR, [_SEQ.unpack_from(buf, pos + (i + 1) * _SEQ.size)[0] for i in range(count)])
+    raise ValueError(f"tipo de registro desconhecido: {kind}")
+
+
+def read_records(path: str) -> Tuple[List[Record], int]:
+    """Lê os registros íntegros de um arquivo via mmap
+
+    Retorna os registros e o offset do fim do último registro válido;
+    um registro truncado ou com CRC errado (escrita interrompida) encerra a leitura."""
+    records: List[Record] = []
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return records, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                pos, end = 0, len(mm)
+                while pos + _FRAME.size <= end:
+                    length, crc, kind = _FRAME.unpack_from(view, pos)
+                    stop = pos + 8 + length
+                    if length == 0 or stop > end or zlib.crc32(view[pos + 8:stop]) != crc:
+                        break
+                    records.append(_decode_body(kind, view, pos + _FRAME.size))
+                    pos = stop
+            finally:
+                view.release()
+    return records, pos
+
+
+def _fsync_dir(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WALError(Exception):
+    """Falha ao gravar no disco; os registros continuam no buffer para a próxima tentativa"""
+
+
+class _FlushRound:
+    """Um grupo de gravação: quem espera por ele acorda com o erro, se houver"""
+    __slots__ = ('done', 'error')
+
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.error: Optional[BaseException] = None
+
+
+class WriteAheadLog:
+    """Log segmentado com group commit e snapshots periódicos
+
+    `snapshot_source` devolve, no instante da chamada, os registros que
+    descrevem o estado inteiro; é chamado no loop junto com a cópia do
+    buffer, então o snapshot corresponde exatamente aos registros anteriores."""
+
+    def __init__(self, directory: str,
+                 snapshot_source: Optional[Callable[[], List[Record]]] = None,
+                 commit_interval: float = DEFAULT_COMMIT_INTERVAL,
+                 snapshot_every: int = DEFAULT_SNAPSHOT_EVERY,
+                 segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 max_buffer_bytes: int = DEFAULT_MAX_BUFFER_BYTES,
+                 fsync: bool = True,
+                 metrics: Optional[Metrics] = None,
+                 process_id: int = 0):
+        self.directory = directory
+        self.log = EventLog(process_id, 'wal')
+        self.snapshot_source = snapshot_source
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        self.segment_bytes = segment_bytes
+        self.max_buffer_bytes = max_buffer_bytes
+        self.fsync = fsync
+        self.metrics = metrics or Metrics()
+        os.makedirs(directory, exist_ok=True)
+        # Número de sequência (LSN) do próximo registro e do último durável
+        self.next_lsn = 0
+        self.durable_lsn = 0
+        self._snapshot_lsn = 0
+        self._buffer = bytearray()
+        self._file = None
+        self._path: Optional[str] = None
+        self._segment_size = 0
+        self._dirty = asyncio.Event()
+        self._round = _FlushRound()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    # ==================== RECUPERAÇÃO ====================
+
+    def _list(self, prefix: str) -> List[Tuple[int, str]]:
+        """(lsn, caminho) dos arquivos `prefix-<lsn>.*`, em ordem crescente"""
+        found = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix + '-') and not name.endswith('.tmp'):
+                lsn = int(name[len(prefix) + 1:].split('.')[0])
+                found.append((lsn, os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def recover(self) -> Iterator[Record]:
+        """Registros do último snapshot seguidos da cauda do log
+
+        Descarta a cauda corrompida do último segmento e deixa o log pronto
+        para novos acréscimos a partir do LSN seguinte."""
+        snapshots = self._list('snapshot')
+        if snapshots:
+            self._snapshot_lsn, path = snapshots[-1]
+            records, _ = read_records(path)
+            yield from records
+        lsn = self._snapshot_lsn
+        last_path, last_end = None, 0
+        for first_lsn, path in self._list('wal'):
+            if first_lsn < self._snapshot_lsn:
+                continue
+            records, last_end = read_records(path)
+            last_path = path
+            lsn = first_lsn + len(records)
+            yield from records
+        self.next_lsn = self.durable_lsn = lsn
+        if last_path is not None:
+            # Continua no último segmento, sem o registro incompleto do fim
+            with open(last_path, 'r+b') as f:
+                f.truncate(last_end)
+            self._path = last_path
+            self._file = open(last_path, 'ab')
+            self._segment_size = last_end
+
+    # ==================== ESCRITA ====================
+
+    @property
+    def buffered(self) -> int:
+        """Bytes acrescentados que ainda não estão no disco"""
+        return len(self._buffer)
+
+    def admit(self) -> None:
+        """Levanta WALError se o buffer atingiu `max_buffer_bytes`
+
+        Chamado na entrada de cada operação, antes de mudar qualquer estado:
+        com o disco falhando o buffer cresceria sem limite. O append em si
+        não recusa, senão uma operação já admitida ficaria pela metade."""
+        if len(self._buffer) >= self.max_buffer_bytes:
+            self.metrics.wal_rejected.inc()
+            raise WALError(f"WAL com {len(self._buffer)} bytes sem gravar "
+                           f"(limite {self.max_buffer_bytes}); tente de novo mais tarde")
+
+    def append(self, record: Record) -> int:
+        """Acrescenta o registro ao buffer e retorna seu LSN (durável após sync())"""
+        if self._closed:
+            raise RuntimeError("WAL fechado")
+        self._buffer += encode_record(record)
+        lsn = self.next_lsn
+        self.next_lsn += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+        self._dirty.set()
+        return lsn
+
+    async def sync(self) -> None:
+        """Espera até todos os registros já acrescentados estarem no disco
+
+        Levanta WALError se a gravação falhar (disco cheio, erro de E/S)."""
+        target = self.next_lsn
+        while self.durable_lsn < target:
+            if self._task is None or self._task.done():
+                self._task = asyncio.create_task(self._flush_loop())
+            self._dirty.set()
+            flush_round = self._round
+            await flush_round.done.wait()
+            if flush_round.error is not None and self.durable_lsn < target:
+                raise WALError(f"falha gravando o WAL: {flush_round.error}") from flush_round.error
+
+    async def close(self) -> None:
+        try:
+            await self.sync()
+        finally:
+            self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def _flush_loop(self) -> None:
+        """Tarefa única de gravação: um write + fsync por grupo de registros"""
+        while True:
+            await self._dirty.wait()
+            # Janela do group commit: junta os registros que chegarem nela
+            await asyncio.sleep(self.commit_interval)
+            self._dirty.clear()
+
+            # O buffer só é descartado depois de gravado: numa falha fica para a próxima
+            data = bytes(self._buffer)
+            target = self.next_lsn
+            snapshot = None
+            if self.snapshot_source is not None and target - self._snapshot_lsn >= self.snapshot_every:
+                # Capturado junto com a cópia do buffer: reflete os registros < target
+                snapshot = b''.join(encode_record(r) for r in self.snapshot_source())
+
+            flush_round, self._round = self._round, _FlushRound()
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, data, self.durable_lsn, target, snapshot)
+            except Exception as e:
+                self.log.error('wal_write_failed', "❌ Falha gravando o WAL: {error}",
+                               error=f"{type(e).__name__} {e}")
+                flush_round.error = e
+                flush_round.done.set()
+                continue
+            if self.fsync:
+                self.metrics.wal_fsync.observe(time.perf_counter() - started)
+
+            del self._buffer[:len(data)]
+            self.durable_lsn = target
+            flush_round.done.set()
+
+    def _open_segment(self, first_lsn: int) -> None:
+        self._path = os.path.join(self.directory, f'wal-{first_lsn:020d}.log')
+        self._file = open(self._path, 'ab')
+        self._segment_size = 0
+        if self.fsync:
+            _fsync_dir(self.directory)
+
+    def _write(self, data: bytes, first_lsn: int, lsn: int, snapshot: Optional[bytes]) -> None:
+        """Grava o grupo (em uma thread): registros de `first_lsn` até `lsn` - 1"""
+        if self._file is None:
+            self._open_segment(first_lsn)
+        if data:
+            try:
+                self._file.write(data)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except OSError:
+                self._discard_partial()
+                raise
+            self._segment_size += len(data)
+
+        try:
+            if snapshot is not None:
+                self._write_snapshot(snapshot, lsn)
+                self._file.close()
+                self._open_segment(lsn)
+                self._compact(lsn)
+            elif self._segment_size >= self.segment_bytes:
+                self._file.close()
+                self._open_segment(lsn)
+        except OSError as e:
+            # O grupo já está no disco; snapshot e troca de segmento ficam para o próximo
+            self.log.warning('wal_maintenance_failed', "⚠️ Falha no snapshot/segmento do WAL: {error}",
+                             error=str(e))
+            if self._file is not None and self._file.closed:
+                self._file = None
+
+    def _discard_partial(self) -> None:
+        """Desfaz a gravação parcial de um grupo: o segmento volta ao último registro inteiro
+
+        O grupo é regravado inteiro em um segmento novo na próxima tentativa."""
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._file = None
+        try:
+            os.truncate(self._path, self._segment_size)
+        except OSError:
+            # A recuperação descarta o registro incompleto do fim
+            pass
+
+    def _write_snapshot(self, snapshot: bytes, lsn: int) -> None:
+        path = os.path.join(self.directory, f'snapshot-{lsn:020d}.bin')
+        with open(path + '.tmp', 'wb') as f:
+            f.write(snapshot)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        if self.fsync:
+            _fsync_dir(self.directory)
+        self._snapshot_lsn = lsn
+
+    def _compact(self, lsn: int) -> None:
+        """Apaga snapshots e segmentos cobertos pelo snapshot em `lsn`"""
+        for first_lsn, path in self._list('wal'):
+            if first_lsn < lsn:
+                os.remove(path)
+        for snapshot_lsn, path in self._list('snapshot'):
+            if snapshot_lsn < lsn:
+                os.remove(path)
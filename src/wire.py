@@ -0,0 +1,139 @@
+"""
+Formato binário dos lotes trocados entre processos (/msg/batch e /ack/batch)
+Negociado pelo Content-Type; JSON continua sendo o padrão para clientes externos
+
+Quadro:   magic "MC" | versão (u8) | tipo (u8) | quantidade (u32)
+Mensagem: id_processo (i32) | timestamp (i64) | seq (u32) | len(id) (u16) | len(conteudo) (u32) |
+          ordem (u8) | len(vclock) (u16) | id | conteudo | vclock (u32 cada)
+ACK:      process_id (i32) | timestamp (i64) | len(message_id) (u16) | len(acks) (u16) | message_id | acks
+Inteiros em big-endian, textos em UTF-8. `acks` é o bitmask de ACKs agrupados
+(difusão em árvore), em bytes big-endian; vazio quando o ACK é só de process_id.
+`ordem` é o índice em DELIVERY_ORDERS; a lista de inteiros (vclock) é o relógio vetorial
+das mensagens 'causal'/'fifo' ou o [sequenciador, mandato, gseq, base] das 'sequencer'
+(vazia enquanto a mensagem não tem número).
+Só a versão atual é aceita na leitura.
+"""
+import struct
+from typing import Any, Dict, List
+from .models import DELIVERY_ORDERS
+
+CONTENT_TYPE = 'application/x-multicast'
+
+MAGIC = b'MC'
+VERSION = 4
+KIND_MESSAGES = 1
+KIND_ACKS = 2
+
+_HEADER = struct.Struct('!2sBBI')
+_MESSAGE = struct.Struct('!iqIHIBH')
+_VCLOCK_ENTRY = struct.Struct('!I')
+_ACK = struct.Struct('!iqHH')
+
+
+class WireError(ValueError):
+    """Quadro binário inválido ou truncado"""
+
+
+def encode_messages(messages: List[Dict[str, Any]]) -> bytes:
+    """Codifica um lote de mensagens no formato de /msg/batch"""
+    parts = [_HEADER.pack(MAGIC, VERSION, KIND_MESSAGES, len(messages))]
+    for data in messages:
+        message_id = data['message_id'].encode()
+        content = data['conteudo'].encode()
+        vclock = data.get('vclock') or data.get('sequence') or ()
+        parts.append(_MESSAGE.pack(
+            data['id_processo'], data['timestamp'], data.get('seq', 0), len(message_id), len(content),
+            DELIVERY_ORDERS.index(data.get('order', 'total')), len(vclock)
+        ))
+        parts.append(message_id)
+        parts.append(content)
+        parts.extend(_VCLOCK_ENTRY.pack(entry) for entry in vclock)
+    return b''.join(parts)
+
+
+def encode_acks(acks: List[Dict[str, Any]]) -> bytes:
+    """Codifica um lote de ACKs no formato de /ack/batch"""
+    parts = [_HEADER.pack(MAGIC, VERSION, KIND_ACKS, len(acks))]
+    for data in acks:
+        message_id = data['message_id'].encode()
+        mask = data.get('acks') or 0
+        mask_bytes = mask.to_bytes((mask.bit_length() + 7) // 8, 'big')
+        parts.append(_ACK.pack(data['process_id'], data['timestamp'], len(message_id), len(mask_bytes)))
+        parts.append(message_id)
+        parts.append(mask_bytes)
+    return b''.join(parts)
+
+
+def _read_header(buf: bytes, kind: int) -> int:
+    """Quantidade de itens do quadro"""
+    if len(buf) < _HEADER.size:
+        raise WireError("quadro truncado")
+    magic, version, frame_kind, count = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION or frame_kind != kind:
+        raise WireError(f"cabeçalho inesperado: {magic!r} v{version} tipo {frame_kind}")
+    return count
+
+
+def decode_messages(buf: bytes) -> List[Dict[str, Any]]:
+    """Decodifica um lote de mensagens para o mesmo formato do JSON de /msg"""
+    count = _read_header(buf, KIND_MESSAGES)
+    offset = _HEADER.size
+    messages = []
+    try:
+        for _ in range(count):
+            (process_id, timestamp, seq, id_len, content_len,
+             order, vclock_len) = _MESSAGE.unpack_from(buf, offset)
+            offset += _MESSAGE.size
+            message_id = buf[offset:offset + id_len].decode()
+            offset += id_len
+            content = buf[offset:offset + content_len].decode()
+            offset += content_len
+            data = {
+                'id_processo': process_id,
+                'timestamp': timestamp,
+                'conteudo': content,
+                'message_id': message_id,
+                'seq': seq
+            }
+            if order:
+                data['order'] = DELIVERY_ORDERS[order]
+                entries = [entry for (entry,) in
+                           _VCLOCK_ENTRY.iter_unpack(buf[offset:offset + vclock_len * 4])]
+                offset += vclock_len * 4
+                if data['order'] != 'sequencer':
+                    data['vclock'] = entries
+                elif entries:
+                    data['sequence'] = entries
+            messages.append(data)
+    except (struct.error, UnicodeDecodeError, IndexError) as e:
+        raise WireError(f"mensagem inválida: {e}") from e
+    if offset != len(buf):
+        raise WireError("tamanho do quadro não confere")
+    return messages
+
+
+def decode_acks(buf: bytes) -> List[Dict[str, Any]]:
+    """Decodifica um lote de ACKs para o mesmo formato do JSON de /ack"""
+    count = _read_header(buf, KIND_ACKS)
+    offset = _HEADER.size
+    acks = []
+    try:
+        for _ in range(count):
+            process_id, timestamp, id_len, mask_len = _ACK.unpack_from(buf, offset)
+            offset += _ACK.size
+            message_id = buf[offset:offset + id_len].decode()
+            offset += id_len
+            data = {
+                'message_id': message_id,
+                'process_id': process_id,
+                'timestamp': timestamp
+            }
+            if mask_len:
+                data['acks'] = int.from_bytes(buf[offset:offset + mask_len], 'big')
+                offset += mask_len
+            acks.append(data)
+    except (struct.error, UnicodeDecodeError) as e:
+        raise WireError(f"ACK inválido: {e}") from e
+    if offset != len(buf):
+        raise WireError("tamanho do quadro não confere")
+    return acks
@@ -0,0 +1,60 @@
+"""
+Worker HTTP e núcleo: a queda do socket do núcleo vira 503, não 500
+"""
+import asyncio
+import dataclasses
+import httpx
+import pytest
+from src.app import create_app
+from src.config import NodeConfig
+from src.core import CoreClient, CoreUnavailable
+
+
+async def _dying_core(path):
+    """Núcleo que aceita a conexão e cai ao receber o primeiro pedido"""
+    async def handle(reader, writer):
+        await reader.read(1)
+        writer.close()
+
+    return await asyncio.start_unix_server(handle, path)
+
+
+def test_pending_call_fails_with_core_unavailable(tmp_path):
+    async def run():
+        path = str(tmp_path / 'core.sock')
+        server = await _dying_core(path)
+        client = CoreClient(path)
+        try:
+            await client.connect()
+            with pytest.raises(CoreUnavailable):
+                await asyncio.wait_for(client.call('multicast.status'), 1)
+            # Sem conexão, os pedidos seguintes falham na hora
+            with pytest.raises(CoreUnavailable):
+                await client.call('multicast.status')
+        finally:
+            await client.close()
+            server.close()
+
+    asyncio.run(run())
+
+
+def test_worker_answers_503_when_the_core_dies(tmp_path):
+    async def run():
+        path = str(tmp_path / 'core.sock')
+        server = await _dying_core(path)
+        config = dataclasses.replace(NodeConfig(total_processes=1, loop_monitor=False),
+                                     role='worker', core_socket=path)
+        app = create_app(config)
+        await app.state.core.connect()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                         base_url='http://worker') as client:
+                response = await client.get('/multicast/status')
+                assert response.status_code == 503
+                assert 'núcleo' in response.json()['detail']
+                assert (await client.get('/multicast/status')).status_code == 503
+        finally:
+            await app.state.core.close()
+            server.close()
+
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+"""
+Locks nomeados: troca de coordenador durante o long-poll e carência após failover
+"""
+import asyncio
+import httpx
+import pytest
+from src.cluster import create_cluster
+from src.config import NodeConfig
+from src.locks import LockUnavailable
+
+
+async def _cluster(base_port):
+    base = NodeConfig(total_processes=3, failure_detector=False, sync_interval_ms=0,
+                      loop_monitor=False, lock_max_lease_ms=300)
+    apps = create_cluster(base, base_port=base_port)
+    nodes = [app.state.node for app in apps.values()]
+    await nodes[2].election.become_coordinator()
+    await asyncio.sleep(0.05)
+    return apps, nodes
+
+
+async def _hand_over(nodes, new):
+    await nodes[new].election.become_coordinator()
+    for node in nodes:
+        if node is not nodes[new]:
+            node.election.receive_coordinator(new, nodes[new].election.election_epoch, relay=False)
+
+
+async def _stop(nodes):
+    for node in nodes:
+        await node.stop()
+
+
+async def _waiter_refused_on_step_down():
+    apps, nodes = await _cluster(5700)
+    try:
+        leader = nodes[2].locks
+        assert (await leader.acquire('a', 'holder'))['granted']
+        waiting = asyncio.create_task(leader.acquire('a', 'waiter', timeout_ms=5000))
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=apps[2]), base_url='http://node2')
+        http_waiting = asyncio.create_task(client.post(
+            '/locks/a/acquire', json={'owner': 'http-waiter', 'timeout_ms': 5000}))
+        await asyncio.sleep(0.05)
+
+        await _hand_over(nodes, 1)
+        with pytest.raises(LockUnavailable):
+            await asyncio.wait_for(waiting, 1)
+        response = await asyncio.wait_for(http_waiting, 1)
+        assert response.status_code == 503
+        await client.aclose()
+    finally:
+        await _stop(nodes)
+
+
+async def _grace_only_after_failover():
+    apps, nodes = await _cluster(5710)
+    try:
+        # Primeiro coordenador: ninguém pode ter lease, concede na hora
+        assert (await nodes[0].locks.acquire('a', 'x'))['granted']
+        await _hand_over(nodes, 1)
+        # Failover: espera os leases do coordenador anterior vencerem
+        assert not (await nodes[0].locks.acquire('b', 'x'))['granted']
+        await asyncio.sleep(0.4)
+        assert (await nodes[0].locks.acquire('b', 'x'))['granted']
+    finally:
+        await _stop(nodes)
+
+
+def test_long_poll_waiter_gets_unavailable_when_coordinator_steps_down():
+    asyncio.run(_waiter_refused_on_step_down())
+
+
+def test_failover_grace_only_after_a_previous_coordinator():
+    asyncio.run(_grace_only_after_failover())
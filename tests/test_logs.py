@@ -0,0 +1,45 @@
+"""
+Logs em JSON: os campos não sobrescrevem as chaves fixas e são copiados na entrada da fila
+"""
+import io
+import json
+import logging
+from src.logs import EventLog, LogPipeline
+
+
+def _lines(pipeline, stream):
+    pipeline.stop()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_fields_with_reserved_names_are_prefixed():
+    stream = io.StringIO()
+    pipeline = LogPipeline('json', stream=stream)
+    pipeline.start()
+    try:
+        EventLog(3, 'test_logs').info('clash', "{msg} de {level}", msg='oi', level=7,
+                                      ts=0, processId=9, to=2)
+    finally:
+        lines = _lines(pipeline, stream)
+    assert len(lines) == 1
+    data = lines[0]
+    assert (data['event'], data['processId'], data['level'], data['msg']) == ('clash', 3, 'INFO', 'oi de 7')
+    assert (data['field_msg'], data['field_level'], data['field_ts'], data['field_processId']) == ('oi', 7, 0, 9)
+    assert data['ts'] > 0
+    assert data['to'] == 2
+
+
+def test_fields_are_copied_when_enqueued():
+    stream = io.StringIO()
+    pipeline = LogPipeline('json', stream=stream)
+    records = []
+    capture = logging.Handler()
+    capture.emit = records.append
+    pipeline.logger.addHandler(capture)
+    fields = {'to': 1}
+    try:
+        EventLog(0, 'test_logs')._log(logging.INFO, 'copy', "para {to}", fields)
+        fields['to'] = 2
+    finally:
+        pipeline.logger.removeHandler(capture)
+    assert records[0].fields == {'to': 1} and records[0].fields is not fields
@@ -0,0 +1,96 @@
+"""
+Caixa de saída por peer: só falhas transitórias são reenviadas
+Um erro que se repetiria (4xx, codificação) descarta o lote, e o receptor
+deixa de esperar por ele pela base do link.
+"""
+import asyncio
+import pytest
+from src.cluster import create_cluster
+from src.config import NodeConfig
+from src.outbox import LinkReceiver, PeerOutbox, parse_link
+from src.transport import PeerError
+
+
+class _Peer:
+    """post_batch falso: aplica os lotes em um LinkReceiver e falha conforme `errors`"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.receiver = LinkReceiver()
+        self.applied = []
+        self.attempts = 0
+
+    async def post_batch(self, peer_id, kind, items, link):
+        self.attempts += 1
+        if self.errors:
+            error = self.errors.pop(0)
+            if error is not None:
+                raise error
+        self.receiver.accept(parse_link(link), lambda: self.applied.extend(items))
+
+
+async def _send(peer, batches, max_in_flight=1):
+    dropped = []
+    outbox = PeerOutbox(1, peer.post_batch, window=0.001, max_size=1, max_in_flight=max_in_flight,
+                        on_drop=dropped.append)
+    for batch in batches:
+        outbox.add_message(batch)
+        await asyncio.sleep(0.02)
+    for _ in range(200):
+        if outbox.depth == 0:
+            break
+        await asyncio.sleep(0.01)
+    return outbox, dropped
+
+
+def test_transient_errors_are_retried():
+    peer = _Peer([PeerError("timeout"), PeerError("HTTP 503", 503), PeerError("HTTP 429", 429)])
+    outbox, dropped = asyncio.run(_send(peer, [{'n': 1}]))
+    assert peer.applied == [{'n': 1}]
+    assert outbox.retries == 3 and dropped == []
+
+
+@pytest.mark.parametrize('error', [PeerError("HTTP 422", 422), UnicodeEncodeError('utf-8', '', 0, 1, 'x')])
+def test_permanent_error_drops_batch_without_blocking_link(error):
+    peer = _Peer([error])
+    outbox, dropped = asyncio.run(_send(peer, [{'n': 1}, {'n': 2}, {'n': 3}]))
+    assert peer.attempts == 3
+    assert outbox.retries == 0 and outbox.dropped == 1 and dropped == [1]
+    # O lote 0 nunca chega, e os seguintes são aplicados mesmo assim
+    assert peer.applied == [{'n': 2}, {'n': 3}]
+
+
+def test_link_receiver_waits_for_batches_still_in_flight():
+    receiver, applied = LinkReceiver(), []
+    # Lote 1 chega antes do 0, que ainda está em voo (base 0): espera
+    receiver.accept((0, 1, 1, 0), lambda: applied.append(1))
+    assert applied == []
+    receiver.accept((0, 1, 0, 0), lambda: applied.append(0))
+    assert applied == [0, 1]
+    # Lote 2 foi descartado pelo remetente: o 3 chega com base 3
+    receiver.accept((0, 1, 3, 3), lambda: applied.append(3))
+    assert applied == [0, 1, 3]
+    assert not receiver.accept((0, 1, 2, 2), lambda: applied.append(2))
+
+
+def test_peer_error_transient_by_status():
+    assert PeerError("conexão").transient
+    assert PeerError("HTTP 500", 500).transient
+    assert PeerError("HTTP 429", 429).transient
+    assert not PeerError("HTTP 400", 400).transient
+    assert not PeerError("HTTP 422", 422).transient
+
+
+def test_content_that_cannot_be_encoded_is_refused_before_enqueue():
+    async def run():
+        base = NodeConfig(total_processes=2, failure_detector=False, sync_interval_ms=0,
+                          loop_monitor=False, wire_format='binary')
+        node = create_cluster(base, base_port=5850)[0].state.node
+        try:
+            with pytest.raises(ValueError):
+                await node.multicast.send_message('\ud800')
+            assert node.multicast.queue_depth() == 0 and node.multicast.send_seq == 0
+        finally:
+            await node.stop()
+
+    asyncio.run(run())
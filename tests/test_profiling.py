@@ -0,0 +1,46 @@
+"""
+Diagnóstico do event loop: /debug/* só quando habilitado e amostragem que falha
+"""
+import asyncio
+import dataclasses
+import httpx
+import pytest
+from src import profiling
+from src.cluster import create_cluster
+from src.config import NodeConfig
+
+
+def test_sampling_error_reaches_the_caller_and_frees_the_profiler(monkeypatch):
+    def broken(thread_id, seconds, interval):
+        raise RuntimeError("sem pilha")
+
+    async def run():
+        monkeypatch.setattr(profiling, '_sample', broken)
+        with pytest.raises(RuntimeError, match="sem pilha"):
+            await asyncio.wait_for(profiling.profile_loop(0.01), 1)
+        monkeypatch.undo()
+        # A próxima amostragem não encontra o profiler ocupado
+        result = await profiling.profile_loop(0.01)
+        assert result['seconds'] == 0.01
+
+    asyncio.run(run())
+
+
+def test_debug_endpoints_hidden_unless_enabled():
+    async def status(debug_endpoints, base_port):
+        base = NodeConfig(total_processes=1, failure_detector=False, sync_interval_ms=0,
+                          loop_monitor=False)
+        if debug_endpoints is not None:
+            base = dataclasses.replace(base, debug_endpoints=debug_endpoints)
+        app = create_cluster(base, base_port=base_port)[0]
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                         base_url='http://node0') as client:
+                return (await client.get('/debug/profile', params={'seconds': 0.01})).status_code
+        finally:
+            await app.state.node.stop()
+
+    assert asyncio.run(status(None, 5770)) == 404
+    assert NodeConfig.from_env({}).debug_endpoints is False
+    assert NodeConfig.from_env({'DEBUG_ENDPOINTS': '1'}).debug_endpoints is True
+    assert asyncio.run(status(True, 5771)) == 200
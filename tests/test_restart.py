@@ -0,0 +1,75 @@
+"""
+Reinício sem WAL: os envios novos não repetem ids nem (remetente, seq) já vistos
+Sem isso os peers descartariam as mensagens como duplicatas, e com a
+anti-entropia desligada o processo nunca voltaria a ser ouvido.
+"""
+import asyncio
+import pytest
+from src.cluster import create_cluster
+from src.config import NodeConfig
+from src.multicast import SendSeqUnknown
+
+
+def _config():
+    return NodeConfig(total_processes=3, failure_detector=False, sync_interval_ms=0,
+                      loop_monitor=False)
+
+
+def _contents(node):
+    return [msg.content for _, msg in node.multicast.history.page(None, 100)[0]]
+
+
+async def _until(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condição não atingida")
+
+
+async def _restart(apps, process_id, base_port):
+    """Troca o nó por um novo, sem estado, ligado aos mesmos peers"""
+    await apps[process_id].state.node.stop()
+    app = create_cluster(_config(), nodes=[process_id], base_port=base_port)[process_id]
+    app.state.node.transport.apps = apps
+    apps[process_id] = app
+    return app.state.node
+
+
+def test_messages_sent_after_restart_are_not_dropped_as_duplicates():
+    async def run():
+        apps = create_cluster(_config(), base_port=5750)
+        nodes = lambda: [app.state.node for app in apps.values()]
+        try:
+            before = await apps[0].state.node.multicast.send_messages(['a', 'b', 'c'])
+            await _until(lambda: all(_contents(node) == ['a', 'b', 'c'] for node in nodes()))
+
+            node = await _restart(apps, 0, 5750)
+            assert node.multicast.send_seq == 0 and not node.multicast.send_seq_confirmed
+            after = await node.multicast.send_message('d')
+            # Continua da sequência que os peers viram, com um id que não existia
+            assert after.seq == 4
+            assert after.id not in {msg.id for msg in before}
+            await _until(lambda: all(_contents(peer)[-1:] == ['d'] for peer in nodes()[1:]))
+            for peer in nodes()[1:]:
+                assert peer.multicast.duplicates['message'] == 0
+                assert (0, 4) in peer.multicast.seen
+        finally:
+            for node in nodes():
+                await node.stop()
+
+    asyncio.run(run())
+
+
+def test_send_refused_when_no_peer_confirms_the_sequence():
+    async def run():
+        # Só o nó 0 existe: os peers estão em portas sem ninguém
+        node = create_cluster(_config(), nodes=[0], base_port=5760)[0].state.node
+        try:
+            with pytest.raises(SendSeqUnknown):
+                await node.multicast.send_message('a')
+            assert node.multicast.send_seq == 0 and node.multicast.queue_depth() == 0
+        finally:
+            await node.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,133 @@
+"""
+Ordem 'sequencer': numeração pelo coordenador, lacunas e troca de sequenciador
+"""
+import asyncio
+from src.cluster import create_cluster
+from src.config import NodeConfig
+from src.models import Message
+
+
+async def _cluster(base_port, coordinator=2):
+    base = NodeConfig(total_processes=3, failure_detector=False, sync_interval_ms=0,
+                      loop_monitor=False, sequencer_resubmit_ms=100)
+    nodes = [app.state.node for app in create_cluster(base, base_port=base_port).values()]
+    await _hand_over(nodes, coordinator)
+    return nodes
+
+
+async def _hand_over(nodes, new):
+    await nodes[new].election.become_coordinator()
+    for node in nodes:
+        if node is not nodes[new]:
+            node.election.receive_coordinator(new, nodes[new].election.election_epoch, relay=False)
+    for _ in range(100):
+        if nodes[new].multicast.sequencer.ready:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("o novo sequenciador não abriu o mandato")
+
+
+def _delivered(node):
+    """(gseq, id) das mensagens 'sequencer' entregues, na ordem de entrega"""
+    return [(msg.sequence[2], msg.id) for _, msg in node.multicast.history.page(None, 1000)[0]
+            if msg.order == 'sequencer']
+
+
+async def _until_delivered(nodes, count):
+    for _ in range(200):
+        if all(len(_delivered(node)) >= count for node in nodes):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError([len(_delivered(node)) for node in nodes])
+
+
+async def _stop(nodes):
+    for node in nodes:
+        await node.stop()
+
+
+def _numbered(process_id, seq, sequence):
+    return Message(id=f'msg-{process_id}-{seq}', processId=process_id, timestamp=seq,
+                   content=f'm{seq}', seq=seq, order='sequencer', sequence=sequence)
+
+
+def test_coordinator_assigns_contiguous_numbers_in_the_same_order_everywhere():
+    async def run():
+        nodes = await _cluster(5720)
+        try:
+            for i in range(6):
+                await nodes[i % 3].multicast.send_message(f's{i}', 'sequencer')
+            await nodes[1].multicast.send_messages(['a', 'b', 'c'], 'sequencer')
+            await _until_delivered(nodes, 9)
+            orders = [_delivered(node) for node in nodes]
+            assert orders[0] == orders[1] == orders[2]
+            assert [gseq for gseq, _ in orders[0]] == list(range(1, 10))
+            # O bloco de um envio recebe números seguidos, na ordem do envio
+            gseqs = {msg.content: msg.sequence[2]
+                     for _, msg in nodes[0].multicast.history.page(None, 10)[0]}
+            assert gseqs['b'] == gseqs['a'] + 1 and gseqs['c'] == gseqs['a'] + 2
+            assert nodes[2].multicast.sequencer.next_gseq == 10
+        finally:
+            await _stop(nodes)
+
+    asyncio.run(run())
+
+
+def test_gap_holds_later_numbers_until_it_is_filled():
+    async def run():
+        nodes = await _cluster(5730)
+        follower = nodes[0].multicast.sequencer
+        term = follower.term
+        try:
+            # Chegam 3 e 2 antes da 1: ficam na fila
+            for gseq in (3, 2):
+                assert follower.receive(_numbered(1, gseq, [2, term, gseq, 0]), relay=False)
+            assert follower.delivered == 0 and sorted(follower.held) == [2, 3]
+            assert _delivered(nodes[0]) == []
+
+            assert follower.receive(_numbered(1, 1, [2, term, 1, 0]), relay=False)
+            assert [gseq for gseq, _ in _delivered(nodes[0])] == [1, 2, 3]
+            assert follower.held == {}
+            # Repetida: não entrega de novo
+            assert not follower.receive(_numbered(1, 2, [2, term, 2, 0]), relay=False)
+            assert nodes[0].multicast.duplicates['message'] == 1
+        finally:
+            await _stop(nodes)
+
+    asyncio.run(run())
+
+
+def test_new_sequencer_renumbers_above_the_base_without_gaps():
+    async def run():
+        nodes = await _cluster(5740)
+        try:
+            for i in range(3):
+                await nodes[0].multicast.send_message(f's{i}', 'sequencer')
+            await _until_delivered(nodes, 3)
+            old_term = nodes[2].multicast.sequencer.term
+
+            # O antigo numerou 5 e 6, mas só o processo 1 as recebeu (e a 4 se perdeu)
+            for gseq in (5, 6):
+                nodes[1].multicast.sequencer.receive(
+                    _numbered(2, 100 + gseq, [2, old_term, gseq, 3]), relay=False)
+            assert nodes[1].multicast.sequencer.delivered == 3
+
+            await _hand_over(nodes, 1)
+            new = nodes[1].multicast.sequencer
+            assert new.term > old_term and new.base == 3
+            await _until_delivered(nodes, 5)
+            orders = [_delivered(node) for node in nodes]
+            assert orders[0] == orders[1] == orders[2]
+            # Continuam em base + 1, na ordem antiga
+            assert orders[0][3:] == [(4, 'msg-2-105'), (5, 'msg-2-106')]
+            assert new.renumbered == 2 and new.next_gseq == 6
+
+            # E a numeração segue no novo mandato
+            await nodes[2].multicast.send_message('depois', 'sequencer')
+            await _until_delivered(nodes, 6)
+            assert _delivered(nodes[0])[5][0] == 6
+            assert nodes[0].multicast.history.page(None, 10)[0][-1][1].sequence[:2] == [1, new.term]
+        finally:
+            await _stop(nodes)
+
+    asyncio.run(run())
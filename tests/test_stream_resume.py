@@ -0,0 +1,113 @@
+"""
+Retomada de /multicast/stream com histórico misto ('total' e 'causal')
+As entregas causais não seguem a ordem (timestamp, processId), então o id
+do evento precisa ser a sequência de entrega para a retomada não pular nem
+repetir mensagens; e essa sequência só vale no processo que a emitiu.
+"""
+import asyncio
+import json
+from starlette.requests import Request
+from src.app import stream_deliveries
+from src.cluster import create_cluster
+from src.config import NodeConfig
+from src.stream import event_id, parse_position
+
+
+def _synced(seq, timestamp, order, vclock=None):
+    """Mensagem do processo 1 no formato de /sync/pull, já com o ACK dos dois processos"""
+    data = {'message_id': f'1-{seq}', 'id_processo': 1, 'timestamp': timestamp,
+            'conteudo': f'm{seq}', 'seq': seq, 'order': order, 'acks': 0b11}
+    if vclock is not None:
+        data['vclock'] = vclock
+    return data
+
+
+async def _resume_after_mixed_history():
+    base = NodeConfig(total_processes=2, failure_detector=False, sync_interval_ms=0,
+                      loop_monitor=False)
+    node = create_cluster(base, base_port=5900)[0].state.node
+    multicast = node.multicast
+    try:
+        # Timestamps fora de ordem na sequência de entrega: 10, 3, 12, 5
+        multicast.receive_synced([_synced(1, 10, 'total')])
+        multicast.receive_synced([_synced(2, 3, 'causal', [0, 0])])
+        multicast.receive_synced([_synced(3, 12, 'total')])
+        multicast.receive_synced([_synced(4, 5, 'causal', [0, 2])])
+        items, _ = multicast.history.page(None, 10)
+        assert [(seq, msg.id) for seq, msg in items] == [
+            (0, '1-1'), (1, '1-2'), (2, '1-3'), (3, '1-4')]
+
+        # O cliente viu até o segundo evento e reconecta com Last-Event-ID
+        last_id = event_id(0, items[1][0])
+        assert last_id == '0:1'
+        sub, backlog = multicast.subscribe(parse_position(last_id)[1])
+        assert [msg.id for _, msg in backlog] == ['1-3', '1-4']
+        multicast.stream.unsubscribe(sub)
+
+        # Já em dia: nada a repetir; e sem `since`, só as entregas novas
+        sub, backlog = multicast.subscribe(parse_position(event_id(0, 3))[1])
+        assert backlog == []
+        multicast.stream.unsubscribe(sub)
+        sub, backlog = multicast.subscribe(None)
+        assert backlog == []
+        multicast.stream.unsubscribe(sub)
+    finally:
+        await node.stop()
+
+
+def test_resume_after_mixed_causal_total_history():
+    asyncio.run(_resume_after_mixed_history())
+
+
+async def _stream_events(app, last_event_id, count):
+    """Primeiros `count` eventos SSE de /multicast/stream com o Last-Event-ID dado"""
+    request = Request({'type': 'http', 'method': 'GET', 'path': '/multicast/stream',
+                       'headers': [(b'last-event-id', last_event_id.encode())], 'app': app})
+    response = await stream_deliveries(request, None, app.state.core, app.state.config)
+    events = []
+    try:
+        async for chunk in response.body_iterator:
+            fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+            events.append((fields.get('event'), fields.get('id'), json.loads(fields['data'])))
+            if len(events) == count:
+                return events
+    finally:
+        await response.body_iterator.aclose()
+
+
+async def _resume_on_another_node():
+    base = NodeConfig(total_processes=2, failure_detector=False, sync_interval_ms=0,
+                      loop_monitor=False)
+    apps = create_cluster(base, base_port=5910)
+    try:
+        for app in apps.values():
+            for seq in (1, 2, 3):
+                app.state.node.multicast.receive_synced([_synced(seq, seq, 'total')])
+        # Mesmo processo: retoma depois da sequência
+        events = await _stream_events(apps[0], '0:0', 2)
+        assert [(kind, event) for kind, event, _ in events] == [('message', '0:1'), ('message', '0:2')]
+        # Id emitido pelo processo 1: recomeça do início, avisando com "reset"
+        events = await _stream_events(apps[0], '1:1', 4)
+        assert events[0] == ('reset', None, {'processId': 0, 'lastEventId': '1:1'})
+        assert [data['id'] for _, _, data in events[1:]] == ['1-1', '1-2', '1-3']
+        assert [event for _, event, _ in events[1:]] == ['0:0', '0:1', '0:2']
+    finally:
+        for app in apps.values():
+            await app.state.node.stop()
+
+
+def test_id_from_another_node_restarts_the_stream():
+    asyncio.run(_resume_on_another_node())
+
+
+def test_parse_position_rejects_invalid_ids():
+    assert parse_position(None) is None
+    assert parse_position('') is None
+    assert parse_position('7') == (None, 7)
+    assert parse_position('2:7') == (2, 7)
+    for value in ('12-1', '-1', '1:-1', '-1:2', 'abc', '1:'):
+        try:
+            parse_position(value)
+        except ValueError:
+            continue
+        raise AssertionError(f"{value!r} deveria ser recusado")
@@ -0,0 +1,77 @@
+"""
+Anti-entropia: uma mensagem só é abandonada quando nenhum peer a retém
+Um peer que já a descartou do histórico limitado não basta: outro ainda
+pode tê-la, e ela precisa ser recuperada dele.
+"""
+import asyncio
+from src.cluster import create_cluster
+from src.config import NodeConfig
+from src.store import DeliveredLog
+
+
+def _causal(seq, vclock):
+    """Mensagem 'causal' do processo 3 no formato de /sync/pull"""
+    return {'message_id': f'3-{seq}', 'id_processo': 3, 'timestamp': seq, 'conteudo': f'm{seq}',
+            'seq': seq, 'order': 'causal', 'vclock': vclock, 'acks': 0}
+
+
+def _cluster():
+    base = NodeConfig(total_processes=4, failure_detector=False, sync_interval_ms=0,
+                      loop_monitor=False)
+    return [app.state.node for app in create_cluster(base, base_port=5800).values()]
+
+
+async def _stop(nodes):
+    for node in nodes:
+        await node.stop()
+
+
+async def _recovered_from_peer_that_retains():
+    nodes = _cluster()
+    me, evicted, holder = nodes[0], nodes[1], nodes[2]
+    try:
+        # O peer 1 viu as duas mensagens do processo 3, mas só retém a última
+        evicted.multicast.history = DeliveredLog(1)
+        for node in (evicted, holder):
+            node.multicast.receive_synced([_causal(1, [0, 0, 0, 0]), _causal(2, [0, 0, 0, 1])])
+        assert evicted.multicast.history.page(None, 10)[0][0][1].id == '3-2'
+
+        await me.anti_entropy.sync_with(1)
+        multicast = me.multicast
+        assert (3, 1) not in multicast.seen
+        assert multicast.skipped == {}
+        # A 2 depende da 1: continua esperando em vez de ser liberada
+        assert multicast.vector[3] == 0 and len(multicast.causal_pending) == 1
+
+        await me.anti_entropy.sync_with(2)
+        assert [msg.id for _, msg in multicast.history.page(None, 10)[0]] == ['3-1', '3-2']
+        assert multicast.skipped == {} and multicast.vector[3] == 2
+    finally:
+        await _stop(nodes)
+
+
+async def _skipped_once_sender_confirms():
+    nodes = _cluster()
+    me, sender = nodes[0], nodes[3]
+    try:
+        # O remetente reteve só a 2; quem vê a 1 é o peer 1, que também a descartou
+        sender.multicast.history = DeliveredLog(1)
+        nodes[1].multicast.history = DeliveredLog(1)
+        for node in (sender, nodes[1]):
+            node.multicast.receive_synced([_causal(1, [0, 0, 0, 0]), _causal(2, [0, 0, 0, 1])])
+
+        await me.anti_entropy.sync_with(1)
+        assert me.multicast.skipped == {}
+        await me.anti_entropy.sync_with(3)
+        assert me.multicast.skipped == {3: 1}
+        assert [msg.id for _, msg in me.multicast.history.page(None, 10)[0]] == ['3-2']
+    finally:
+        await _stop(nodes)
+
+
+def test_message_evicted_by_one_peer_is_recovered_from_another():
+    asyncio.run(_recovered_from_peer_that_retains())
+
+
+def test_message_skipped_once_sender_confirms_it_is_gone():
+    asyncio.run(_skipped_once_sender_confirms())
@@ -0,0 +1,187 @@
+"""
+WAL do multicast: formato dos registros, recuperação e falhas de gravação
+Com o disco falhando os envios recebem 503, e o buffer não cresce sem limite.
+"""
+import asyncio
+import os
+import httpx
+import pytest
+from src.cluster import create_cluster
+from src.config import NodeConfig
+from src.wal import (REC_ACK, REC_CAUSAL, REC_DELIVER, REC_EARLY_ACK, REC_HISTORY, REC_MESSAGE,
+                     REC_PENDING, REC_SEEN, REC_SEQUENCER, REC_STATE, REC_VECTOR, WALError,
+                     WriteAheadLog, encode_record, read_records)
+
+RECORDS = [
+    (REC_MESSAGE, 7, 1, 5, 3, 'msg-1-5', 'olá'),
+    (REC_ACK, 8, 2, 'msg-1-5'),
+    (REC_DELIVER, 9, 'msg-1-5'),
+    (REC_CAUSAL, 10, 2, 6, 4, 1, [0, 1, 3], 'msg-2-6', 'causal'),
+    (REC_SEQUENCER, 3, 1, 2, 40, 42),
+    (REC_STATE, 11, 12, 13),
+    (REC_HISTORY, 0, 1, 5, 3, 'msg-1-5', 'olá', (1 << 70) | 1),
+    (REC_PENDING, 2, 6, 4, 'msg-2-6', '', 0b101),
+    (REC_EARLY_ACK, 'msg-3-1', 0b10),
+    (REC_SEEN, 1, 10, [12, 15]),
+    (REC_VECTOR, [3, 0, 9]),
+]
+
+
+def _failing_fsync(monkeypatch):
+    def fsync(fd):
+        raise OSError(28, 'No space left on device')
+    monkeypatch.setattr('src.wal.os.fsync', fsync)
+
+
+async def _recovered(wal):
+    """Espera o WAL gravar o buffer depois que o disco volta (um grupo pode ter falhado em voo)"""
+    for _ in range(3):
+        try:
+            await wal.sync()
+            return
+        except WALError:
+            pass
+    await wal.sync()
+
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_records_round_trip(tmp_path):
+    path = str(tmp_path / 'wal.log')
+    data = b''.join(encode_record(r) for r in RECORDS)
+    _write(path, data)
+    assert read_records(path) == (RECORDS, len(data))
+
+
+def test_torn_tail_is_dropped_on_read_and_truncated_on_recover(tmp_path):
+    whole = b''.join(encode_record(r) for r in RECORDS[:3])
+    torn = encode_record(RECORDS[3])
+    path = str(tmp_path / f'wal-{0:020d}.log')
+    _write(path, whole + torn[:-2])
+    assert read_records(path) == (RECORDS[:3], len(whole))
+    # CRC errado também encerra a leitura
+    corrupt = bytearray(whole + torn)
+    corrupt[-1] ^= 0xff
+    _write(path, bytes(corrupt))
+    assert read_records(path) == (RECORDS[:3], len(whole))
+
+    async def run():
+        wal = WriteAheadLog(str(tmp_path), fsync=False, commit_interval=0.001)
+        assert list(wal.recover()) == RECORDS[:3]
+        assert wal.next_lsn == 3 and os.path.getsize(path) == len(whole)
+        # Os novos registros continuam logo depois do último inteiro
+        wal.append(RECORDS[4])
+        await wal.close()
+        assert read_records(path) == (RECORDS[:3] + [RECORDS[4]], len(whole) + len(encode_record(RECORDS[4])))
+
+    asyncio.run(run())
+
+
+def test_recover_from_snapshot_and_segments(tmp_path):
+    state = [(REC_STATE, 100, 2, 5), (REC_VECTOR, [1, 2])]
+
+    async def run():
+        # Segmento novo a cada grupo; snapshot a partir de 4 registros
+        wal = WriteAheadLog(str(tmp_path), snapshot_source=lambda: state, fsync=False,
+                            commit_interval=0.001, snapshot_every=4, segment_bytes=1)
+        list(wal.recover())
+        for group in (RECORDS[:2], RECORDS[2:5], RECORDS[5:6], RECORDS[6:7]):
+            for record in group:
+                wal.append(record)
+            await wal.sync()
+        await wal.close()
+
+    asyncio.run(run())
+    names = sorted(os.listdir(tmp_path))
+    # O snapshot no LSN 5 substitui os segmentos anteriores
+    assert names == [f'snapshot-{5:020d}.bin', f'wal-{5:020d}.log', f'wal-{6:020d}.log',
+                     f'wal-{7:020d}.log']
+    wal = WriteAheadLog(str(tmp_path), fsync=False)
+    assert list(wal.recover()) == state + RECORDS[5:7]
+    assert wal.next_lsn == 7
+
+
+def test_send_gets_503_while_writes_fail(tmp_path, monkeypatch):
+    async def run():
+        base = NodeConfig(total_processes=2, failure_detector=False, sync_interval_ms=0,
+                          loop_monitor=False, wal_dir=str(tmp_path))
+        apps = create_cluster(base, base_port=5870)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=apps[0]), base_url='http://node0')
+        try:
+            _failing_fsync(monkeypatch)
+            response = await client.post('/multicast/send', json={'content': 'a'})
+            assert response.status_code == 503
+            assert 'No space left' in response.json()['detail']
+            monkeypatch.undo()
+            # Com o disco de volta, o que ficou no buffer é gravado e os envios são confirmados
+            await _recovered(apps[0].state.node.wal)
+            response = await client.post('/multicast/send', json={'content': 'b'})
+            assert response.status_code == 200
+            assert apps[0].state.node.wal.buffered == 0
+        finally:
+            await client.aclose()
+            monkeypatch.undo()
+            for app in apps.values():
+                await _recovered(app.state.node.wal)
+                await app.state.node.stop()
+
+    asyncio.run(run())
+
+
+def test_append_refused_once_buffer_reaches_cap(tmp_path, monkeypatch):
+    async def run():
+        wal = WriteAheadLog(str(tmp_path), commit_interval=0.001, max_buffer_bytes=200)
+        list(wal.recover())
+        _failing_fsync(monkeypatch)
+        while wal.buffered < 200:
+            wal.admit()
+            wal.append((REC_DELIVER, 1, 'm' * 20))
+        with pytest.raises(WALError):
+            await wal.sync()
+        with pytest.raises(WALError):
+            wal.admit()
+
+        # O disco volta: o buffer é gravado e as operações voltam a ser admitidas
+        monkeypatch.undo()
+        await _recovered(wal)
+        assert wal.buffered == 0
+        wal.admit()
+        await wal.close()
+
+    asyncio.run(run())
+
+
+def test_send_and_peer_batch_get_503_with_buffer_full(tmp_path, monkeypatch):
+    async def run():
+        base = NodeConfig(total_processes=2, failure_detector=False, sync_interval_ms=0,
+                          loop_monitor=False, wal_dir=str(tmp_path), wal_max_buffer_bytes=1)
+        apps = create_cluster(base, base_port=5860)
+        node = apps[0].state.node
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=apps[0]), base_url='http://node0')
+        try:
+            _failing_fsync(monkeypatch)
+            response = await client.post('/multicast/send', json={'content': 'a'})
+            assert response.status_code == 503
+            # O primeiro envio foi aceito no buffer (e não confirmado); os seguintes nem entram
+            seq = node.multicast.send_seq
+            response = await client.post('/multicast/send', json={'content': 'b'})
+            assert response.status_code == 503 and node.multicast.send_seq == seq
+
+            message = {'message_id': 'msg-1-1', 'id_processo': 1, 'timestamp': 1,
+                       'conteudo': 'x', 'seq': 1}
+            response = await client.post('/msg/batch', json={'messages': [message]},
+                                         headers={'X-Multicast-Link': '1:1:0:0'})
+            assert response.status_code == 503
+            assert 'msg-1-1' not in node.multicast.pending
+            assert node.metrics.wal_rejected.labels().value >= 2
+        finally:
+            await client.aclose()
+            monkeypatch.undo()
+            for app in apps.values():
+                await _recovered(app.state.node.wal)
+                await app.state.node.stop()
+
+    asyncio.run(run())
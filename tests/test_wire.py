@@ -0,0 +1,62 @@
+"""
+Formato binário dos lotes entre processos (src/wire.py)
+"""
+import struct
+import pytest
+from src import wire
+
+MESSAGES = [
+    {'id_processo': 1, 'timestamp': 5, 'conteudo': 'olá', 'message_id': 'msg-1-5', 'seq': 3},
+    {'id_processo': 2, 'timestamp': 2 ** 40, 'conteudo': '', 'message_id': 'msg-2-x', 'seq': 1,
+     'order': 'causal', 'vclock': [0, 4, 1]},
+    {'id_processo': 0, 'timestamp': 9, 'conteudo': 'f', 'message_id': 'msg-0-9', 'seq': 2,
+     'order': 'fifo', 'vclock': []},
+    {'id_processo': 3, 'timestamp': 11, 'conteudo': 's', 'message_id': 'msg-3-11', 'seq': 7,
+     'order': 'sequencer', 'sequence': [1, 2, 40, 38]},
+    # 'sequencer' ainda sem número
+    {'id_processo': 3, 'timestamp': 12, 'conteudo': 's2', 'message_id': 'msg-3-12', 'seq': 8,
+     'order': 'sequencer'},
+]
+
+ACKS = [
+    {'message_id': 'msg-1-5', 'process_id': 2, 'timestamp': 6},
+    {'message_id': 'msg-1-5', 'process_id': 0, 'timestamp': 7, 'acks': 0b101},
+]
+
+
+def test_messages_round_trip():
+    assert wire.decode_messages(wire.encode_messages(MESSAGES)) == MESSAGES
+
+
+def test_acks_round_trip():
+    assert wire.decode_acks(wire.encode_acks(ACKS)) == ACKS
+
+
+@pytest.mark.parametrize('processes', [9, 16, 70, 300])
+def test_acks_mask_survives_more_than_eight_processes(processes):
+    mask = (1 << (processes - 1)) | (1 << 8) | 1
+    ack = {'message_id': 'msg-1-1', 'process_id': processes - 1, 'timestamp': 1, 'acks': mask}
+    assert wire.decode_acks(wire.encode_acks([ack])) == [ack]
+
+
+@pytest.mark.parametrize('version', [wire.VERSION - 1, wire.VERSION + 1])
+def test_other_versions_are_rejected(version):
+    for encoded, decode in ((wire.encode_messages(MESSAGES), wire.decode_messages),
+                            (wire.encode_acks(ACKS), wire.decode_acks)):
+        frame = encoded[:2] + struct.pack('!B', version) + encoded[3:]
+        with pytest.raises(wire.WireError):
+            decode(frame)
+
+
+def test_invalid_frames_are_rejected():
+    messages, acks = wire.encode_messages(MESSAGES), wire.encode_acks(ACKS)
+    with pytest.raises(wire.WireError):
+        wire.decode_messages(acks)
+    with pytest.raises(wire.WireError):
+        wire.decode_messages(b'XX' + messages[2:])
+    with pytest.raises(wire.WireError):
+        wire.decode_messages(messages[:-1])
+    with pytest.raises(wire.WireError):
+        wire.decode_acks(acks + b'\0')
+    with pytest.raises(wire.WireError):
+        wire.decode_acks(acks[:3])